@@ -23,6 +23,7 @@ import warnings
 from buildbot import interfaces
 from buildbot import locks
 from buildbot import util
+from buildbot.db import logs as dblogs
 from buildbot.revlinks import default_revlink_matcher
 from buildbot.util import config as util_config
 from buildbot.util import safeTranslate
@@ -278,8 +279,12 @@ class MasterConfig(util.ComparableMixin):
 
         if 'logCompressionMethod' in config_dict:
             logCompressionMethod = config_dict.get('logCompressionMethod')
-            if logCompressionMethod not in ('bz2', 'gz'):
-                error("c['logCompressionMethod'] must be 'bz2' or 'gz'")
+            if logCompressionMethod not in ('raw', 'bz2', 'gz', 'lz4'):
+                error("c['logCompressionMethod'] must be 'raw', 'bz2', 'gz' "
+                      "or 'lz4'")
+            elif logCompressionMethod == 'lz4' and not dblogs.lz4:
+                error("c['logCompressionMethod'] is 'lz4', but the lz4 "
+                      "module is not installed")
             self.logCompressionMethod = logCompressionMethod
 
         copy_int_param('logMaxSize')
@@ -374,7 +379,8 @@ class MasterConfig(util.ComparableMixin):
     def load_db(self, filename, config_dict):
         if 'db' in config_dict:
             db = config_dict['db']
-            if set(db.keys()) - set(['db_url', 'db_poll_interval']):
+            if set(db.keys()) - set(['db_url', 'db_poll_interval',
+                                     'log_storage', 'log_dir']):
                 error("unrecognized keys in c['db']")
             self.db.update(db)
         if 'db_url' in config_dict:
@@ -390,8 +396,14 @@ class MasterConfig(util.ComparableMixin):
             warnDeprecated("0.8.7", "db_poll_interval is deprecated and will be ignored")
             del self.db['db_poll_interval']
 
+        if self.db.get('log_storage', 'db') not in ('db', 'files'):
+            error("c['db']['log_storage'] must be 'db' or 'files'")
+        if not isinstance(self.db.get('log_dir', ''), basestring):
+            error("c['db']['log_dir'] must be a string")
+
     def load_mq(self, filename, config_dict):
-        from buildbot.mq import connector  # avoid circular imports
+        from buildbot.mq import base  # avoid circular imports
+        from buildbot.mq import connector
         if 'mq' in config_dict:
             self.mq.update(config_dict['mq'])
 
@@ -407,6 +419,18 @@ class MasterConfig(util.ComparableMixin):
             error("unrecognized keys in c['mq']: %s"
                   % (', '.join(unk),))
 
+        queue_size = self.mq.get('queue_size', 0)
+        if not isinstance(queue_size, (int, long)) or queue_size < 0:
+            error("c['mq']['queue_size'] must be an integer of at least 0")
+        if self.mq.get('overflow', 'block') not in base.OVERFLOW_POLICIES:
+            error("c['mq']['overflow'] must be one of %s"
+                  % (', '.join(base.OVERFLOW_POLICIES),))
+
+        if typ == 'network' and not isinstance(self.mq.get('broker'),
+                                               basestring):
+            error("c['mq']['broker'] must be the endpoint of an MQ broker, "
+                  "e.g., 'tcp:host=localhost:port=9990'")
+
     def load_metrics(self, filename, config_dict):
         # we don't try to validate metrics keys
         if 'metrics' in config_dict:
@@ -569,12 +593,27 @@ class MasterConfig(util.ComparableMixin):
         www_cfg = config_dict['www']
         allowed = set(['port', 'url', 'debug', 'json_cache_seconds',
                        'rest_minimum_version', 'allowed_origins', 'jsonp',
-                       'plugins', 'auth', 'avatar_methods'])
+                       'plugins', 'auth', 'avatar_methods',
+                       'compression_threshold', 'compression_level',
+                       'event_coalesce_interval'])
         unknown = set(www_cfg.iterkeys()) - allowed
         if unknown:
             error("unknown www configuration parameter(s) %s" %
                   (', '.join(unknown),))
 
+        threshold = www_cfg.get('compression_threshold')
+        if threshold is not None and (not isinstance(threshold, int)
+                                      or threshold < 0):
+            error("www compression_threshold must be None or an integer "
+                  "of at least 0")
+        level = www_cfg.get('compression_level', 6)
+        if not isinstance(level, int) or not 1 <= level <= 9:
+            error("www compression_level must be an integer from 1 to 9")
+        interval = www_cfg.get('event_coalesce_interval', 0)
+        if not isinstance(interval, (int, float)) or interval < 0:
+            error("www event_coalesce_interval must be a number of seconds "
+                  "of at least 0")
+
         self.www.update(www_cfg)
 
         # invent an appropriate URL given the port
@@ -28,6 +28,9 @@ class ResourceType(object):
     keyFields = []
     eventPathPatterns = ""
     entityType = None
+    # set this if every change to the resource type's data produces an event
+    # for its eventPathPatterns, so that results can be cached until then
+    cacheable = False
 
     def __init__(self, master):
         self.master = master
@@ -73,6 +76,12 @@ class Endpoint(object):
     pathPatterns = ""
     rootLinkName = None
     isCollection = False
+    isRaw = False
+    # for collections, set this to a field which is unique within the
+    # collection and has a column in fieldMapping, so that getStream can fetch
+    # the collection a batch at a time
+    streamKeyField = None
+    streamBatchSize = 500
 
     def __init__(self, rtype, master):
         self.rtype = rtype
@@ -84,6 +93,30 @@ class Endpoint(object):
     def control(self, action, args, kwargs):
         raise exceptions.InvalidControlException
 
+    def getStream(self, resultSpec, kwargs):
+        """
+        Return a L{StreamedResult} producing the collection for this result
+        spec a batch at a time, or None if that is not possible, in which case
+        the caller should use L{get}.
+        """
+        if (self.streamKeyField is None
+                or not resultSpec.canStream(self.fieldMapping)):
+            return None
+
+        def getBatch(batchSpec):
+            d = defer.maybeDeferred(self.get, batchSpec, kwargs)
+            d.addCallback(batchSpec.apply)
+            return d
+        return resultSpec.stream(getBatch, self.streamKeyField,
+                                 self.streamBatchSize)
+
+    def isImmutable(self, data, kwargs):
+        # return (via Deferred) true if data, the result of get() for these
+        # kwargs, can never change; clients may then cache it indefinitely.
+        # Implementations which learn this while fetching the result should
+        # set its 'immutable' attribute, and check it here first.
+        return defer.succeed(False)
+
     def startConsuming(self, callback, options, kwargs):
         raise NotImplementedError
 
@@ -109,10 +142,32 @@ class BuildNestingMixin(object):
                 return
             defer.returnValue(build['id'])
 
+    @defer.inlineCallbacks
+    def getBuild(self, kwargs):
+        # as getBuildid, but the build's dictionary, or None
+        if 'buildid' in kwargs:
+            build = yield self.master.db.builds.getBuild(kwargs['buildid'])
+        else:
+            build = yield self.master.db.builds.getBuildByNumber(
+                builderid=kwargs['builderid'],
+                number=kwargs['build_number'])
+        defer.returnValue(build)
+
     @defer.inlineCallbacks
     def getStepid(self, kwargs):
         if 'stepid' in kwargs:
             defer.returnValue(kwargs['stepid'])
+        else:
+            dbdict = yield self.getStep(kwargs)
+            if not dbdict:
+                return
+            defer.returnValue(dbdict['id'])
+
+    @defer.inlineCallbacks
+    def getStep(self, kwargs):
+        # as getStepid, but the step's dictionary, or None
+        if 'stepid' in kwargs:
+            dbdict = yield self.master.db.steps.getStep(kwargs['stepid'])
         else:
             buildid = yield self.getBuildid(kwargs)
             if buildid is None:
@@ -121,14 +176,23 @@ class BuildNestingMixin(object):
             dbdict = yield self.master.db.steps.getStep(buildid=buildid,
                                                         number=kwargs.get('step_number'),
                                                         name=kwargs.get('step_name'))
-            if not dbdict:
-                return
-            defer.returnValue(dbdict['id'])
+        defer.returnValue(dbdict)
+
+
+class ItemResult(dict):
+
+    # if set, this is whether the item can never change, as the
+    # implementation found when fetching it
+    immutable = None
+
+    def __init__(self, values=(), immutable=None):
+        dict.__init__(self, values)
+        self.immutable = immutable
 
 
 class ListResult(UserList.UserList):
 
-    __slots__ = ['offset', 'total', 'limit']
+    __slots__ = ['offset', 'total', 'limit', 'aggregates', 'immutable']
 
     # if set, this is the index in the overall results of the first element of
     # this list
@@ -140,12 +204,23 @@ class ListResult(UserList.UserList):
     # if set, this is the limit, either from the user or the implementation
     limit = None
 
+    # if set, these are the aggregate rows requested by the result spec,
+    # computed by the implementation in place of the results
+    aggregates = None
+
+    # if set, this is whether the collection can never change, as the
+    # implementation found when fetching it
+    immutable = None
+
     def __init__(self, values,
-                 offset=None, total=None, limit=None):
+                 offset=None, total=None, limit=None, aggregates=None,
+                 immutable=None):
         UserList.UserList.__init__(self, values)
         self.offset = offset
         self.total = total
         self.limit = limit
+        self.aggregates = aggregates
+        self.immutable = immutable
 
     def __repr__(self):
         return "ListResult(%r, offset=%r, total=%r, limit=%r)" % \
@@ -166,6 +241,19 @@ class ListResult(UserList.UserList):
         return not (self == other)
 
 
+class StreamedResult(object):
+
+    """
+    A collection which is produced a batch at a time, for collections too
+    large to hold in memory at once.  Each call to C{nextBatch} returns a
+    Deferred firing with a list of items, or with an empty list once all of
+    the items have been produced.
+    """
+
+    def __init__(self, nextBatch):
+        self.nextBatch = nextBatch
+
+
 def updateMethod(func):
     """Decorate this resourceType instance as an update method, made available
     at master.data.updates.$funcname"""
@@ -77,6 +77,23 @@ class BuildRequestsEndpoint(Db2DataMixin, base.Endpoint):
         /builders/n:builderid/buildrequests
     """
     rootLinkName = 'buildrequests'
+    streamKeyField = 'buildrequestid'
+    fieldMapping = {
+        'buildrequestid': 'buildrequests.id',
+        'buildsetid': 'buildrequests.buildsetid',
+        'buildername': 'buildrequests.buildername',
+        'priority': 'buildrequests.priority',
+        'results': 'buildrequests.results',
+        'submitted_at': 'buildrequests.submitted_at',
+        'complete_at': 'buildrequests.complete_at',
+        'waited_for': 'buildrequests.waited_for',
+        'claimed_at': 'buildrequest_claims.claimed_at',
+        'builderid': ('buildrequests.buildername',),
+        'claimed': ('buildrequest_claims.claimed_at',),
+        'claimed_by_masterid': ('buildrequest_claims.claimed_at',
+                                'buildrequest_claims.masterid'),
+        'complete': ('buildrequests.complete',),
+    }
 
     @defer.inlineCallbacks
     def get(self, resultSpec, kwargs):
@@ -105,21 +122,29 @@ class BuildRequestsEndpoint(Db2DataMixin, base.Endpoint):
             claimed = resultSpec.popBooleanFilter('claimed')
 
         bsid = resultSpec.popOneFilter('buildsetid', 'eq')
+        resultSpec.fieldMapping = self.fieldMapping
         buildrequests = yield self.master.db.buildrequests.getBuildRequests(
             buildername=buildername,
             complete=complete,
             claimed=claimed,
-            bsid=bsid)
+            bsid=bsid,
+            resultSpec=resultSpec)
         if buildrequests:
+            # looking up the builderid is a query per buildrequest, so skip it
+            # if it is not wanted
+            withBuilderid = resultSpec.includesField('builderid')
 
             @defer.inlineCallbacks
             def appendBuilderid(br):
-                buildername = br['buildername']
-                br['builderid'] = yield self.master.db.builders.findBuilderId(buildername)
+                br['builderid'] = None
+                if withBuilderid:
+                    buildername = br['buildername']
+                    br['builderid'] = yield self.master.db.builders.findBuilderId(buildername)
                 defer.returnValue(br)
-            buildrequests = [(yield appendBuilderid(br)) for br in buildrequests]
-        defer.returnValue(
-            [(yield self.db2data(br)) for br in buildrequests])
+            buildrequests[:] = [(yield appendBuilderid(br)) for br in buildrequests]
+        # replace the contents, keeping any pagination information
+        buildrequests[:] = [(yield self.db2data(br)) for br in buildrequests]
+        defer.returnValue(buildrequests)
 
     def startConsuming(self, callback, options, kwargs):
         return self.master.mq.startConsuming(callback,
@@ -56,6 +56,9 @@ class BuildEndpoint(Db2DataMixin, base.Endpoint):
         defer.returnValue((yield self.db2data(dbdict))
                           if dbdict else None)
 
+    def isImmutable(self, data, kwargs):
+        return defer.succeed(bool(data.get('complete')))
+
     def startConsuming(self, callback, options, kwargs):
         builderid = kwargs.get('builderid')
         number = kwargs.get('number')
@@ -77,14 +80,31 @@ class BuildsEndpoint(Db2DataMixin, base.Endpoint):
         /buildrequests/n:buildrequestid/builds
     """
     rootLinkName = 'builds'
+    streamKeyField = 'buildid'
+    fieldMapping = {
+        'buildid': 'builds.id',
+        'number': 'builds.number',
+        'builderid': 'builds.builderid',
+        'buildrequestid': 'builds.buildrequestid',
+        'buildslaveid': 'builds.buildslaveid',
+        'masterid': 'builds.masterid',
+        'started_at': 'builds.started_at',
+        'complete_at': 'builds.complete_at',
+        'results': 'builds.results',
+        'complete': ('builds.complete_at',),
+        'state_strings': ('builds.state_strings_json',),
+    }
 
     @defer.inlineCallbacks
     def get(self, resultSpec, kwargs):
+        resultSpec.fieldMapping = self.fieldMapping
         builds = yield self.master.db.builds.getBuilds(
             builderid=kwargs.get('builderid'),
-            buildrequestid=kwargs.get('buildrequestid'))
-        defer.returnValue(
-            [(yield self.db2data(dbdict)) for dbdict in builds])
+            buildrequestid=kwargs.get('buildrequestid'),
+            resultSpec=resultSpec)
+        # replace the contents, keeping any pagination information
+        builds[:] = [(yield self.db2data(dbdict)) for dbdict in builds]
+        defer.returnValue(builds)
 
     def startConsuming(self, callback, options, kwargs):
         builderid = kwargs.get('builderid')
@@ -112,6 +132,7 @@ class Build(base.ResourceType):
         /builders/:builderid/builds/:number
         /builds/:buildid
     """
+    cacheable = True
 
     class EntityType(types.Entity):
         buildid = types.Integer()
@@ -81,10 +81,25 @@ class BuildsetsEndpoint(Db2DataMixin, base.Endpoint):
         /buildsets
     """
     rootLinkName = 'buildset'
+    streamKeyField = 'bsid'
+    fieldMapping = {
+        'bsid': 'buildsets.id',
+        'external_idstring': 'buildsets.external_idstring',
+        'reason': 'buildsets.reason',
+        'submitted_at': 'buildsets.submitted_at',
+        'complete': 'buildsets.complete',
+        'complete_at': 'buildsets.complete_at',
+        'results': 'buildsets.results',
+        'parent_buildid': 'buildsets.parent_buildid',
+        'parent_relationship': 'buildsets.parent_relationship',
+        'sourcestamps': ('buildsets.id',),
+    }
 
     def get(self, resultSpec, kwargs):
         complete = resultSpec.popBooleanFilter('complete')
-        d = self.master.db.buildsets.getBuildsets(complete=complete)
+        resultSpec.fieldMapping = self.fieldMapping
+        d = self.master.db.buildsets.getBuildsets(complete=complete,
+                                                  resultSpec=resultSpec)
 
         @d.addCallback
         def db2data(buildsets):
@@ -93,7 +108,9 @@ class BuildsetsEndpoint(Db2DataMixin, base.Endpoint):
 
             @d.addCallback
             def getResults(res):
-                return [r[1] for r in res]
+                # replace the contents, keeping any pagination information
+                buildsets[:] = [r[1] for r in res]
+                return buildsets
             return d
         return d
 
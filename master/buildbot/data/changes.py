@@ -30,14 +30,16 @@ from twisted.python import log
 class FixerMixin(object):
 
     @defer.inlineCallbacks
-    def _fixChange(self, change):
+    def _fixChange(self, change, withSourcestamp=True):
         # TODO: make these mods in the DB API
         if change:
             change = change.copy()
             change['when_timestamp'] = datetime2epoch(change['when_timestamp'])
 
-            sskey = ('sourcestamps', str(change['sourcestampid']))
-            change['sourcestamp'] = yield self.master.data.get(sskey)
+            change['sourcestamp'] = None
+            if withSourcestamp:
+                sskey = ('sourcestamps', str(change['sourcestampid']))
+                change['sourcestamp'] = yield self.master.data.get(sskey)
             del change['sourcestampid']
         defer.returnValue(change)
 
@@ -62,11 +64,32 @@ class ChangesEndpoint(FixerMixin, base.Endpoint):
         /changes
     """
     rootLinkName = 'change'
+    streamKeyField = 'changeid'
+    fieldMapping = {
+        'changeid': 'changes.changeid',
+        'author': 'changes.author',
+        'comments': 'changes.comments',
+        'revision': 'changes.revision',
+        'when_timestamp': 'changes.when_timestamp',
+        'branch': 'changes.branch',
+        'category': 'changes.category',
+        'revlink': 'changes.revlink',
+        'repository': 'changes.repository',
+        'codebase': 'changes.codebase',
+        'project': 'changes.project',
+    }
 
     @defer.inlineCallbacks
     def get(self, resultSpec, kwargs):
-        changes = yield self.master.db.changes.getChanges()
-        changes = [(yield self._fixChange(ch)) for ch in changes]
+        resultSpec.fieldMapping = self.fieldMapping
+        changes = yield self.master.db.changes.getChanges(
+            resultSpec=resultSpec)
+        # fetching the sourcestamp is a query per change, so skip it if it
+        # is not wanted
+        withSourcestamp = resultSpec.includesField('sourcestamp')
+        # replace the contents, keeping any pagination information
+        changes[:] = [(yield self._fixChange(ch, withSourcestamp))
+                      for ch in changes]
         defer.returnValue(changes)
 
     def startConsuming(self, callback, options, kwargs):
@@ -82,6 +105,7 @@ class Change(base.ResourceType):
     eventPathPatterns = """
         /changes/:changeid
     """
+    cacheable = True
 
     class EntityType(types.Entity):
         changeid = types.Integer()
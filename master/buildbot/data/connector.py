@@ -17,6 +17,7 @@ import inspect
 
 from buildbot.data import base
 from buildbot.data import exceptions
+from buildbot.data import resultcache
 from buildbot.data import resultspec
 from buildbot.util import pathmatch
 from buildbot.util import service
@@ -63,6 +64,12 @@ class DataConnector(service.AsyncService):
         self.rootLinks = []  # links from the root of the API
         self._setup()
 
+        self.resultCache = resultcache.ResultCache(master)
+
+    def stopService(self):
+        self.resultCache.stopConsuming()
+        return service.AsyncService.stopService(self)
+
     def _scanModule(self, mod, _noSetattr=False):
         for sym in dir(mod):
             obj = getattr(mod, sym)
@@ -18,7 +18,27 @@ from buildbot.data import types
 from twisted.internet import defer
 
 
-class LogChunkEndpoint(base.BuildNestingMixin, base.Endpoint):
+class LogChunkEndpointBase(base.BuildNestingMixin, base.Endpoint):
+
+    @defer.inlineCallbacks
+    def getLogIdAndDbDictFromKwargs(self, kwargs):
+        # calculate the logid
+        if 'logid' in kwargs:
+            logid = kwargs['logid']
+            dbdict = None
+        else:
+            stepid = yield self.getStepid(kwargs)
+            if stepid is None:
+                defer.returnValue((None, None))
+            dbdict = yield self.master.db.logs.getLogBySlug(stepid,
+                                                            kwargs.get('log_slug'))
+            if not dbdict:
+                defer.returnValue((None, None))
+            logid = dbdict['id']
+        defer.returnValue((logid, dbdict))
+
+
+class LogChunkEndpoint(LogChunkEndpointBase):
 
     # Note that this is a singular endpoint, even though it overrides the
     # offset/limit query params in ResultSpec
@@ -34,19 +54,15 @@ class LogChunkEndpoint(base.BuildNestingMixin, base.Endpoint):
 
     @defer.inlineCallbacks
     def get(self, resultSpec, kwargs):
-        # calculate the logid
-        if 'logid' in kwargs:
-            logid = kwargs['logid']
-            dbdict = None
-        else:
-            stepid = yield self.getStepid(kwargs)
-            if stepid is None:
-                return
-            dbdict = yield self.master.db.logs.getLogBySlug(stepid,
-                                                            kwargs.get('log_slug'))
-            if not dbdict:
-                return
-            logid = dbdict['id']
+        logid, dbdict = yield self.getLogIdAndDbDictFromKwargs(kwargs)
+        if logid is None:
+            return
+        # the log is fetched before its lines, so it is only seen as complete
+        # if all of the lines fetched are final
+        if not dbdict:
+            dbdict = yield self.master.db.logs.getLog(logid)
+        if not dbdict:
+            return
 
         firstline = resultSpec.offset or 0
         lastline = None if resultSpec.limit is None else firstline + resultSpec.limit - 1
@@ -54,10 +70,6 @@ class LogChunkEndpoint(base.BuildNestingMixin, base.Endpoint):
 
         # get the number of lines, if necessary
         if lastline is None:
-            if not dbdict:
-                dbdict = yield self.master.db.logs.getLog(logid)
-            if not dbdict:
-                return
             lastline = max(0, dbdict['num_lines'] - 1)
 
         # bounds checks
@@ -66,17 +78,73 @@ class LogChunkEndpoint(base.BuildNestingMixin, base.Endpoint):
 
         logLines = yield self.master.db.logs.getLogLines(
             logid, firstline, lastline)
+        defer.returnValue(base.ItemResult({
+            'logid': logid,
+            'firstline': firstline,
+            'content': logLines}, immutable=dbdict['complete']))
+
+    @defer.inlineCallbacks
+    def isImmutable(self, data, kwargs):
+        if getattr(data, 'immutable', None) is not None:
+            defer.returnValue(data.immutable)
+        log = yield self.master.db.logs.getLog(data['logid'])
+        defer.returnValue(bool(log and log['complete']))
+
+
+class RawLogChunkEndpoint(LogChunkEndpointBase):
+
+    # This endpoint does not fetch any log content; it describes the lines to
+    # send, and the REST interface streams them to the client chunk by chunk.
+    isCollection = False
+    isRaw = True
+    pathPatterns = """
+        /logs/n:logid/raw
+        /steps/n:stepid/logs/i:log_slug/raw
+        /builds/n:buildid/steps/i:step_name/logs/i:log_slug/raw
+        /builds/n:buildid/steps/n:step_number/logs/i:log_slug/raw
+        /builders/n:builderid/builds/n:build_number/steps/i:step_name/logs/i:log_slug/raw
+        /builders/n:builderid/builds/n:build_number/steps/n:step_number/logs/i:log_slug/raw
+    """
+
+    @defer.inlineCallbacks
+    def get(self, resultSpec, kwargs):
+        logid, dbdict = yield self.getLogIdAndDbDictFromKwargs(kwargs)
+        if logid is None:
+            return
+        if not dbdict:
+            dbdict = yield self.master.db.logs.getLog(logid)
+            if not dbdict:
+                return
+
+        firstline = resultSpec.offset or 0
+        lastline = dbdict['num_lines'] - 1
+        if resultSpec.limit is not None:
+            lastline = min(lastline, firstline + resultSpec.limit - 1)
+        resultSpec.removePagination()
+
+        if firstline < 0:
+            return
+
         defer.returnValue({
             'logid': logid,
             'firstline': firstline,
-            'content': logLines})
+            # may be less than firstline, if there are no lines to send
+            'lastline': lastline,
+            'num_lines': dbdict['num_lines'],
+            'type': dbdict['type'],
+            'filename': dbdict['slug'],
+            'complete': dbdict['complete'],
+        })
+
+    def isImmutable(self, data, kwargs):
+        return defer.succeed(data['complete'])
 
 
 class LogChunk(base.ResourceType):
 
     name = "logchunk"
     plural = "logchunks"
-    endpoints = [LogChunkEndpoint]
+    endpoints = [LogChunkEndpoint, RawLogChunkEndpoint]
     keyFields = ['stepid', 'logid']
 
     class EntityType(types.Entity):
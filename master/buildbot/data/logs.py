@@ -63,6 +63,9 @@ class LogEndpoint(EndpointMixin, base.BuildNestingMixin, base.Endpoint):
         defer.returnValue((yield self.db2data(dbdict))
                           if dbdict else None)
 
+    def isImmutable(self, data, kwargs):
+        return defer.succeed(bool(data.get('complete')))
+
 
 class LogsEndpoint(EndpointMixin, base.BuildNestingMixin, base.Endpoint):
 
@@ -77,12 +80,30 @@ class LogsEndpoint(EndpointMixin, base.BuildNestingMixin, base.Endpoint):
 
     @defer.inlineCallbacks
     def get(self, resultSpec, kwargs):
-        stepid = yield self.getStepid(kwargs)
-        if not stepid:
+        step = yield self.getStep(kwargs)
+        if not step:
             defer.returnValue([])
             return
-        logs = yield self.master.db.logs.getLogs(stepid=stepid)
-        defer.returnValue([(yield self.db2data(dbdict)) for dbdict in logs])
+        # the step is fetched before its logs, so that no more logs can be
+        # added if it was complete
+        logs = yield self.master.db.logs.getLogs(stepid=step['id'])
+        defer.returnValue(base.ListResult(
+            [(yield self.db2data(dbdict)) for dbdict in logs],
+            immutable=step['complete_at'] is not None))
+
+    @defer.inlineCallbacks
+    def isImmutable(self, data, kwargs):
+        # no logs are added once the step is complete, but its logs may still
+        # be finishing
+        if not all(l.get('complete') for l in data):
+            defer.returnValue(False)
+        if getattr(data, 'immutable', None) is not None:
+            defer.returnValue(data.immutable)
+        stepid = yield self.getStepid(kwargs)
+        if stepid is None:
+            defer.returnValue(False)
+        step = yield self.master.db.steps.getStep(stepid)
+        defer.returnValue(bool(step and step['complete_at']))
 
 
 class Log(base.ResourceType):
@@ -95,6 +116,7 @@ class Log(base.ResourceType):
         /logs/:logid
         /steps/:stepid/logs/:slug
     """
+    cacheable = True
 
     class EntityType(types.Entity):
         logid = types.Integer()
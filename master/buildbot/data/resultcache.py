@@ -0,0 +1,292 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import uuid
+
+from collections import OrderedDict
+from twisted.internet import defer
+from twisted.python import log
+
+
+class ResultCache(object):
+
+    """
+    A cache of data API results, keyed on the path and the result spec, for
+    use by clients such as the web UI that read the same paths repeatedly.
+
+    Only results for resource types marked C{cacheable} are cached, and only
+    for paths that are prefixes of the routing keys of the events that the
+    resource type produces for its C{eventPathPatterns}.  Any such event
+    invalidates the results for all of the paths that are prefixes of its
+    routing key.
+
+    The same events keep a change stamp for each such path, which differs
+    from any stamp given before for the path once its results may have
+    changed, whether or not they are cached.
+    """
+
+    # the size can be set with c['caches']['DataResults']
+    DEFAULT_CACHE_SIZE = 200
+    CACHE_NAME = 'DataResults'
+
+    # the number of counters the paths are hashed into for their change
+    # stamps; paths sharing a counter only change their stamps more often
+    STAMP_COUNTERS = 4096
+
+    def __init__(self, master):
+        self.master = master
+        # (path, resultSpec key) -> result, least recently used first
+        self.entries = OrderedDict()
+        # path -> set of keys in entries
+        self.keysByPath = {}
+        # key -> list of Deferreds waiting for a fetch in progress
+        self.pending = {}
+        # keys of fetches in progress that were invalidated
+        self.stale = set()
+        self.hits = self.misses = 0
+        self._consuming = None
+        self._qrefs = []
+        # change stamps are only comparable within this process, as are the
+        # values of the counters, which are taken from self._generation
+        self._epoch = uuid.uuid4().hex
+        self._generation = 0
+        # counters for the paths changed by events, for the prefixes
+        # invalidated by invalidatePrefix, and for everything
+        self._changed = [0] * self.STAMP_COUNTERS
+        self._pruned = [0] * self.STAMP_COUNTERS
+        self._reset = 0
+
+    def get(self, endpoint, kwargs, path, resultSpec):
+        """
+        Get the result of C{endpoint.get} with C{resultSpec} applied, from the
+        cache if possible.  The result must not be modified.
+        """
+        if not self._isCacheable(endpoint, kwargs, path):
+            return self._fetch(endpoint, kwargs, resultSpec)
+
+        key = (path, resultSpec.cacheKey())
+        result = self._lookup(key)
+        if result is not None:
+            return defer.succeed(result)
+
+        # collapse simultaneous misses into one fetch
+        d = defer.Deferred()
+        if key in self.pending:
+            self.hits += 1
+            self.pending[key].append(d)
+            return d
+        self.misses += 1
+        self.pending[key] = [d]
+
+        def done(result):
+            waiters = self.pending.pop(key)
+            if key in self.stale:
+                self.stale.discard(key)
+            else:
+                self._put(key, result)
+            for w in waiters:
+                w.callback(result)
+
+        def failed(f):
+            self.stale.discard(key)
+            for w in self.pending.pop(key):
+                w.errback(f)
+        fetch_d = self._fetch(endpoint, kwargs, resultSpec)
+        fetch_d.addCallbacks(done, failed)
+        fetch_d.addErrback(log.err, 'while caching data API result')
+        return d
+
+    def peek(self, endpoint, kwargs, path, resultSpec):
+        """
+        Return the cached result for C{get} with these arguments, or None if
+        there is none; nothing is fetched.
+        """
+        if not self._isCacheable(endpoint, kwargs, path):
+            return None
+        return self._lookup((path, resultSpec.cacheKey()))
+
+    def changeStamp(self, endpoint, kwargs, path):
+        """
+        Return a string that changes whenever the results of C{endpoint} for
+        C{path} may change, or None if the changes are not tracked for this
+        path.  Comparing the stamps from before and after a fetch shows
+        whether the result may already be out of date.
+        """
+        if not self._isCacheable(endpoint, kwargs, path):
+            return None
+        return self._stamp(path)
+
+    def put(self, endpoint, kwargs, path, specKey, result, stamp):
+        """
+        Cache C{result}, fetched by the caller for C{path} and a result spec
+        whose C{cacheKey()} was C{specKey}, if the path's change stamp is
+        still C{stamp}, taken before the fetch.
+        """
+        if stamp is None or self.changeStamp(endpoint, kwargs, path) != stamp:
+            return
+        self._put((path, specKey), result)
+
+    def _stamp(self, path):
+        value = max([self._reset, self._changed[self._counter(path)]] +
+                    [self._pruned[self._counter(path[:i])]
+                     for i in range(len(path) + 1)])
+        return '%s-%d' % (self._epoch, value)
+
+    def _counter(self, path):
+        return hash(tuple(path)) % self.STAMP_COUNTERS
+
+    def _bump(self, counters, path):
+        self._generation += 1
+        counters[self._counter(path)] = self._generation
+
+    def _lookup(self, key):
+        try:
+            result = self.entries.pop(key)
+        except KeyError:
+            return None
+        self.hits += 1
+        self.entries[key] = result
+        return result
+
+    def stopConsuming(self):
+        for qref in self._qrefs:
+            qref.stopConsuming()
+        self._qrefs = []
+        self._consuming = None
+        self.invalidateAll()
+
+    def invalidatePrefix(self, prefix):
+        """
+        Invalidate the results for all of the paths starting with
+        C{prefix}, for changes that produce no events.
+        """
+        self._bump(self._pruned, prefix)
+        for path in self.keysByPath.keys():
+            if path[:len(prefix)] == prefix:
+                for key in self.keysByPath.pop(path):
+                    del self.entries[key]
+        for key in self.pending:
+            if key[0][:len(prefix)] == prefix:
+                self.stale.add(key)
+
+    def invalidateAll(self):
+        self._generation += 1
+        self._reset = self._generation
+        self.entries.clear()
+        self.keysByPath.clear()
+        self.stale.update(self.pending)
+
+    def _fetch(self, endpoint, kwargs, resultSpec):
+        d = defer.maybeDeferred(endpoint.get, resultSpec, kwargs)
+        d.addCallback(resultSpec.apply)
+        return d
+
+    def _isCacheable(self, endpoint, kwargs, path):
+        rtype = endpoint.rtype
+        if not getattr(rtype, 'cacheable', False) or endpoint.isRaw:
+            return False
+
+        # with several masters, other masters' events are only seen through
+        # a shared message queue
+        config = self.master.config
+        if config.multiMaster and config.mq.get('type', 'simple') == 'simple':
+            return False
+
+        # start consuming on first use; results are not cached until all of
+        # the consumers are in place, so that no events are missed
+        if self._consuming is None:
+            self._startConsuming()
+        if self._consuming is None or not self._consuming.called:
+            return False
+
+        for pattern in self._eventPatterns(rtype):
+            if self._isPrefix(path, pattern, kwargs):
+                return True
+        return False
+
+    @staticmethod
+    def _eventPatterns(rtype):
+        return [tuple(pp.split('/')[1:])
+                for pp in rtype.eventPathPatterns.split()]
+
+    @staticmethod
+    def _isPrefix(path, pattern, kwargs):
+        # is this path a prefix of the routing keys produced for this event
+        # path pattern?
+        if len(path) > len(pattern):
+            return False
+        for elt, pat in zip(path, pattern):
+            if pat.startswith(':'):
+                name = pat[1:]
+                if name not in kwargs or str(kwargs[name]) != elt:
+                    return False
+            elif pat != elt:
+                return False
+        return True
+
+    def _startConsuming(self):
+        dl = []
+        for rtype in vars(self.master.data.rtypes).itervalues():
+            if not getattr(rtype, 'cacheable', False):
+                continue
+            for pattern in self._eventPatterns(rtype):
+                filter = tuple(None if p.startswith(':') else p
+                               for p in pattern) + (None,)
+                dl.append(defer.maybeDeferred(self.master.mq.startConsuming,
+                                              self._eventReceived, filter))
+        self._consuming = d = defer.DeferredList(dl, consumeErrors=True)
+
+        @d.addCallback
+        def started(results):
+            qrefs = [r for ok, r in results if ok]
+            failures = [r for ok, r in results if not ok]
+            if failures:
+                # without every consumer, cached results could miss their
+                # invalidation and stay stale, so nothing is cached until
+                # the consumers are started again, on the next use
+                for f in failures:
+                    log.err(f, 'while starting to consume for the data cache')
+                for qref in qrefs:
+                    qref.stopConsuming()
+                self._consuming = None
+                return
+            # invalidate in the producer's call stack, so that a cached result
+            # is never served after the event that made it stale
+            for qref in qrefs:
+                qref.setDelivery('block', 0)
+            self._qrefs = qrefs
+
+    def _eventReceived(self, routingKey, data):
+        # the last element of the routing key is the event
+        path = routingKey[:-1]
+        for i in range(1, len(path) + 1):
+            self._bump(self._changed, path[:i])
+            for key in self.keysByPath.pop(path[:i], ()):
+                del self.entries[key]
+        for key in self.pending:
+            if key[0] == path[:len(key[0])]:
+                self.stale.add(key)
+
+    def _put(self, key, result):
+        self.entries[key] = result
+        self.keysByPath.setdefault(key[0], set()).add(key)
+        max_size = self.master.config.caches.get(self.CACHE_NAME,
+                                                 self.DEFAULT_CACHE_SIZE)
+        while len(self.entries) > max_size:
+            old_key, _ = self.entries.popitem(last=False)
+            keys = self.keysByPath[old_key[0]]
+            keys.discard(old_key)
+            if not keys:
+                del self.keysByPath[old_key[0]]
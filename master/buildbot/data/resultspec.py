@@ -13,7 +13,21 @@
 #
 # Copyright Buildbot Team Members
 
+import datetime
+import operator
+import sqlalchemy as sa
+
 from buildbot.data import base
+from buildbot.db import NULL
+from buildbot.util import datetime2epoch
+from twisted.internet import defer
+
+
+def _sqlValue(value):
+    # DB columns hold datetimes as epoch times
+    if isinstance(value, datetime.datetime):
+        return datetime2epoch(value)
+    return value
 
 
 class Filter(object):
@@ -34,6 +48,15 @@ class Filter(object):
         'ne': lambda d, v: d not in v,
     }
 
+    sql_operators = {
+        'eq': operator.eq,
+        'ne': operator.ne,
+        'lt': operator.lt,
+        'le': operator.le,
+        'gt': operator.gt,
+        'ge': operator.ge,
+    }
+
     def __init__(self, field, op, values):
         self.field = field
         self.op = op
@@ -50,18 +73,130 @@ class Filter(object):
         f = ops[self.op]
         return (d for d in data if f(d[fld], v))
 
+    def _toSQL(self, column):
+        values = [_sqlValue(v) for v in self.values]
+        if len(values) == 1:
+            return self.sql_operators[self.op](column, values[0])
+
+        # IN does not match NULL, so that is handled separately
+        notNull = [v for v in values if v is not None]
+        hasNull = len(notNull) != len(values)
+        if self.op == 'eq':
+            clause = column.in_(notNull)
+            if hasNull:
+                clause = sa.or_(clause, column == NULL)
+        else:
+            clause = sa.not_(column.in_(notNull))
+            if hasNull:
+                clause = sa.and_(clause, column != NULL)
+            else:
+                clause = sa.or_(clause, column == NULL)
+        return clause
+
+
+class Aggregate(object):
+
+    __slots__ = ['function', 'field']
+
+    functions = ('count', 'min', 'max', 'avg')
+
+    def __init__(self, function, field=None):
+        self.function = function
+        # the field to aggregate; None counts the items themselves
+        self.field = field
+
+    @property
+    def name(self):
+        # the key of this aggregate in the result rows
+        if self.field is None:
+            return self.function
+        return '%s_%s' % (self.function, self.field)
+
+    def _apply(self, items):
+        if self.field is None:
+            return len(items)
+        # like SQL, ignore NULL values
+        values = [_sqlValue(d[self.field]) for d in items
+                  if d[self.field] is not None]
+        if self.function == 'count':
+            return len(values)
+        if not values:
+            return None
+        if self.function == 'min':
+            return min(values)
+        elif self.function == 'max':
+            return max(values)
+        return float(sum(values)) / len(values)
+
+    def _toSQL(self, column):
+        if column is None:
+            return sa.func.count()
+        return getattr(sa.func, self.function)(column)
+
+    def _fromSQL(self, value):
+        # some databases return averages as decimals
+        if self.function == 'avg' and value is not None:
+            return float(value)
+        return value
+
+
+class _ProjectedRow(object):
+
+    # a result row from a projected query, in which the columns that were
+    # not selected read as None
+
+    __slots__ = ['_row']
+
+    def __init__(self, row):
+        self._row = row
+
+    def __getattr__(self, name):
+        try:
+            return getattr(self._row, name)
+        except AttributeError:
+            return None
+
 
 class ResultSpec(object):
 
-    __slots__ = ['filters', 'fields', 'order', 'limit', 'offset']
+    __slots__ = ['filters', 'fields', 'order', 'limit', 'offset', 'after',
+                 'aggregates', 'groupBy', 'countTotal', 'fieldMapping']
 
     def __init__(self, filters=None, fields=None, order=None,
-                 limit=None, offset=None):
+                 limit=None, offset=None, after=None, aggregates=None,
+                 groupBy=None, countTotal=True):
         self.filters = filters or []
         self.fields = fields
         self.order = order
         self.limit = limit
         self.offset = offset
+        # values of the order fields for the item preceding the first item to
+        # return (keyset pagination), or None
+        self.after = after
+        # if given, the result is a row of these aggregates for each distinct
+        # combination of values of the groupBy fields, instead of the items
+        self.aggregates = aggregates or []
+        self.groupBy = groupBy or []
+        # if false, a paginated result does not need the total number of
+        # matching items, so it is not counted
+        self.countTotal = countTotal
+        # map from field names to 'table.column' names, for applying the
+        # result spec in SQL; fields computed from other columns map to a
+        # tuple of the 'table.column' names they need
+        self.fieldMapping = {}
+
+    def cacheKey(self):
+        """
+        Return a hashable value identifying this result spec, for use in cache
+        keys.
+        """
+        return (tuple((f.field, f.op, tuple(f.values)) for f in self.filters),
+                tuple(self.fields) if self.fields is not None else None,
+                tuple(self.order) if self.order is not None else None,
+                self.limit, self.offset,
+                tuple(self.after) if self.after is not None else None,
+                tuple((a.function, a.field) for a in self.aggregates),
+                tuple(self.groupBy))
 
     def popFilter(self, field, op):
         for f in self.filters:
@@ -87,7 +222,7 @@ class ResultSpec(object):
             return eqVals[0]
 
     def removePagination(self):
-        self.limit = self.offset = None
+        self.limit = self.offset = self.after = None
 
     def removeOrder(self):
         self.order = None
@@ -100,6 +235,272 @@ class ResultSpec(object):
         del self.fields[i]
         return True
 
+    def includesField(self, field):
+        """
+        Return true if the given field will appear in the result, or is needed
+        to filter or sort it.  Endpoints can use this to avoid fetching
+        expensive fields that will be dropped anyway.
+        """
+        if not self.fields and not self.aggregates:
+            return True
+        return field in self._neededFields()
+
+    def canStream(self, fieldMapping):
+        """
+        Return true if this result spec can be fetched in batches with
+        L{stream}: it has no pagination, and its filters and order can all be
+        applied in SQL with the given field mapping.
+        """
+        if (self.limit is not None or self.offset is not None
+                or self.after is not None or self.aggregates):
+            return False
+        fields = [f.field for f in self.filters]
+        fields.extend(o.lstrip('-') for o in self.order or [])
+        return all(isinstance(fieldMapping.get(f), str) for f in fields)
+
+    def stream(self, getBatch, keyField, batchSize):
+        """
+        Return a L{base.StreamedResult} producing the results for this result
+        spec in batches of C{batchSize}.  Each batch is fetched with
+        C{getBatch(resultSpec)}, which must return the results for the given
+        result spec via Deferred, with the result spec applied.  The batches
+        use keyset pagination, ordering by C{keyField}, which must be unique,
+        after any order in this result spec.
+        """
+        order = list(self.order or [])
+        if keyField not in [o.lstrip('-') for o in order]:
+            order.append(keyField)
+        orderFields = [o.lstrip('-') for o in order]
+
+        # the order fields are needed to find the position of each batch
+        fields, extraFields = self.fields, []
+        if fields:
+            extraFields = [f for f in orderFields if f not in fields]
+            fields = list(fields) + extraFields
+        state = dict(after=None, done=False)
+
+        @defer.inlineCallbacks
+        def nextBatch():
+            if state['done']:
+                defer.returnValue([])
+            batchSpec = ResultSpec(filters=list(self.filters),
+                                   fields=list(fields) if fields else fields,
+                                   order=list(order), limit=batchSize,
+                                   after=state['after'], countTotal=False)
+            items = list((yield getBatch(batchSpec)))
+            if len(items) < batchSize:
+                state['done'] = True
+            if items:
+                state['after'] = [items[-1][f] for f in orderFields]
+            if extraFields:
+                for item in items:
+                    for f in extraFields:
+                        del item[f]
+            defer.returnValue(items)
+        return base.StreamedResult(nextBatch)
+
+    def _neededFields(self):
+        needed = set(self.fields or [])
+        needed.update(f.field for f in self.filters)
+        needed.update(o.lstrip('-') for o in self.order or [])
+        needed.update(a.field for a in self.aggregates if a.field)
+        needed.update(self.groupBy)
+        return needed
+
+    def _findColumn(self, query, field):
+        # find the column for the given field among the tables the query
+        # selects from; raises KeyError if there is none
+        mapping = self.fieldMapping[field]
+        if isinstance(mapping, tuple):
+            # computed fields cannot be filtered or sorted in SQL
+            raise KeyError(field)
+        return self._findTableColumn(query, field, mapping)
+
+    def _findTableColumn(self, query, field, mapping):
+        tableName, columnName = mapping.split('.')
+
+        def tables(frm):
+            if isinstance(frm, sa.sql.expression.Join):
+                for tbl in tables(frm.left):
+                    yield tbl
+                for tbl in tables(frm.right):
+                    yield tbl
+            elif isinstance(frm, sa.Table):
+                yield frm
+        for frm in query.froms:
+            for tbl in tables(frm):
+                if tbl.name == tableName:
+                    return tbl.c[columnName]
+        raise KeyError(field)
+
+    def applyToSQLQuery(self, query):
+        """
+        Apply as much of this result spec as possible to the given query,
+        removing the parts that were applied.  Return the query and, if
+        pagination was applied and C{countTotal} is true, a query counting the
+        total number of matching rows; otherwise that is None.
+        """
+        # filters are independent of each other, so apply all that can be
+        filters = []
+        for f in self.filters:
+            try:
+                column = self._findColumn(query, f.field)
+            except KeyError:
+                filters.append(f)
+                continue
+            query = query.where(f._toSQL(column))
+        self.filters = filters
+
+        # sorting and pagination can only be applied if everything before
+        # them was
+        if filters:
+            return query, None
+        order = self.order
+        if self.after is not None and not order:
+            # leave apply to complain about this
+            return query, None
+        if order:
+            try:
+                columns = []
+                for o in order:
+                    column = self._findColumn(query, o.lstrip('-'))
+                    keys = [column]
+                    # databases differ in where they sort NULLs, so sort
+                    # them explicitly as the smallest value, just as the
+                    # in-memory sort and _keysetClause do
+                    if column.nullable:
+                        keys.insert(0, sa.case([(column == NULL, 0)], else_=1))
+                    columns.extend(sa.desc(k) if o[0] == '-' else k
+                                   for k in keys)
+            except KeyError:
+                return query, None
+            # this replaces any default order given by the query
+            query = query.order_by(None).order_by(*columns)
+            self.order = None
+
+        if self.offset is None and self.limit is None and self.after is None:
+            return query, None
+        # the total does not depend on the position given by 'after'
+        countQuery = None
+        if self.countTotal:
+            countQuery = sa.select([sa.func.count()]).select_from(
+                query.order_by(None).alias('query'))
+        if self.after is not None:
+            query = query.where(self._keysetClause(query, order))
+        if self.offset is not None:
+            query = query.offset(self.offset)
+        if self.limit is not None:
+            query = query.limit(self.limit)
+        self.removePagination()
+        return query, countQuery
+
+    def _keysetClause(self, query, order):
+        # rows that sort after the values in 'after', treating NULL as the
+        # smallest value just as the in-memory sort treats None
+        clauses = []
+        equal = []
+        for o, value in zip(order, self.after):
+            desc = o[0] == '-'
+            column = self._findColumn(query, o.lstrip('-'))
+            value = _sqlValue(value)
+            if value is None:
+                beyond = None if desc else (column != NULL)
+            elif desc:
+                beyond = sa.or_(column < value, column == NULL)
+            else:
+                beyond = column > value
+            if beyond is not None:
+                clauses.append(sa.and_(*(equal + [beyond])))
+            equal.append(column == value if value is not None
+                         else column == NULL)
+        return sa.or_(*clauses)
+
+    def _projectQuery(self, query):
+        # narrow the query to the columns needed for the requested fields, or
+        # return None if that is not possible
+        if not self.fields and not self.aggregates:
+            return None
+        columns, seen = [], set()
+        for field in self._neededFields():
+            mapping = self.fieldMapping.get(field)
+            if mapping is None:
+                return None
+            if not isinstance(mapping, tuple):
+                mapping = (mapping,)
+            for m in mapping:
+                try:
+                    column = self._findTableColumn(query, field, m)
+                except KeyError:
+                    return None
+                if column not in seen:
+                    seen.add(column)
+                    columns.append(column)
+        return query.with_only_columns(columns)
+
+    def _thdAggregate(self, conn, query):
+        # compute the aggregates in SQL, returning the result rows, or None if
+        # a field cannot be found in the query
+        fields = list(self.groupBy)
+        fields.extend(a.field for a in self.aggregates
+                      if a.field and a.field not in fields)
+        try:
+            columns = [self._findColumn(query, f).label('f%d' % i)
+                       for i, f in enumerate(fields)]
+        except KeyError:
+            return None
+        if columns:
+            query = query.with_only_columns(columns)
+        inner = query.order_by(None).alias('aggregated')
+
+        groups = [inner.c['f%d' % fields.index(f)] for f in self.groupBy]
+        aggregates = [a._toSQL(inner.c['f%d' % fields.index(a.field)]
+                               if a.field else None)
+                      for a in self.aggregates]
+        query = sa.select(groups + aggregates).select_from(inner)
+        if groups:
+            query = query.group_by(*groups).order_by(*groups)
+
+        rows = []
+        for row in conn.execute(query).fetchall():
+            row = list(row)
+            d = dict(zip(self.groupBy, row))
+            for a, value in zip(self.aggregates, row[len(groups):]):
+                d[a.name] = a._fromSQL(value)
+            rows.append(d)
+        return rows
+
+    def thd_execute(self, conn, query, dictFromRow, project=True):
+        """
+        Apply this result spec to the given query as with
+        L{applyToSQLQuery}, execute it, and convert the rows with
+        C{dictFromRow}.  If pagination was applied and the total counted, the
+        result is a L{ListResult} with its pagination attributes set.
+
+        If C{project} is true and all of the requested fields are mapped, only
+        the columns they need are selected, and C{dictFromRow} sees C{None}
+        for the others.
+
+        If the result spec has aggregates, and they and the filters can all be
+        computed in SQL, the result is an empty L{ListResult} carrying the
+        aggregate rows in its C{aggregates} attribute, for L{apply} to return.
+        """
+        offset, limit = self.offset, self.limit
+        query, countQuery = self.applyToSQLQuery(query)
+        if self.aggregates and not self.filters:
+            rows = self._thdAggregate(conn, query)
+            if rows is not None:
+                return base.ListResult([], aggregates=rows)
+        projected = self._projectQuery(query) if project else None
+        if projected is not None:
+            query = projected
+            dictFromRow = (lambda row, dictFromRow=dictFromRow:
+                           dictFromRow(_ProjectedRow(row)))
+        rv = [dictFromRow(row) for row in conn.execute(query).fetchall()]
+        if countQuery is not None:
+            total = conn.execute(countQuery).scalar()
+            rv = base.ListResult(rv, offset=offset, total=total, limit=limit)
+        return rv
+
     def apply(self, data):
         if data is None:
             return data
@@ -114,20 +515,37 @@ class ResultSpec(object):
         else:
             fields = None
 
+        immutable = getattr(data, 'immutable', None)
         if isinstance(data, dict):
             # item details
             if fields:
                 data = applyFields(data)
+                if immutable is not None:
+                    data = base.ItemResult(data, immutable=immutable)
             return data
         else:
             filters = self.filters
             order = self.order
 
+            # aggregates of the collection
+            if self.aggregates:
+                if isinstance(data, base.ListResult) and \
+                        data.aggregates is not None:
+                    rows = data.aggregates
+                else:
+                    for f in self.filters:
+                        data = f._apply(data)
+                    rows = self._aggregate(list(data))
+                return base.ListResult(rows, total=len(rows))
+
             # item collection
-            if isinstance(data, base.ListResult):
-                # if pagination was applied, then fields, etc. must be empty
-                assert not fields and not order and not filters, \
-                    "endpoint must apply fields, order, and filters if it performs pagination"
+            if isinstance(data, base.ListResult) and (
+                    data.offset is not None or data.total is not None
+                    or data.limit is not None):
+                # if pagination was applied, then order and filters must be
+                # empty
+                assert not order and not filters, \
+                    "endpoint must apply order and filters if it performs pagination"
                 offset, total = data.offset, data.total
                 limit = data.limit
             else:
@@ -160,6 +578,16 @@ class ResultSpec(object):
                     return 0
                 data.sort(cmp=cmpFunc)
 
+            # skip to the item after the given position in the order
+            if self.after is not None:
+                if not self.order:
+                    raise AssertionError("'after' requires an order")
+                if offset is not None or limit is not None:
+                    raise AssertionError("endpoint must clear after")
+                after = dict(zip((k.lstrip('-') for k in self.order),
+                                 self.after))
+                data = [d for d in data if cmpFunc(d, after) > 0]
+
             # finally, slice out the limit/offset
             if self.offset is not None or self.limit is not None:
                 if offset is not None or limit is not None:
@@ -173,4 +601,24 @@ class ResultSpec(object):
             rv = base.ListResult(data)
             rv.offset, rv.total = offset, total
             rv.limit = limit
+            rv.immutable = immutable
             return rv
+
+    def _aggregate(self, items):
+        # compute the aggregates in memory, representing datetimes as epoch
+        # times, as they are in SQL
+        if not self.groupBy:
+            # there is a row even if there are no items
+            groups = {(): items}
+        else:
+            groups = {}
+            for d in items:
+                key = tuple(_sqlValue(d[f]) for f in self.groupBy)
+                groups.setdefault(key, []).append(d)
+        rows = []
+        for key in sorted(groups):
+            row = dict(zip(self.groupBy, key))
+            for a in self.aggregates:
+                row[a.name] = a._apply(groups[key])
+            rows.append(row)
+        return rows
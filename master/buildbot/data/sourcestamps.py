@@ -63,11 +63,26 @@ class SourceStampsEndpoint(base.Endpoint):
         /sourcestamps
     """
     rootLinkName = 'sourcestamps'
+    streamKeyField = 'ssid'
+    fieldMapping = {
+        'ssid': 'sourcestamps.id',
+        'branch': 'sourcestamps.branch',
+        'revision': 'sourcestamps.revision',
+        'repository': 'sourcestamps.repository',
+        'project': 'sourcestamps.project',
+        'codebase': 'sourcestamps.codebase',
+        'created_at': 'sourcestamps.created_at',
+        'patch': ('sourcestamps.patchid',),
+    }
 
     @defer.inlineCallbacks
     def get(self, resultSpec, kwargs):
-        defer.returnValue([_db2data(ssdict) for ssdict in
-                           (yield self.master.db.sourcestamps.getSourceStamps())])
+        resultSpec.fieldMapping = self.fieldMapping
+        sourcestamps = yield self.master.db.sourcestamps.getSourceStamps(
+            resultSpec=resultSpec)
+        # replace the contents, keeping any pagination information
+        sourcestamps[:] = [_db2data(ssdict) for ssdict in sourcestamps]
+        defer.returnValue(sourcestamps)
 
     def startConsuming(self, callback, options, kwargs):
         return self.master.mq.startConsuming(callback,
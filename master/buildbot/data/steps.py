@@ -64,6 +64,9 @@ class StepEndpoint(Db2DataMixin, base.BuildNestingMixin, base.Endpoint):
         defer.returnValue((yield self.db2data(dbdict))
                           if dbdict else None)
 
+    def isImmutable(self, data, kwargs):
+        return defer.succeed(bool(data.get('complete')))
+
 
 class StepsEndpoint(Db2DataMixin, base.BuildNestingMixin, base.Endpoint):
 
@@ -72,17 +75,48 @@ class StepsEndpoint(Db2DataMixin, base.BuildNestingMixin, base.Endpoint):
         /builds/n:buildid/steps
         /builders/n:builderid/builds/n:build_number/steps
     """
+    fieldMapping = {
+        'stepid': 'steps.id',
+        'number': 'steps.number',
+        'name': 'steps.name',
+        'buildid': 'steps.buildid',
+        'started_at': 'steps.started_at',
+        'complete_at': 'steps.complete_at',
+        'results': 'steps.results',
+        'complete': ('steps.complete_at',),
+        'state_strings': ('steps.state_strings_json',),
+        'urls': ('steps.urls_json',),
+    }
 
     @defer.inlineCallbacks
     def get(self, resultSpec, kwargs):
-        if 'buildid' in kwargs:
-            buildid = kwargs['buildid']
-        else:
-            buildid = yield self.getBuildid(kwargs)
-            if buildid is None:
-                return
-        steps = yield self.master.db.steps.getSteps(buildid=buildid)
-        defer.returnValue([(yield self.db2data(dbdict)) for dbdict in steps])
+        build = yield self.getBuild(kwargs)
+        if not build:
+            if 'buildid' in kwargs:
+                defer.returnValue([])
+            return
+        resultSpec.fieldMapping = self.fieldMapping
+        # the build is fetched before its steps, so that they are final if it
+        # was complete
+        steps = yield self.master.db.steps.getSteps(buildid=build['id'],
+                                                    resultSpec=resultSpec)
+        if not isinstance(steps, base.ListResult):
+            steps = base.ListResult(steps)
+        steps.immutable = build['complete_at'] is not None
+        # replace the contents, keeping any pagination information
+        steps[:] = [(yield self.db2data(dbdict)) for dbdict in steps]
+        defer.returnValue(steps)
+
+    @defer.inlineCallbacks
+    def isImmutable(self, data, kwargs):
+        # steps are neither added nor changed once the build is complete
+        if getattr(data, 'immutable', None) is not None:
+            defer.returnValue(data.immutable)
+        buildid = yield self.getBuildid(kwargs)
+        if buildid is None:
+            defer.returnValue(False)
+        build = yield self.master.db.builds.getBuild(buildid)
+        defer.returnValue(bool(build and build['complete_at']))
 
     def startConsuming(self, callback, options, kwargs):
         if 'stepid' in kwargs:
@@ -107,6 +141,7 @@ class Step(base.ResourceType):
         /builds/:buildid/steps/:stepid
         /steps/:stepid
     """
+    cacheable = True
 
     class EntityType(types.Entity):
         stepid = types.Integer()
@@ -73,7 +73,8 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
         return self.db.pool.do(thd)
 
     def getBuildRequests(self, buildername=None, complete=None, claimed=None,
-                         bsid=None, branch=None, repository=None):
+                         bsid=None, branch=None, repository=None,
+                         resultSpec=None):
         def thd(conn):
             reqs_tbl = self.db.model.buildrequests
             claims_tbl = self.db.model.buildrequest_claims
@@ -106,9 +107,14 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
             if repository is not None:
                 q = q.where(sstamps_tbl.c.repository == repository)
 
+            masterid = self.db.master.masterid
+            if resultSpec is not None:
+                return resultSpec.thd_execute(
+                    conn, q, lambda row: self._brdictFromRow(row, masterid))
+
             res = conn.execute(q)
 
-            return [self._brdictFromRow(row, self.db.master.masterid)
+            return [self._brdictFromRow(row, masterid)
                     for row in res.fetchall()]
         return self.db.pool.do(thd)
 
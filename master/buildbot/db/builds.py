@@ -46,7 +46,7 @@ class BuildsConnectorComponent(base.DBConnectorComponent):
             (self.db.model.builds.c.builderid == builderid)
             & (self.db.model.builds.c.number == number))
 
-    def getBuilds(self, builderid=None, buildrequestid=None):
+    def getBuilds(self, builderid=None, buildrequestid=None, resultSpec=None):
         def thd(conn):
             tbl = self.db.model.builds
             q = tbl.select()
@@ -54,6 +54,8 @@ class BuildsConnectorComponent(base.DBConnectorComponent):
                 q = q.where(tbl.c.builderid == builderid)
             if buildrequestid:
                 q = q.where(tbl.c.buildrequestid == buildrequestid)
+            if resultSpec is not None:
+                return resultSpec.thd_execute(conn, q, self._builddictFromRow)
             res = conn.execute(q)
             return [self._builddictFromRow(row) for row in res.fetchall()]
         return self.db.pool.do(thd)
@@ -123,6 +125,11 @@ class BuildsConnectorComponent(base.DBConnectorComponent):
             if epoch:
                 return epoch2datetime(epoch)
 
+        def loads(json_str):
+            # None if the column was not selected
+            if json_str is not None:
+                return json.loads(json_str)
+
         return dict(
             id=row.id,
             number=row.number,
@@ -132,5 +139,5 @@ class BuildsConnectorComponent(base.DBConnectorComponent):
             masterid=row.masterid,
             started_at=mkdt(row.started_at),
             complete_at=mkdt(row.complete_at),
-            state_strings=json.loads(row.state_strings_json),
+            state_strings=loads(row.state_strings_json),
             results=row.results)
@@ -159,7 +159,7 @@ class BuildsetsConnectorComponent(base.DBConnectorComponent):
             return self._thd_row2dict(conn, row)
         return self.db.pool.do(thd)
 
-    def getBuildsets(self, complete=None):
+    def getBuildsets(self, complete=None, resultSpec=None):
         def thd(conn):
             bs_tbl = self.db.model.buildsets
             q = bs_tbl.select()
@@ -169,6 +169,12 @@ class BuildsetsConnectorComponent(base.DBConnectorComponent):
                 else:
                     q = q.where((bs_tbl.c.complete == 0) |
                                 (bs_tbl.c.complete == NULL))
+            if resultSpec is not None:
+                # skip the sourcestamps query if they are not wanted
+                withSourcestamps = resultSpec.includesField('sourcestamps')
+                return resultSpec.thd_execute(
+                    conn, q, lambda row: self._thd_row2dict(
+                        conn, row, withSourcestamps=withSourcestamps))
             res = conn.execute(q)
             return [self._thd_row2dict(conn, row) for row in res.fetchall()]
         return self.db.pool.do(thd)
@@ -219,12 +225,14 @@ class BuildsetsConnectorComponent(base.DBConnectorComponent):
             return BsProps(l)
         return self.db.pool.do(thd)
 
-    def _thd_row2dict(self, conn, row):
+    def _thd_row2dict(self, conn, row, withSourcestamps=True):
         # get sourcestamps
-        tbl = self.db.model.buildset_sourcestamps
-        sourcestamps = [r.sourcestampid for r in
-                        conn.execute(sa.select([tbl.c.sourcestampid],
-                                               (tbl.c.buildsetid == row.id))).fetchall()]
+        sourcestamps = []
+        if withSourcestamps:
+            tbl = self.db.model.buildset_sourcestamps
+            sourcestamps = [r.sourcestampid for r in
+                            conn.execute(sa.select([tbl.c.sourcestampid],
+                                                   (tbl.c.buildsetid == row.id))).fetchall()]
 
         def mkdt(epoch):
             if epoch:
@@ -35,6 +35,10 @@ class ChDict(dict):
 class ChangesConnectorComponent(base.DBConnectorComponent):
     # Documentation is in developer/db.rst
 
+    # number of changes whose files and properties are fetched in a single
+    # query, kept below the limit on bound parameters of some databases
+    BULK_BATCH_SIZE = 500
+
     @defer.inlineCallbacks
     def addChange(self, author=None, files=None, comments=None, is_dir=None,
                   revision=None, when_timestamp=None, branch=None,
@@ -152,42 +156,53 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
         d = self.db.pool.do(thd)
         return d
 
-    def getRecentChanges(self, count):
+    def getChangesByIds(self, changeids):
         def thd(conn):
-            # get the changeids from the 'changes' table
             changes_tbl = self.db.model.changes
-            q = sa.select([changes_tbl.c.changeid],
-                          order_by=[sa.desc(changes_tbl.c.changeid)],
-                          limit=count)
-            rp = conn.execute(q)
-            changeids = [row.changeid for row in rp]
-            rp.close()
-            return list(reversed(changeids))
+            chdicts = []
+            remaining = list(changeids)
+            while remaining:
+                batch, remaining = (remaining[:self.BULK_BATCH_SIZE],
+                                    remaining[self.BULK_BATCH_SIZE:])
+                q = changes_tbl.select(
+                    whereclause=changes_tbl.c.changeid.in_(batch))
+                rows = conn.execute(q).fetchall()
+                chdicts.extend(self._thd_chdicts_from_change_rows(conn, rows))
+            # return the changes in the order they were requested
+            byid = dict((chdict['changeid'], chdict) for chdict in chdicts)
+            return [byid[changeid] for changeid in changeids
+                    if changeid in byid]
         d = self.db.pool.do(thd)
-
-        # then turn those into changes, using the cache
-        def get_changes(changeids):
-            return defer.gatherResults([self.getChange(changeid)
-                                        for changeid in changeids])
-        d.addCallback(get_changes)
+        d.addCallback(self._cacheChdicts)
         return d
 
-    def getChanges(self):
+    def getRecentChanges(self, count):
         def thd(conn):
-            # get the changeids from the 'changes' table
             changes_tbl = self.db.model.changes
-            q = sa.select([changes_tbl.c.changeid])
-            rp = conn.execute(q)
-            changeids = [row.changeid for row in rp]
-            rp.close()
-            return list(changeids)
+            q = changes_tbl.select(order_by=[sa.desc(changes_tbl.c.changeid)],
+                                   limit=count)
+            rows = conn.execute(q).fetchall()
+            rows.reverse()
+            return self._thd_chdicts_from_change_rows(conn, rows)
         d = self.db.pool.do(thd)
+        d.addCallback(self._cacheChdicts)
+        return d
 
-        # then turn those into changes, using the cache
-        def get_changes(changeids):
-            return defer.gatherResults([self.getChange(changeid)
-                                        for changeid in changeids])
-        d.addCallback(get_changes)
+    def getChanges(self, resultSpec=None):
+        def thd(conn):
+            changes_tbl = self.db.model.changes
+            q = changes_tbl.select()
+            if resultSpec is None:
+                rows = conn.execute(q).fetchall()
+            else:
+                # the chdicts go into the cache, so select all columns
+                rows = resultSpec.thd_execute(conn, q, lambda row: row,
+                                              project=False)
+            # replace the contents, keeping any pagination information
+            rows[:] = self._thd_chdicts_from_change_rows(conn, rows)
+            return rows
+        d = self.db.pool.do(thd)
+        d.addCallback(self._cacheChdicts)
         return d
 
     def getChangesCount(self):
@@ -249,33 +264,58 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
                         table.delete(table.c.changeid.in_(batch)))
         return self.db.pool.do(thd)
 
+    def _cacheChdicts(self, chdicts):
+        # feed bulk-loaded chdicts into the cache used by getChange
+        cache = self.getChange.cache
+        for chdict in chdicts:
+            cache.put(chdict['changeid'], chdict)
+        return chdicts
+
     def _chdict_from_change_row_thd(self, conn, ch_row):
         # This method must be run in a db.pool thread, and returns a chdict
         # given a row from the 'changes' table
+        return self._thd_chdicts_from_change_rows(conn, [ch_row])[0]
+
+    def _thd_chdicts_from_change_rows(self, conn, ch_rows):
+        # This method must be run in a db.pool thread, and returns a list of
+        # chdicts given rows from the 'changes' table.  The files and
+        # properties of all of the changes are fetched together.
         change_files_tbl = self.db.model.change_files
         change_properties_tbl = self.db.model.change_properties
 
-        chdict = ChDict(
-            changeid=ch_row.changeid,
-            author=ch_row.author,
-            files=[],  # see below
-            comments=ch_row.comments,
-            revision=ch_row.revision,
-            when_timestamp=epoch2datetime(ch_row.when_timestamp),
-            branch=ch_row.branch,
-            category=ch_row.category,
-            revlink=ch_row.revlink,
-            properties={},  # see below
-            repository=ch_row.repository,
-            codebase=ch_row.codebase,
-            project=ch_row.project,
-            sourcestampid=int(ch_row.sourcestampid))
-
-        query = change_files_tbl.select(
-            whereclause=(change_files_tbl.c.changeid == ch_row.changeid))
-        rows = conn.execute(query)
-        for r in rows:
-            chdict['files'].append(r.filename)
+        chdicts = []
+        byid = {}
+        for ch_row in ch_rows:
+            chdict = ChDict(
+                changeid=ch_row.changeid,
+                author=ch_row.author,
+                files=[],  # see below
+                comments=ch_row.comments,
+                revision=ch_row.revision,
+                when_timestamp=epoch2datetime(ch_row.when_timestamp),
+                branch=ch_row.branch,
+                category=ch_row.category,
+                revlink=ch_row.revlink,
+                properties={},  # see below
+                repository=ch_row.repository,
+                codebase=ch_row.codebase,
+                project=ch_row.project,
+                sourcestampid=int(ch_row.sourcestampid))
+            chdicts.append(chdict)
+            byid[chdict['changeid']] = chdict
+
+        def batches():
+            remaining = list(byid)
+            while remaining:
+                batch, remaining = (remaining[:self.BULK_BATCH_SIZE],
+                                    remaining[self.BULK_BATCH_SIZE:])
+                yield batch
+
+        for batch in batches():
+            query = change_files_tbl.select(
+                whereclause=change_files_tbl.c.changeid.in_(batch))
+            for r in conn.execute(query):
+                byid[r.changeid]['files'].append(r.filename)
 
         # and properties must be given without a source, so strip that, but
         # be flexible in case users have used a development version where the
@@ -289,14 +329,14 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
                 v, s = vs, "Change"
             return v, s
 
-        query = change_properties_tbl.select(
-            whereclause=(change_properties_tbl.c.changeid == ch_row.changeid))
-        rows = conn.execute(query)
-        for r in rows:
-            try:
-                v, s = split_vs(json.loads(r.property_value))
-                chdict['properties'][r.property_name] = (v, s)
-            except ValueError:
-                pass
-
-        return chdict
+        for batch in batches():
+            query = change_properties_tbl.select(
+                whereclause=change_properties_tbl.c.changeid.in_(batch))
+            for r in conn.execute(query):
+                try:
+                    v, s = split_vs(json.loads(r.property_value))
+                    byid[r.changeid]['properties'][r.property_name] = (v, s)
+                except ValueError:
+                    pass
+
+        return chdicts
@@ -121,6 +121,12 @@ class DBConnector(config.ReconfigurableServiceMixin, service.AsyncMultiService):
 
         return d
 
+    @defer.inlineCallbacks
+    def stopService(self):
+        # write out any log content still waiting to be batched
+        yield self.logs.flushAppends()
+        yield service.AsyncMultiService.stopService(self)
+
     def reconfigService(self, new_config):
         # double-check -- the master ensures this in config checks
         assert self.configured_url == new_config.db['db_url']
@@ -139,5 +145,13 @@ class DBConnector(config.ReconfigurableServiceMixin, service.AsyncMultiService):
             return
 
         d = self.changes.pruneChanges(self.master.config.changeHorizon)
+
+        # pruning produces no events, so the cached results listing changes
+        # must be dropped explicitly
+        @d.addCallback
+        def pruned(_):
+            self.master.data.resultCache.invalidatePrefix(('changes',))
         d.addErrback(log.err, 'while pruning changes')
+        d.addCallback(lambda _: self.logs.compressFinishedLogs())
+        d.addErrback(log.err, 'while compressing logs')
         return d
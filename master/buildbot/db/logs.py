@@ -13,12 +13,237 @@
 #
 # Copyright Buildbot Team Members
 
+import array
+import bz2
+import mmap
+import os
 import sqlalchemy as sa
+import threading
+import zlib
 
 from buildbot.db import base
+from buildbot.util import lru
 from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.python import failure
 from twisted.python import log
 
+try:
+    import lz4
+    assert lz4
+except ImportError:
+    lz4 = None
+
+
+def dumps_raw(data):
+    return data
+
+
+def read_raw(data):
+    return data
+
+
+def dumps_lz4(data):
+    return lz4.dumps(data)
+
+
+def read_lz4(data):
+    return lz4.loads(data)
+
+
+# Compression methods for log chunks, keyed by the name used in
+# c['logCompressionMethod'].  The 'id' is what is stored in the 'compressed'
+# column of the logchunks table, and must never change.
+COMPRESSION_MODE = {
+    'raw': dict(id=0, dumps=dumps_raw, read=read_raw),
+    'gz': dict(id=1, dumps=zlib.compress, read=zlib.decompress),
+    'bz2': dict(id=2, dumps=bz2.compress, read=bz2.decompress),
+    'lz4': dict(id=3, dumps=dumps_lz4, read=read_lz4),
+}
+COMPRESSION_BYID = dict((m['id'], m) for m in COMPRESSION_MODE.itervalues())
+
+
+class DBLogStorage(object):
+
+    """
+    Log content storage in the C{logchunks} table, where finished logs are
+    compressed.  This is the default.
+
+    Storage methods whose names begin with C{thd} run in a DB thread, with
+    the given connection.
+    """
+
+    compressible = True
+
+    def __init__(self, component):
+        self.component = component
+        self.db = component.db
+        self.master = component.master
+
+    def thdAddChunks(self, conn, chunks):
+        conn.execute(self.db.model.logchunks.insert(),
+                     [dict(chunk, compressed=0) for chunk in chunks])
+
+    def thdGetChunks(self, conn, logid, first_line, last_line):
+        # get a set of chunks that completely cover the requested range
+        tbl = self.db.model.logchunks
+        q = sa.select([tbl.c.first_line, tbl.c.last_line,
+                       tbl.c.content, tbl.c.compressed])
+        q = q.where(tbl.c.logid == logid)
+        q = q.where(tbl.c.first_line <= last_line)
+        q = q.where(tbl.c.last_line >= first_line)
+        q = q.order_by(tbl.c.first_line)
+        return [(row.first_line, row.last_line, self._readChunk(row))
+                for row in conn.execute(q).fetchall()]
+
+    def thdCompressLog(self, conn, logid):
+        tbl = self.db.model.logchunks
+        q = sa.select([tbl.c.first_line, tbl.c.last_line,
+                       tbl.c.content, tbl.c.compressed])
+        q = q.where(tbl.c.logid == logid)
+        q = q.order_by(tbl.c.first_line)
+
+        # gather adjacent chunks into groups whose uncompressed content
+        # still fits in a single chunk
+        groups = []
+        group = None
+        for row in conn.execute(q):
+            content = self._readChunk(row)
+            if group is None or \
+                    group['size'] + 1 + len(content) > \
+                    self.component.MAX_CHUNK_SIZE:
+                group = dict(first_line=row.first_line, size=-1,
+                             contents=[], rows=[])
+                groups.append(group)
+            group['last_line'] = row.last_line
+            group['size'] += 1 + len(content)
+            group['contents'].append(content)
+            group['rows'].append(row)
+
+        saved = 0
+        for group in groups:
+            content = '\n'.join(group['contents'])
+            content, compressed = self._compressChunk(content)
+            oldsize = sum(len(row.content) for row in group['rows'])
+            # leave alone single chunks that we can't make any smaller
+            if len(group['rows']) == 1 and len(content) >= oldsize:
+                continue
+            saved += oldsize - len(content)
+
+            # replace the old chunks in a transaction, so that readers
+            # never see the gap
+            transaction = conn.begin()
+            try:
+                conn.execute(tbl.delete(whereclause=(
+                    (tbl.c.logid == logid) &
+                    (tbl.c.first_line >= group['first_line']) &
+                    (tbl.c.last_line <= group['last_line']))))
+                conn.execute(tbl.insert(),
+                             dict(logid=logid,
+                                  first_line=group['first_line'],
+                                  last_line=group['last_line'],
+                                  content=content, compressed=compressed))
+                transaction.commit()
+            except:
+                transaction.rollback()
+                raise
+        return saved
+
+    def _compressChunk(self, content):
+        """
+        Compress CONTENT with the configured compression method, returning
+        the compressed content and the value for the 'compressed' column.
+        Content that does not get any smaller is returned unchanged.
+        """
+        mode = COMPRESSION_MODE[self.master.config.logCompressionMethod]
+        compressed = mode['dumps'](content)
+        if len(compressed) < len(content):
+            return compressed, mode['id']
+        return content, COMPRESSION_MODE['raw']['id']
+
+    def _readChunk(self, row):
+        return COMPRESSION_BYID[row.compressed]['read'](row.content)
+
+
+class FileLogStorage(object):
+
+    """
+    Log content storage in append-only files, one per log, under
+    C{logdir}.  Only the location of each chunk is kept in the database, in
+    the C{logsegments} table, and the files are read through C{mmap}.
+    Content stored this way is never compressed.
+    """
+
+    compressible = False
+
+    def __init__(self, component, logdir):
+        self.component = component
+        self.db = component.db
+        self.logdir = logdir
+
+    def getFilename(self, logid):
+        # spread the files over subdirectories of a thousand logs each
+        return os.path.join(self.logdir, str(logid // 1000),
+                            '%d.log' % (logid,))
+
+    def thdAddChunks(self, conn, chunks):
+        bylog = {}
+        for chunk in chunks:
+            bylog.setdefault(chunk['logid'], []).append(chunk)
+
+        segments = []
+        for logid, logchunks in bylog.iteritems():
+            filename = self.getFilename(logid)
+            dirname = os.path.dirname(filename)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            f = open(filename, 'ab')
+            try:
+                # content left over from a failed write is simply skipped
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                for chunk in logchunks:
+                    f.write(chunk['content'])
+                    segments.append(dict(logid=logid,
+                                         first_line=chunk['first_line'],
+                                         last_line=chunk['last_line'],
+                                         offset=offset,
+                                         length=len(chunk['content'])))
+                    offset += len(chunk['content'])
+            finally:
+                f.close()
+        conn.execute(self.db.model.logsegments.insert(), segments)
+
+    def thdGetChunks(self, conn, logid, first_line, last_line):
+        tbl = self.db.model.logsegments
+        q = sa.select([tbl.c.first_line, tbl.c.last_line,
+                       tbl.c.offset, tbl.c.length])
+        q = q.where(tbl.c.logid == logid)
+        q = q.where(tbl.c.first_line <= last_line)
+        q = q.where(tbl.c.last_line >= first_line)
+        q = q.order_by(tbl.c.first_line)
+        rows = conn.execute(q).fetchall()
+        if not rows:
+            return []
+
+        f = open(self.getFilename(logid), 'rb')
+        try:
+            if os.fstat(f.fileno()).st_size == 0:
+                # only empty lines, and mmap can't map an empty file
+                return [(row.first_line, row.last_line, '') for row in rows]
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        try:
+            return [(row.first_line, row.last_line,
+                     m[row.offset:row.offset + row.length])
+                    for row in rows]
+        finally:
+            m.close()
+
+    def thdCompressLog(self, conn, logid):
+        return 0
+
 
 class LogsConnectorComponent(base.DBConnectorComponent):
 
@@ -26,6 +251,63 @@ class LogsConnectorComponent(base.DBConnectorComponent):
     # for MySQL appears to be max_packet_size (default 1M).
     MAX_CHUNK_SIZE = 65536
 
+    # number of finished logs compressFinishedLogs fetches at a time
+    COMPRESS_BATCH_SIZE = 100
+
+    # highest logid already handled by compressFinishedLogs; this is not
+    # kept across restarts, so the first call after a restart looks at every
+    # finished log that still has uncompressed chunks
+    _compressedUpToLogid = 0
+
+    # default number of chunk line-offset indexes kept in memory; this can be
+    # changed with c['caches']['logchunkoffsets']
+    DEFAULT_OFFSETS_CACHE_SIZE = 100
+
+    # appended content is written to the database in batches: a batch is
+    # written once it has waited this many seconds, or as soon as it holds
+    # this many bytes
+    APPEND_BATCH_DELAY = 0.05
+    APPEND_BATCH_SIZE = 4 * MAX_CHUNK_SIZE
+
+    def __init__(self, connector):
+        base.DBConnectorComponent.__init__(self, connector)
+
+        # pending appends, as (logid, content, deferred), in call order
+        self._appendQueue = []
+        self._appendQueueSize = 0
+        self._appendTimer = None
+        # held while a batch is being written, so batches are never written
+        # concurrently
+        self._appendLock = defer.DeferredLock()
+        # number of lines in each log being appended to, only used while
+        # holding _appendLock
+        self._numLines = {}
+        # for tests
+        self._reactor = reactor
+
+        # line-offset indexes are built and used in DB threads, so the cache
+        # is protected by a lock
+        self._lineOffsets = lru.LRUCache(self._thdMakeLineOffsets,
+                                         self.DEFAULT_OFFSETS_CACHE_SIZE)
+        self._lineOffsetsLock = threading.Lock()
+
+        # set up on first use, once the configuration is loaded
+        self._storage = None
+
+    def getStorage(self):
+        """
+        Get the log content storage selected by c['db']['log_storage'].
+        """
+        if self._storage is None:
+            dbconfig = self.master.config.db
+            if dbconfig.get('log_storage', 'db') == 'files':
+                logdir = os.path.join(self.db.basedir,
+                                      dbconfig.get('log_dir', 'logs'))
+                self._storage = FileLogStorage(self, logdir)
+            else:
+                self._storage = DBLogStorage(self)
+        return self._storage
+
     def _getLog(self, whereclause):
         def thd(conn):
             q = self.db.model.logs.select(whereclause=whereclause)
@@ -57,35 +339,46 @@ class LogsConnectorComponent(base.DBConnectorComponent):
         return self.db.pool.do(thd)
 
     def getLogLines(self, logid, first_line, last_line):
+        storage = self.getStorage()
+
         def thd(conn):
-            # get a set of chunks that completely cover the requested range
-            tbl = self.db.model.logchunks
-            q = sa.select([tbl.c.first_line, tbl.c.last_line,
-                           tbl.c.content, tbl.c.compressed])
-            q = q.where(tbl.c.logid == logid)
-            q = q.where(tbl.c.first_line <= last_line)
-            q = q.where(tbl.c.last_line >= first_line)
-            q = q.order_by(tbl.c.first_line)
+            chunks = storage.thdGetChunks(conn, logid, first_line, last_line)
             rv = []
-            for row in conn.execute(q):
-                assert not row.compressed, "compressed rows not supported yet"
-                content = row.content.decode('utf-8')
-                if row.first_line < first_line:
-                    idx = -1
-                    count = first_line - row.first_line
-                    for _ in xrange(count):
-                        idx = content.index('\n', idx + 1)
-                    content = content[idx + 1:]
-                if row.last_line > last_line:
-                    idx = len(content) + 1
-                    count = row.last_line - last_line
-                    for _ in xrange(count):
-                        idx = content.rindex('\n', 0, idx - 1)
-                    content = content[:idx]
-                rv.append(content)
+            for chunk_first_line, chunk_last_line, content in chunks:
+                if chunk_first_line < first_line or \
+                        chunk_last_line > last_line:
+                    # slice the requested lines out of this boundary chunk
+                    # using its line-offset index
+                    offsets = self._thdGetLineOffsets(
+                        (logid, chunk_first_line, chunk_last_line), content)
+                    start = max(first_line - chunk_first_line, 0)
+                    end = min(last_line, chunk_last_line) - \
+                        chunk_first_line + 1
+                    content = content[offsets[start]:offsets[end] - 1]
+                rv.append(content.decode('utf-8'))
             return u'\n'.join(rv) + u'\n' if rv else u''
         return self.db.pool.do(thd)
 
+    def _thdGetLineOffsets(self, key, content):
+        cache = self._lineOffsets
+        with self._lineOffsetsLock:
+            cache.set_max_size(self.master.config.caches.get(
+                'logchunkoffsets', self.DEFAULT_OFFSETS_CACHE_SIZE))
+            return cache.get(key, content=content)
+
+    def _thdMakeLineOffsets(self, key, content):
+        """
+        Build the line-offset index for a chunk's uncompressed CONTENT: entry
+        I is the byte offset of the chunk's I'th line, and a final entry points
+        just past the end of the content, as if it ended with a newline.
+        """
+        offsets = array.array('I', [0])
+        pos = 0
+        for line in content.split('\n'):
+            pos += len(line) + 1
+            offsets.append(pos)
+        return offsets
+
     def addLog(self, stepid, name, slug, type):
         assert type in 'tsh', "Log type must be one of t, s, or h"
 
@@ -104,36 +397,107 @@ class LogsConnectorComponent(base.DBConnectorComponent):
         # check for trailing newline and strip it for storage -- chunks omit
         # the trailing newline
         assert content[-1] == u'\n'
-        content = content[:-1]
+        content = content[:-1].encode('utf-8')
 
-        def thd(conn):
-            q = sa.select([self.db.model.logs.c.num_lines])
-            q = q.where(self.db.model.logs.c.id == logid)
-            res = conn.execute(q)
-            row = res.fetchone()
-            res.close()
-            if not row:
-                return  # ignore a missing log
+        # set up the storage here, rather than in a DB thread
+        self.getStorage()
 
-            # Break the content up into chunks.  This takes advantage of the
-            # fact that no character but u'\n' maps to b'\n' in UTF-8.
+        # queue the content to be written with the next batch; the position
+        # in the queue determines the line numbers
+        d = defer.Deferred()
+        self._appendQueue.append((logid, content, d))
+        self._appendQueueSize += len(content) + 1
+        if self._appendQueueSize >= self.APPEND_BATCH_SIZE:
+            self.flushAppends()
+        elif not self._appendTimer:
+            self._appendTimer = self._reactor.callLater(
+                self.APPEND_BATCH_DELAY, self.flushAppends)
+        return d
 
-            first_line = chunk_first_line = row[0]
-            remaining = content.encode('utf-8')
-            while remaining:
-                chunk, remaining = self._splitBigChunk(remaining, logid)
+    @defer.inlineCallbacks
+    def flushAppends(self):
+        if self._appendTimer:
+            if self._appendTimer.active():
+                self._appendTimer.cancel()
+            self._appendTimer = None
+
+        yield self._appendLock.acquire()
+        queue, self._appendQueue = self._appendQueue, []
+        self._appendQueueSize = 0
+        results = error = None
+        try:
+            if queue:
+                results = yield self.db.pool.do(self._thdAppendBatch, queue)
+        except Exception:
+            error = failure.Failure()
+        self._appendLock.release()
+
+        # fire the callers' deferreds only after releasing the lock, as they
+        # may well append more content
+        for i, (_, _, d) in enumerate(queue):
+            if error:
+                d.errback(error)
+            else:
+                d.callback(results[i])
+
+    def _thdAppendBatch(self, conn, queue):
+        logs_tbl = self.db.model.logs
+
+        # the new number of lines of each log is only kept once it is
+        # committed, so that a failed batch leaves no gap in the line numbers
+        logids = set(logid for logid, _, _ in queue)
+        numLines = dict((logid, self._numLines[logid])
+                        for logid in logids if logid in self._numLines)
 
+        # find the current length of any logs we have not seen yet
+        unknown = logids - set(numLines)
+        if unknown:
+            q = sa.select([logs_tbl.c.id, logs_tbl.c.num_lines])
+            q = q.where(logs_tbl.c.id.in_(unknown))
+            for row in conn.execute(q).fetchall():
+                numLines[row.id] = row.num_lines
+
+        # assign line numbers to each append, in order, and gather the
+        # content for each log, along with its first line number
+        results = []
+        contents = {}
+        for logid, content, _ in queue:
+            if logid not in numLines:
+                results.append(None)  # ignore a missing log
+                continue
+            first_line = numLines[logid]
+            last_line = first_line + content.count('\n')
+            numLines[logid] = last_line + 1
+            results.append((first_line, last_line))
+            contents.setdefault(logid, (first_line, []))[1].append(content)
+
+        # Break each log's content up into chunks.  This takes advantage of
+        # the fact that no character but u'\n' maps to b'\n' in UTF-8.
+        chunks = []
+        for logid, (chunk_first_line, content) in contents.iteritems():
+            remaining = '\n'.join(content)
+            while remaining is not None:
+                chunk, remaining = self._splitBigChunk(remaining, logid)
                 last_line = chunk_first_line + chunk.count('\n')
-                conn.execute(self.db.model.logchunks.insert(),
-                             dict(logid=logid, first_line=chunk_first_line,
-                                  last_line=last_line, content=chunk,
-                                  compressed=0))
+                chunks.append(dict(logid=logid, first_line=chunk_first_line,
+                                   last_line=last_line, content=chunk))
                 chunk_first_line = last_line + 1
 
-            conn.execute(self.db.model.logs.update(whereclause=(self.db.model.logs.c.id == logid)),
-                         num_lines=last_line + 1)
-            return (first_line, last_line)
-        return self.db.pool.do(thd)
+        if chunks:
+            transaction = conn.begin()
+            try:
+                self.getStorage().thdAddChunks(conn, chunks)
+                q = logs_tbl.update(
+                    whereclause=(logs_tbl.c.id == sa.bindparam('_logid')))
+                conn.execute(q.values(num_lines=sa.bindparam('num_lines')),
+                             [dict(_logid=logid, num_lines=numLines[logid])
+                              for logid in contents])
+                transaction.commit()
+            except:
+                transaction.rollback()
+                raise
+        self._numLines.update(numLines)
+        return results
 
     def _splitBigChunk(self, content, logid):
         """
@@ -167,16 +531,50 @@ class LogsConnectorComponent(base.DBConnectorComponent):
         else:
             return truncline, content[i + 1:]
 
+    @defer.inlineCallbacks
     def finishLog(self, logid):
+        # make sure everything appended so far is written first
+        yield self.flushAppends()
+
         def thd(conn):
             tbl = self.db.model.logs
             q = tbl.update(whereclause=(tbl.c.id == logid))
             conn.execute(q, complete=1)
-        return self.db.pool.do(thd)
+        yield self.db.pool.do(thd)
+        yield self._appendLock.run(self._numLines.pop, logid, None)
 
     def compressLog(self, logid):
-        # TODO: compression not supported yet
-        return defer.succeed(None)
+        return self.db.pool.do(self.getStorage().thdCompressLog, logid)
+
+    @defer.inlineCallbacks
+    def compressFinishedLogs(self):
+        if not self.getStorage().compressible:
+            defer.returnValue(0)
+
+        def thd(conn):
+            tbl = self.db.model.logs
+            chunks_tbl = self.db.model.logchunks
+            uncompressed = sa.select([chunks_tbl.c.logid],
+                                     whereclause=(chunks_tbl.c.compressed == 0))
+            q = sa.select([tbl.c.id])
+            q = q.where(tbl.c.complete == 1)
+            q = q.where(tbl.c.id > self._compressedUpToLogid)
+            q = q.where(tbl.c.id.in_(uncompressed))
+            q = q.order_by(tbl.c.id)
+            q = q.limit(self.COMPRESS_BATCH_SIZE)
+            return [row.id for row in conn.execute(q).fetchall()]
+
+        # handle all of the finished logs, a batch at a time, so that a
+        # backlog is cleared in one call
+        saved = 0
+        while True:
+            logids = yield self.db.pool.do(thd)
+            for logid in logids:
+                saved += yield self.compressLog(logid)
+                self._compressedUpToLogid = logid
+            if len(logids) < self.COMPRESS_BATCH_SIZE:
+                break
+        defer.returnValue(saved)
 
     def _logdictFromRow(self, row):
         rv = dict(row)
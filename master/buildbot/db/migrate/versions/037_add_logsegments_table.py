@@ -0,0 +1,46 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import sqlalchemy as sa
+
+
+def upgrade(migrate_engine):
+
+    metadata = sa.MetaData()
+    metadata.bind = migrate_engine
+
+    sa.Table('logs', metadata,
+             sa.Column('id', sa.Integer, primary_key=True),
+             # ..
+             )
+
+    logsegments = sa.Table('logsegments', metadata,
+                           sa.Column('logid', sa.Integer, sa.ForeignKey('logs.id')),
+                           sa.Column('first_line', sa.Integer, nullable=False),
+                           sa.Column('last_line', sa.Integer, nullable=False),
+                           sa.Column('offset', sa.BigInteger, nullable=False),
+                           sa.Column('length', sa.Integer, nullable=False),
+                           )
+
+    # create the new table
+    logsegments.create()
+
+    # and the indices
+    idx = sa.Index('logsegments_firstline', logsegments.c.logid,
+                   logsegments.c.first_line)
+    idx.create()
+    idx = sa.Index('logsegments_lastline', logsegments.c.logid,
+                   logsegments.c.last_line)
+    idx.create()
@@ -154,12 +154,26 @@ class Model(base.DBConnectorComponent):
                          # HTML logs, this counts lines of HTML, not lines of rendered output
                          sa.Column('first_line', sa.Integer, nullable=False),
                          sa.Column('last_line', sa.Integer, nullable=False),
-                         # log contents, including a terminating newline, encoded in utf-8 or,
-                         # if 'compressed' is true, compressed with gzip
+                         # log contents, without a terminating newline, encoded in utf-8 and
+                         # then compressed as indicated by 'compressed': 0 = uncompressed,
+                         # 1 = gzip, 2 = bz2, 3 = lz4; see buildbot.db.logs
                          sa.Column('content', sa.LargeBinary(65536)),
                          sa.Column('compressed', sa.SmallInteger, nullable=False),
                          )
 
+    # location of log content stored in files, rather than in logchunks, when
+    # c['db']['log_storage'] is 'files'; each row describes a chunk of
+    # utf-8 encoded lines, without a terminating newline
+    logsegments = sa.Table('logsegments', metadata,
+                           sa.Column('logid', sa.Integer, sa.ForeignKey('logs.id')),
+                           # 0-based line number range in this chunk (inclusive)
+                           sa.Column('first_line', sa.Integer, nullable=False),
+                           sa.Column('last_line', sa.Integer, nullable=False),
+                           # byte offset and length of the chunk in the log's file
+                           sa.Column('offset', sa.BigInteger, nullable=False),
+                           sa.Column('length', sa.Integer, nullable=False),
+                           )
+
     # buildsets
 
     # This table contains input properties for buildsets
@@ -616,6 +630,10 @@ class Model(base.DBConnectorComponent):
     sa.Index('logs_slug', logs.c.stepid, logs.c.slug, unique=True)
     sa.Index('logchunks_firstline', logchunks.c.logid, logchunks.c.first_line)
     sa.Index('logchunks_lastline', logchunks.c.logid, logchunks.c.last_line)
+    sa.Index('logsegments_firstline', logsegments.c.logid,
+             logsegments.c.first_line)
+    sa.Index('logsegments_lastline', logsegments.c.logid,
+             logsegments.c.last_line)
 
     # MySQL creates indexes for foreign keys, and these appear in the
     # reflection.  This is a list of (table, index) names that should be
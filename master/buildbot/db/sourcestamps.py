@@ -95,10 +95,13 @@ class SourceStampsConnectorComponent(base.DBConnectorComponent):
             return ssdict
         return self.db.pool.do(thd)
 
-    def getSourceStamps(self):
+    def getSourceStamps(self, resultSpec=None):
         def thd(conn):
             tbl = self.db.model.sourcestamps
             q = tbl.select()
+            if resultSpec is not None:
+                return resultSpec.thd_execute(
+                    conn, q, lambda row: self._rowToSsdict_thd(conn, row))
             res = conn.execute(q)
             return [self._rowToSsdict_thd(conn, row)
                     for row in res.fetchall()]
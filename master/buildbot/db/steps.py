@@ -53,12 +53,14 @@ class StepsConnectorComponent(base.DBConnectorComponent):
             return rv
         return self.db.pool.do(thd)
 
-    def getSteps(self, buildid):
+    def getSteps(self, buildid, resultSpec=None):
         def thd(conn):
             tbl = self.db.model.steps
             q = tbl.select()
             q = q.where(tbl.c.buildid == buildid)
             q = q.order_by(tbl.c.number)
+            if resultSpec is not None:
+                return resultSpec.thd_execute(conn, q, self._stepdictFromRow)
             res = conn.execute(q)
             return [self._stepdictFromRow(row) for row in res.fetchall()]
         return self.db.pool.do(thd)
@@ -169,6 +171,11 @@ class StepsConnectorComponent(base.DBConnectorComponent):
             if epoch:
                 return epoch2datetime(epoch)
 
+        def loads(json_str):
+            # None if the column was not selected
+            if json_str is not None:
+                return json.loads(json_str)
+
         return dict(
             id=row.id,
             number=row.number,
@@ -176,6 +183,6 @@ class StepsConnectorComponent(base.DBConnectorComponent):
             buildid=row.buildid,
             started_at=mkdt(row.started_at),
             complete_at=mkdt(row.complete_at),
-            state_strings=json.loads(row.state_strings_json),
+            state_strings=loads(row.state_strings_json),
             results=row.results,
-            urls=json.loads(row.urls_json))
+            urls=loads(row.urls_json))
@@ -371,6 +371,14 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.AsyncMultiService):
                 "Cannot change c['db']['db_url'] after the master has started",
             )
 
+        for key, default in [('log_storage', 'db'), ('log_dir', 'logs')]:
+            if self.config.db.get(key, default) != \
+                    new_config.db.get(key, default):
+                raise config.ConfigErrors([
+                    "Cannot change c['db'][%r] after the master has started"
+                    % (key,),
+                ])
+
         if self.config.mq['type'] != new_config.mq['type']:
             raise config.ConfigErrors([
                 "Cannot change c['mq']['type'] after the master has started",
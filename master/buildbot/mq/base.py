@@ -19,6 +19,16 @@ from twisted.python import failure
 from twisted.python import log
 
 
+# the ways in which a consumer's queue of undelivered messages can overflow:
+# 'block' makes the producer deliver the queued messages itself, 'drop-oldest'
+# discards the oldest message, and 'coalesce' replaces any queued message with
+# the same routing key, and otherwise discards the oldest message
+OVERFLOW_POLICIES = ('block', 'drop-oldest', 'coalesce')
+
+# the default maximum number of undelivered messages for each consumer
+DEFAULT_QUEUE_SIZE = 1000
+
+
 class MQBase(service.AsyncService):
 
     def __init__(self, master):
@@ -45,6 +55,12 @@ class QueueRef(object):
         if isinstance(x, defer.Deferred):
             x.addErrback(log.err, 'while invoking %r' % (self.callback,))
 
+    def setDelivery(self, overflow=None, queueSize=None):
+        # set the overflow policy (one of OVERFLOW_POLICIES) and maximum size
+        # of this consumer's queue of undelivered messages; implementations
+        # which deliver messages synchronously can ignore this
+        pass
+
     def stopConsuming(self):
         # subclasses should set self.callback to None in this method
         raise NotImplementedError
@@ -0,0 +1,240 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import collections
+import datetime
+import uuid
+
+from buildbot.util import datetime2epoch
+from buildbot.util import epoch2datetime
+from buildbot.util import json
+from buildbot.util import tuplematch
+from twisted.internet import protocol
+from twisted.internet import reactor
+from twisted.protocols import basic
+from twisted.python import log
+
+# The broker relays messages between the masters of a multi-master
+# installation, routing them on the same routing-key filters as the MQ API.
+#
+# Each frame on the wire is a 32-bit big-endian length followed by a
+# JSON-encoded list of operations, so that all of the operations produced in
+# a reactor turn travel together.  Each operation is a list starting with its
+# name.  From the client to the broker:
+#
+#   ['sub', filter]                   deliver messages matching filter
+#   ['unsub', filter]                 stop delivering them
+#   ['resume', epoch, seq]            replay the matching messages after seq,
+#                                     if the broker is still in that epoch
+#   ['pub', routingKey, data, origin] publish a message, with its body
+#                                     encoded by encodeBody; origin, which
+#                                     is optional, identifies the publisher
+#
+# and from the broker to the client:
+#
+#   ['welcome', epoch, seq, complete] reply to 'resume', giving the broker's
+#                                     epoch and latest sequence number;
+#                                     complete is false if messages since the
+#                                     client's seq were lost
+#   ['msg', seq, routingKey, data, origin]
+#                                     a message matching the client's
+#                                     filters, with the origin it was
+#                                     published with, if any
+#
+# Clients do not wait for replies, so any number of operations can be in
+# flight at once.
+
+# the number of messages the broker keeps for replay to reconnecting clients
+DEFAULT_HISTORY_SIZE = 10000
+
+
+# JSON has no datetimes or tuples, so message bodies are sent with those
+# tagged as single-key objects, and untagged on receipt; the masters then see
+# the same types as the master which produced the message.  The broker never
+# looks inside the bodies.
+_DATETIME = '$datetime'
+_TUPLE = '$tuple'
+
+
+def encodeBody(obj):
+    if isinstance(obj, dict):
+        return dict((k, encodeBody(v)) for k, v in obj.iteritems())
+    elif isinstance(obj, list):
+        return [encodeBody(v) for v in obj]
+    elif isinstance(obj, tuple):
+        return {_TUPLE: [encodeBody(v) for v in obj]}
+    elif isinstance(obj, datetime.datetime):
+        return {_DATETIME: datetime2epoch(obj) + obj.microsecond / 1e6}
+    return obj
+
+
+def decodeBody(obj):
+    if isinstance(obj, dict):
+        if len(obj) == 1:
+            if _DATETIME in obj:
+                return epoch2datetime(obj[_DATETIME])
+            elif _TUPLE in obj:
+                return tuple(decodeBody(v) for v in obj[_TUPLE])
+        return dict((k, decodeBody(v)) for k, v in obj.iteritems())
+    elif isinstance(obj, list):
+        return [decodeBody(v) for v in obj]
+    return obj
+
+
+class FramedProtocol(basic.Int32StringReceiver):
+
+    # the largest frame accepted
+    MAX_LENGTH = 64 * 1024 * 1024
+
+    _reactor = reactor
+
+    outgoing = None
+    flushCall = None
+
+    def connectionMade(self):
+        self.outgoing = []
+
+    def connectionLost(self, reason):
+        if self.flushCall:
+            self.flushCall.cancel()
+            self.flushCall = None
+
+    def sendOp(self, op):
+        # queue an operation, to be sent in a frame at the end of this
+        # reactor turn
+        self.outgoing.append(op)
+        if not self.flushCall:
+            self.flushCall = self._reactor.callLater(0, self.flush)
+
+    def flush(self):
+        if self.flushCall and self.flushCall.active():
+            self.flushCall.cancel()
+        self.flushCall = None
+        ops, self.outgoing = self.outgoing, []
+        if ops:
+            self.sendString(json.dumps(ops, separators=(',', ':')))
+
+    def stringReceived(self, frame):
+        try:
+            ops = json.loads(frame)
+        except ValueError:
+            log.msg("invalid frame from %s; disconnecting"
+                    % (self.transport.getPeer(),))
+            self.transport.loseConnection()
+            return
+        for op in ops:
+            handler = getattr(self, 'op_' + op[0], None)
+            if handler is None:
+                log.msg("unknown operation %r from %s"
+                        % (op[0], self.transport.getPeer()))
+                continue
+            handler(*op[1:])
+
+    def lengthLimitExceeded(self, length):
+        log.msg("frame of %d bytes from %s is too long; disconnecting"
+                % (length, self.transport.getPeer()))
+        self.transport.loseConnection()
+
+
+class BrokerProtocol(FramedProtocol):
+
+    def connectionMade(self):
+        FramedProtocol.connectionMade(self)
+        # filter -> number of 'sub' operations for it
+        self.filters = {}
+
+    def connectionLost(self, reason):
+        FramedProtocol.connectionLost(self, reason)
+        for filter in self.filters:
+            self.factory.broker.subscriptions.remove(filter, self)
+        self.filters = {}
+
+    def matches(self, routingKey):
+        for filter in self.filters:
+            if tuplematch.matchTuple(routingKey, filter):
+                return True
+        return False
+
+    def op_sub(self, filter):
+        filter = tuple(filter)
+        if filter not in self.filters:
+            self.filters[filter] = 0
+            self.factory.broker.subscriptions.add(filter, self)
+        self.filters[filter] += 1
+
+    def op_unsub(self, filter):
+        filter = tuple(filter)
+        if filter not in self.filters:
+            return
+        self.filters[filter] -= 1
+        if not self.filters[filter]:
+            del self.filters[filter]
+            self.factory.broker.subscriptions.remove(filter, self)
+
+    def op_resume(self, epoch, seq):
+        self.factory.broker.resume(self, epoch, seq)
+
+    def op_pub(self, routingKey, data, origin=None):
+        self.factory.broker.publish(tuple(routingKey), data, origin)
+
+
+class Broker(object):
+
+    def __init__(self, historySize=DEFAULT_HISTORY_SIZE):
+        # identifies this run of the broker, so that a client reconnecting to
+        # a restarted broker does not ask for sequence numbers it never used
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+        self.history = collections.deque(maxlen=historySize)
+        self.subscriptions = tuplematch.TupleIndex()
+
+    def publish(self, routingKey, data, origin=None):
+        self.seq += 1
+        self.history.append((self.seq, routingKey, data, origin))
+        op = self._msgOp(self.seq, routingKey, data, origin)
+        sent = set()
+        for conn in self.subscriptions.match(routingKey):
+            # a connection subscribed with overlapping filters gets one copy
+            if conn not in sent:
+                sent.add(conn)
+                conn.sendOp(op)
+
+    def resume(self, conn, epoch, seq):
+        if epoch is None:
+            # a new client, with nothing to replay
+            conn.sendOp(['welcome', self.epoch, self.seq, True])
+            return
+        if epoch != self.epoch:
+            conn.sendOp(['welcome', self.epoch, self.seq, False])
+            return
+        oldest = self.history[0][0] if self.history else self.seq + 1
+        conn.sendOp(['welcome', self.epoch, self.seq, seq + 1 >= oldest])
+        for msg_seq, routingKey, data, origin in self.history:
+            if msg_seq > seq and conn.matches(routingKey):
+                conn.sendOp(self._msgOp(msg_seq, routingKey, data, origin))
+
+    def _msgOp(self, seq, routingKey, data, origin):
+        op = ['msg', seq, routingKey, data]
+        if origin is not None:
+            op.append(origin)
+        return op
+
+
+class BrokerFactory(protocol.ServerFactory):
+
+    protocol = BrokerProtocol
+
+    def __init__(self, broker):
+        self.broker = broker
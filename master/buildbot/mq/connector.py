@@ -23,7 +23,11 @@ class MQConnector(config.ReconfigurableServiceMixin, service.AsyncMultiService):
     classes = {
         'simple': {
             'class': "buildbot.mq.simple.SimpleMQ",
-            'keys': set(['debug']),
+            'keys': set(['debug', 'queue_size', 'overflow']),
+        },
+        'network': {
+            'class': "buildbot.mq.network.NetworkMQ",
+            'keys': set(['debug', 'queue_size', 'overflow', 'broker']),
         },
     }
 
@@ -0,0 +1,238 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import collections
+import uuid
+
+from buildbot.mq import broker
+from buildbot.mq import simple
+from buildbot.process import metrics
+from twisted.internet import defer
+from twisted.internet import endpoints
+from twisted.internet import protocol
+from twisted.python import log
+
+
+class ClientProtocol(broker.FramedProtocol):
+
+    def connectionMade(self):
+        broker.FramedProtocol.connectionMade(self)
+        self.factory.mq.connected(self)
+
+    def connectionLost(self, reason):
+        broker.FramedProtocol.connectionLost(self, reason)
+        # operations that were never sent are sent again on reconnection
+        unsent = [op[1:3] for op in self.outgoing if op[0] == 'pub']
+        self.outgoing = []
+        self.factory.mq.disconnected(self, reason, unsent)
+
+    def op_welcome(self, epoch, seq, complete):
+        self.factory.mq.welcomed(epoch, seq, complete)
+
+    def op_msg(self, seq, routingKey, data, origin=None):
+        self.factory.mq.messageReceived(seq, tuple(routingKey),
+                                        broker.decodeBody(data), origin)
+
+
+class ClientFactory(protocol.Factory):
+
+    protocol = ClientProtocol
+
+    def __init__(self, mq):
+        self.mq = mq
+
+
+class NetworkMQ(simple.SimpleMQ):
+
+    """
+    An MQ implementation which relays messages through a broker (see
+    L{buildbot.mq.broker}), so that every master sees the messages produced
+    by the others.  The messages produced on this master are delivered to
+    its consumers at once, as by L{SimpleMQ}, whether or not the broker is
+    reachable; they are tagged with this master's origin, so that they are
+    not delivered again when the broker relays them back.
+    """
+
+    # the delay before reconnecting to the broker grows from INITIAL_DELAY
+    # to MAX_DELAY
+    INITIAL_DELAY = 0.5
+    MAX_DELAY = 30
+
+    # the number of messages kept for the other masters while disconnected
+    # from the broker
+    MAX_UNSENT = 10000
+
+    def __init__(self, master):
+        simple.SimpleMQ.__init__(self, master)
+        # identifies the messages published by this master
+        self.origin = uuid.uuid4().hex
+        self.brokerAddress = None
+        self.protocol = None
+        self.connecting = None
+        self.connectCall = None
+        self.delay = self.INITIAL_DELAY
+        # filter -> number of consumers, for the subscriptions at the broker
+        self.filterCounts = {}
+        # messages produced while disconnected, with their bodies encoded
+        self.unsent = collections.deque(maxlen=self.MAX_UNSENT)
+        # the broker's epoch and the sequence number of the latest message
+        # received, to replay the messages missed while disconnected
+        self.epoch = None
+        self.lastSeq = 0
+        # true once the broker has replied to the latest 'resume'
+        self.resumed = False
+        self.connectedDeferreds = []
+        self.disconnectedDeferreds = []
+
+    def reconfigService(self, new_config):
+        broker_address = new_config.mq['broker']
+        if self.brokerAddress is None:
+            self.brokerAddress = broker_address
+        elif broker_address != self.brokerAddress:
+            log.msg("NetworkMQ: changing c['mq']['broker'] requires a "
+                    "restart of the master")
+        return simple.SimpleMQ.reconfigService(self, new_config)
+
+    def startService(self):
+        self.endpoint = endpoints.clientFromString(self._reactor,
+                                                   self.brokerAddress)
+        simple.SimpleMQ.startService(self)
+        self.connect()
+
+    def stopService(self):
+        simple.SimpleMQ.stopService(self)
+        if self.connectCall:
+            self.connectCall.cancel()
+            self.connectCall = None
+        if self.connecting:
+            self.connecting.cancel()
+        if not self.protocol:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self.disconnectedDeferreds.append(d)
+        self.protocol.flush()
+        self.protocol.transport.loseConnection()
+        return d
+
+    def whenConnected(self):
+        # fire when connected to the broker and caught up with the messages
+        # missed while disconnected
+        if self.protocol and self.resumed:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self.connectedDeferreds.append(d)
+        return d
+
+    # connection handling
+
+    def connect(self):
+        self.connectCall = None
+        self.connecting = d = self.endpoint.connect(ClientFactory(self))
+
+        @d.addBoth
+        def done(res):
+            self.connecting = None
+            return res
+
+        @d.addErrback
+        def failed(why):
+            if why.check(defer.CancelledError):
+                return
+            log.msg("NetworkMQ: could not connect to the broker at %s: %s"
+                    % (self.brokerAddress, why.getErrorMessage()))
+            self.reconnect()
+
+    def reconnect(self):
+        if not self.running:
+            return
+        self.connectCall = self._reactor.callLater(self.delay, self.connect)
+        self.delay = min(self.delay * 2, self.MAX_DELAY)
+
+    def connected(self, protocol):
+        if not self.running:
+            protocol.transport.loseConnection()
+            return
+        log.msg("NetworkMQ: connected to the broker at %s"
+                % (self.brokerAddress,))
+        self.protocol = protocol
+        self.resumed = False
+        self.delay = self.INITIAL_DELAY
+        for filter in self.filterCounts:
+            protocol.sendOp(['sub', filter])
+        protocol.sendOp(['resume', self.epoch, self.lastSeq])
+        while self.unsent:
+            routingKey, data = self.unsent.popleft()
+            protocol.sendOp(['pub', routingKey, data, self.origin])
+
+    def disconnected(self, protocol, reason, unsent):
+        if protocol is not self.protocol:
+            return
+        self.protocol = None
+        self.unsent.extendleft(reversed(unsent))
+        self.resumed = False
+        if self.running:
+            log.msg("NetworkMQ: lost the connection to the broker: %s"
+                    % (reason.getErrorMessage(),))
+            self.reconnect()
+        dl, self.disconnectedDeferreds = self.disconnectedDeferreds, []
+        for d in dl:
+            d.callback(None)
+
+    def welcomed(self, epoch, seq, complete):
+        if not complete:
+            log.msg("NetworkMQ: some messages produced while disconnected "
+                    "from the broker were lost")
+        self.epoch = epoch
+        self.lastSeq = seq
+        self.resumed = True
+        dl, self.connectedDeferreds = self.connectedDeferreds, []
+        for d in dl:
+            d.callback(None)
+
+    def messageReceived(self, seq, routingKey, data, origin=None):
+        self.lastSeq = max(self.lastSeq, seq)
+        # this master's own messages were delivered when produced
+        if origin == self.origin:
+            return
+        simple.SimpleMQ.produce(self, routingKey, data)
+
+    # MQ interface
+
+    def produce(self, routingKey, data):
+        simple.SimpleMQ.produce(self, routingKey, data)
+        data = broker.encodeBody(data)
+        if self.protocol and not self.protocol.transport.disconnecting:
+            self.protocol.sendOp(['pub', routingKey, data, self.origin])
+        else:
+            if len(self.unsent) == self.unsent.maxlen:
+                metrics.MetricCountEvent.log('NetworkMQ.dropped', 1)
+            self.unsent.append((routingKey, data))
+
+    def addQueueRef(self, qref):
+        simple.SimpleMQ.addQueueRef(self, qref)
+        count = self.filterCounts.get(qref.filter, 0)
+        self.filterCounts[qref.filter] = count + 1
+        if not count and self.protocol:
+            self.protocol.sendOp(['sub', qref.filter])
+
+    def removeQueueRef(self, qref):
+        if not simple.SimpleMQ.removeQueueRef(self, qref):
+            return False
+        self.filterCounts[qref.filter] -= 1
+        if not self.filterCounts[qref.filter]:
+            del self.filterCounts[qref.filter]
+            if self.protocol:
+                self.protocol.sendOp(['unsub', qref.filter])
+        return True
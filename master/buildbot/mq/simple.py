@@ -13,34 +13,62 @@
 #
 # Copyright Buildbot Team Members
 
+
+import itertools
 import pprint
 
 from buildbot import config
 from buildbot.mq import base
+from buildbot.process import metrics
+from buildbot.util import eventual
 from buildbot.util import tuplematch
+from collections import OrderedDict
 from twisted.internet import defer
+from twisted.internet import reactor
 from twisted.python import log
 
 
 class SimpleMQ(config.ReconfigurableServiceMixin, base.MQBase):
 
+    # the number of messages delivered to each consumer in a reactor turn
+    DELIVERIES_PER_TURN = 100
+
+    _reactor = reactor
+
     def __init__(self, master):
         base.MQBase.__init__(self, master)
-        self.qrefs = []
+        # the queue refs, indexed by filter, so that producing a message only
+        # visits the matching ones
+        self.qrefs = tuplematch.TupleIndex()
         self.persistent_qrefs = {}
         self.debug = False
+        self.queueSize = base.DEFAULT_QUEUE_SIZE
+        self.overflow = 'block'
+        # queue refs with messages to deliver, in the order they were queued
+        self.pending = OrderedDict()
+        self.drainScheduled = False
+        # serial numbers for queued messages
+        self.serial = itertools.count()
 
     def reconfigService(self, new_config):
         self.debug = new_config.mq.get('debug', False)
+        self.queueSize = new_config.mq.get('queue_size',
+                                           base.DEFAULT_QUEUE_SIZE)
+        self.overflow = new_config.mq.get('overflow', 'block')
+        # existing consumers which did not choose their own delivery follow
+        # the new configuration
+        for qref in self.qrefs.values():
+            qref.applyDelivery(
+                None if qref.ownOverflow else self.overflow,
+                None if qref.ownQueueSize else self.queueSize)
         return config.ReconfigurableServiceMixin.reconfigService(self,
                                                                  new_config)
 
     def produce(self, routingKey, data):
         if self.debug:
             log.msg("MSG: %s\n%s" % (routingKey, pprint.pformat(data)))
-        for qref in self.qrefs:
-            if tuplematch.matchTuple(routingKey, qref.filter):
-                qref.invoke(routingKey, data)
+        for qref in self.qrefs.match(routingKey):
+            qref.enqueue(routingKey, data)
 
     def startConsuming(self, callback, filter, persistent_name=None):
         if persistent_name:
@@ -49,51 +77,155 @@ class SimpleMQ(config.ReconfigurableServiceMixin, base.MQBase):
                 qref.startConsuming(callback)
             else:
                 qref = PersistentQueueRef(self, callback, filter)
-                self.qrefs.append(qref)
+                self.addQueueRef(qref)
                 self.persistent_qrefs[persistent_name] = qref
         else:
             qref = QueueRef(self, callback, filter)
-            self.qrefs.append(qref)
+            self.addQueueRef(qref)
         return defer.succeed(qref)
 
+    def addQueueRef(self, qref):
+        self.qrefs.add(qref.filter, qref)
+
+    def removeQueueRef(self, qref):
+        # returns True if qref was consuming
+        return self.qrefs.remove(qref.filter, qref)
+
+    def schedule(self, qref):
+        # arrange for the queued messages of qref to be delivered in a later
+        # reactor turn
+        self.pending[qref] = None
+        if not self.drainScheduled:
+            self.drainScheduled = True
+            eventual.eventually(self.drain)
+
+    def drain(self):
+        self.drainScheduled = False
+        pending, self.pending = self.pending, OrderedDict()
+        now = self._reactor.seconds()
+        maxLag = 0
+        for qref in pending:
+            maxLag = max(maxLag, qref.deliver(self.DELIVERIES_PER_TURN, now))
+            # consumers with more messages wait for the next turn, so that
+            # one busy consumer does not hold up the reactor
+            if qref.queue and qref.active:
+                self.schedule(qref)
+        metrics.MetricCountEvent.log('SimpleMQ.queued',
+                                     sum(len(q.queue) for q in self.pending),
+                                     absolute=True)
+        metrics.MetricTimeEvent.log('SimpleMQ.delivery_lag', maxLag)
+
 
 class QueueRef(base.QueueRef):
 
-    __slots__ = ['mq', 'filter']
+    __slots__ = ['mq', 'filter', 'queue', 'overflow', 'queueSize', 'dropped',
+                 'active', 'ownOverflow', 'ownQueueSize']
 
     def __init__(self, mq, callback, filter):
         base.QueueRef.__init__(self, callback)
         self.mq = mq
         self.filter = filter
+        self.active = True
+        # the number of messages dropped on overflow
+        self.dropped = 0
+        # messages to deliver, with the time each was queued; coalescing
+        # queues are keyed by routing key, and the others by serial number
+        self.queue = OrderedDict()
+        # whether the consumer has set the policy and size with setDelivery;
+        # until then, the MQ's configured ones apply
+        self.ownOverflow = self.ownQueueSize = False
+        self.applyDelivery(mq.overflow, mq.queueSize)
+
+    def setDelivery(self, overflow=None, queueSize=None):
+        self.ownOverflow |= overflow is not None
+        self.ownQueueSize |= queueSize is not None
+        self.applyDelivery(overflow, queueSize)
+
+    def applyDelivery(self, overflow=None, queueSize=None):
+        if overflow is not None:
+            assert overflow in base.OVERFLOW_POLICIES
+            self.overflow = overflow
+        if queueSize is not None:
+            self.queueSize = queueSize
+        # re-key any queued messages for the new policy
+        queue, self.queue = self.queue, OrderedDict()
+        for routingKey, data, queued_at in queue.itervalues():
+            self.queue[self.queueKey(routingKey)] = \
+                (routingKey, data, queued_at)
+
+    def queueKey(self, routingKey):
+        if self.overflow == 'coalesce':
+            return routingKey
+        return next(self.mq.serial)
+
+    def enqueue(self, routingKey, data):
+        if self.callback is None:
+            return
+        queue = self.queue
+        now = self.mq._reactor.seconds()
+        key = self.queueKey(routingKey)
+        if key in queue:
+            # replace the queued message with the same routing key, keeping
+            # its place and the time it was queued
+            queue[key] = (routingKey, data, queue[key][2])
+            return
+
+        if len(queue) >= self.queueSize:
+            if self.overflow == 'block' and self.active:
+                # the producer waits for the consumer: deliver the queued
+                # messages, then this one, in the producer's call stack
+                self.deliver(len(queue), now)
+                if not self.queueSize:
+                    self.invoke(routingKey, data)
+                    return
+            else:
+                # a stopped consumer cannot block the producer, so it loses
+                # its oldest messages just as with 'drop-oldest'
+                while queue and len(queue) >= self.queueSize:
+                    queue.popitem(last=False)
+                    self.dropped += 1
+                    metrics.MetricCountEvent.log('SimpleMQ.dropped', 1)
+                if not self.queueSize:
+                    self.dropped += 1
+                    metrics.MetricCountEvent.log('SimpleMQ.dropped', 1)
+                    return
+
+        queue[key] = (routingKey, data, now)
+        if self.active:
+            self.mq.schedule(self)
+
+    def deliver(self, count, now):
+        # deliver up to count queued messages, returning the longest time any
+        # of them spent in the queue
+        maxLag = 0
+        queue = self.queue
+        while queue and count and self.active:
+            _, (routingKey, data, queued_at) = queue.popitem(last=False)
+            maxLag = max(maxLag, now - queued_at)
+            self.invoke(routingKey, data)
+            count -= 1
+        return maxLag
 
     def stopConsuming(self):
         self.callback = None
-        try:
-            self.mq.qrefs.remove(self)
-        except ValueError:
-            pass
+        self.active = False
+        self.queue.clear()
+        self.mq.removeQueueRef(self)
 
 
 class PersistentQueueRef(QueueRef):
 
-    __slots__ = ['active', 'queue']
-
-    def __init__(self, mq, callback, filter):
-        QueueRef.__init__(self, mq, callback, filter)
-        self.queue = []
+    __slots__ = []
 
     def startConsuming(self, callback):
         self.callback = callback
         self.active = True
 
-        # invoke for every message that was missed
-        queue, self.queue = self.queue, []
-        for routingKey, data in queue:
-            self.invoke(routingKey, data)
+        # deliver every message that was missed
+        if self.queue:
+            self.mq.schedule(self)
 
     def stopConsuming(self):
-        self.callback = self.addToQueue
+        # keep queueing messages, without delivering them; once the queue is
+        # full, the oldest are dropped, whatever the policy
         self.active = False
-
-    def addToQueue(self, routingKey, data):
-        self.queue.append((routingKey, data))
@@ -34,7 +34,6 @@ class Log(object):
         self.subscriptions = {}
         self.finished = False
         self.finishWaiters = []
-        self.lock = defer.DeferredLock()
         self.decoder = decoder
 
     @staticmethod
@@ -64,15 +63,13 @@ class Log(object):
 
     # adding lines
 
-    @defer.inlineCallbacks
     def addRawLines(self, lines):
         # used by subclasses to add lines that are already appropriately
-        # formatted for the log type, and newline-terminated
+        # formatted for the log type, and newline-terminated.  Appends are
+        # batched by the database layer, which preserves their order.
         assert lines[-1] == '\n'
         assert not self.finished
-        yield self.lock.acquire()
-        yield self.master.data.updates.appendLog(self.logid, lines)
-        yield self.lock.release()
+        return self.master.data.updates.appendLog(self.logid, lines)
 
     # completion
 
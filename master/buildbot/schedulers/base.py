@@ -226,8 +226,8 @@ class BaseScheduler(ClusteredService, StateMixin):
             return max(changesByCodebase[codebase], key=lambda change: change["changeid"])
 
         # Changes are retrieved from database and grouped by their codebase
-        for changeid in changeids:
-            chdict = yield self.master.db.changes.getChange(changeid)
+        chdicts = yield self.master.db.changes.getChangesByIds(changeids)
+        for chdict in chdicts:
             changesByCodebase.setdefault(chdict["codebase"], []).append(chdict)
 
         sourcestamps = []
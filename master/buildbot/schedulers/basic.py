@@ -169,15 +169,13 @@ class BaseBasicScheduler(base.BaseScheduler):
             yield self.master.db.schedulers.getChangeClassifications(
                 self.objectid)
 
-        # call gotChange for each change, after first fetching it from the db
-        for changeid, important in classifications.iteritems():
-            chdict = yield self.master.db.changes.getChange(changeid)
-
-            if not chdict:
-                continue
-
+        # call gotChange for each change, after first fetching them all from
+        # the db
+        chdicts = yield self.master.db.changes.getChangesByIds(
+            sorted(classifications))
+        for chdict in chdicts:
             change = yield changes.Change.fromChdict(self.master, chdict)
-            yield self.gotChange(change, important)
+            yield self.gotChange(change, classifications[chdict['changeid']])
 
     def getTimerNameForChange(self, change):
         raise NotImplementedError  # see subclasses
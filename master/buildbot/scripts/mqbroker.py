@@ -0,0 +1,47 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import sys
+
+from buildbot.mq import broker
+from twisted.internet import endpoints
+from twisted.internet import reactor
+from twisted.python import log
+
+
+def mqbroker(config):
+    if not config['quiet']:
+        log.startLogging(sys.stdout)
+    factory = broker.BrokerFactory(broker.Broker(config['history']))
+    d = endpoints.serverFromString(reactor, config['port']).listen(factory)
+
+    @d.addCallback
+    def listening(port):
+        log.msg("MQ broker listening on %s" % (config['port'],))
+
+    failures = []
+
+    @d.addErrback
+    def failed(why):
+        print >> sys.stderr, "could not listen on %s: %s" % (
+            config['port'], why.getErrorMessage())
+        failures.append(why)
+        if reactor.running:
+            reactor.stop()
+
+    # the endpoint usually fails at once, before the reactor is running
+    if not failures:
+        reactor.run()
+    return 1 if failures else 0
@@ -639,6 +639,23 @@ class DataSpecOption(base.BasedirMixin, base.SubcommandOptions):
         return "Usage:   buildbot dataspec [options]"
 
 
+class MQBrokerOptions(base.SubcommandOptions):
+    subcommandFunction = "buildbot.scripts.mqbroker.mqbroker"
+    optFlags = [
+        ['quiet', 'q', "Don't log to stdout"],
+    ]
+    optParameters = [
+        ['port', 'p', 'tcp:9990',
+         "the endpoint to listen on, e.g. tcp:9990 or unix:/path/to/socket"],
+        ['history', None, 10000,
+         "the number of messages kept for replay to reconnecting masters",
+         int],
+    ]
+
+    def getSynopsis(self):
+        return "Usage:    buildbot mqbroker [options]"
+
+
 class Options(usage.Options):
     synopsis = "Usage:    buildbot <command> [command options]"
 
@@ -668,7 +685,9 @@ class Options(usage.Options):
         ['user', None, UserOptions,
          "Manage users in buildbot's database"],
         ['dataspec', None, DataSpecOption,
-         "Output data api spec"]
+         "Output data api spec"],
+        ['mqbroker', None, MQBrokerOptions,
+         "Run a message broker for multi-master installations"],
     ]
 
     def opt_version(self):
@@ -16,6 +16,8 @@
 # This is a static resource type and set of endpoints uesd as common data by
 # tests.
 
+import sqlalchemy as sa
+
 from buildbot.data import base
 from buildbot.data import types
 from twisted.internet import defer
@@ -35,12 +37,40 @@ testData = {
 class TestsEndpoint(base.Endpoint):
     isCollection = True
     pathPatterns = "/test"
+    fieldMapping = {
+        'id': 'test.id',
+        'info': 'test.info',
+        'success': 'test.success',
+    }
 
     def get(self, resultSpec, kwargs):
         # results are sorted by ID for test stability
         return defer.succeed(sorted(testData.values(), key=lambda v: v['id']))
 
 
+class SqlTestsEndpoint(TestsEndpoint):
+    # the same collection, with as much of the result spec as possible applied
+    # in SQL, as the database-backed endpoints do
+    pathPatterns = "/test/sql"
+
+    def get(self, resultSpec, kwargs):
+        engine = sa.create_engine('sqlite://')
+        metadata = sa.MetaData()
+        table = sa.Table('test', metadata,
+                         sa.Column('id', sa.Integer, primary_key=True),
+                         sa.Column('info', sa.String(20), nullable=False),
+                         sa.Column('success', sa.Boolean, nullable=False))
+        metadata.create_all(engine)
+        conn = engine.connect()
+        try:
+            conn.execute(table.insert(), testData.values())
+            resultSpec.fieldMapping = self.fieldMapping
+            return defer.succeed(resultSpec.thd_execute(
+                conn, sa.select([table]), dict))
+        finally:
+            conn.close()
+
+
 class FailEndpoint(base.Endpoint):
     isCollection = False
     pathPatterns = "/test/fail"
@@ -67,7 +97,7 @@ class TestEndpoint(base.Endpoint):
 class Test(base.ResourceType):
     name = "test"
     plural = "tests"
-    endpoints = [TestsEndpoint, TestEndpoint, FailEndpoint]
+    endpoints = [TestsEndpoint, SqlTestsEndpoint, TestEndpoint, FailEndpoint]
 
     class EntityType(types.Entity):
         id = types.Integer()
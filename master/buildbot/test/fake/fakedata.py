@@ -380,6 +380,7 @@ class FakeDataConnector(object):
         # after some additional assertions
         self.realConnector = connector.DataConnector(master)
         self.rtypes = self.realConnector.rtypes
+        self.resultCache = self.realConnector.resultCache
 
     def _scanModule(self, mod):
         return self.realConnector._scanModule(mod)
@@ -581,6 +581,9 @@ class ConfiguredBuildslave(Row):
 class FakeDBComponent(object):
     data2db = {}
 
+    # methods taking a resultSpec leave it untouched, so that the data API
+    # applies it in memory instead
+
     def __init__(self, db, testcase):
         self.db = db
         self.t = testcase
@@ -759,12 +762,17 @@ class FakeChangesComponent(FakeDBComponent):
             ch_uids = []
         return defer.succeed(ch_uids)
 
+    def getChangesByIds(self, changeids):
+        chdicts = [self._chdict(self.changes[id]) for id in changeids
+                   if id in self.changes]
+        return defer.succeed(chdicts)
+
     def getRecentChanges(self, count):
         ids = sorted(self.changes.keys())
         chdicts = [self._chdict(self.changes[id]) for id in ids[-count:]]
         return defer.succeed(chdicts)
 
-    def getChanges(self):
+    def getChanges(self, resultSpec=None):
         chdicts = [self._chdict(v) for v in self.changes.values()]
         return defer.succeed(chdicts)
 
@@ -1026,7 +1034,7 @@ class FakeSourceStampsComponent(FakeDBComponent):
     def getSourceStamp(self, key, no_cache=False):
         return defer.succeed(self._getSourceStamp_sync(key))
 
-    def getSourceStamps(self):
+    def getSourceStamps(self, resultSpec=None):
         return defer.succeed([
             self._getSourceStamp_sync(ssid)
             for ssid in self.sourcestamps
@@ -1142,7 +1150,7 @@ class FakeBuildsetsComponent(FakeDBComponent):
         row = self.buildsets[bsid]
         return defer.succeed(self._row2dict(row))
 
-    def getBuildsets(self, complete=None):
+    def getBuildsets(self, complete=None, resultSpec=None):
         rv = []
         for bs in self.buildsets.itervalues():
             if complete is not None:
@@ -1499,7 +1507,8 @@ class FakeBuildRequestsComponent(FakeDBComponent):
 
     @defer.inlineCallbacks
     def getBuildRequests(self, buildername=None, complete=None, claimed=None,
-                         bsid=None, branch=None, repository=None):
+                         bsid=None, branch=None, repository=None,
+                         resultSpec=None):
         rv = []
         for br in self.reqs.itervalues():
             if buildername and br.buildername != buildername:
@@ -1673,7 +1682,7 @@ class FakeBuildsComponent(FakeDBComponent):
                 return defer.succeed(self._row2dict(row))
         return defer.succeed(None)
 
-    def getBuilds(self, builderid=None, buildrequestid=None):
+    def getBuilds(self, builderid=None, buildrequestid=None, resultSpec=None):
         ret = []
         for (id, row) in self.builds.items():
             if builderid and row['builderid'] != builderid:
@@ -1773,7 +1782,7 @@ class FakeStepsComponent(FakeDBComponent):
                 return defer.succeed(self._row2dict(row))
             return defer.succeed(None)
 
-    def getSteps(self, buildid):
+    def getSteps(self, buildid, resultSpec=None):
         ret = []
 
         for row in self.steps.itervalues():
@@ -1938,13 +1947,19 @@ class FakeLogsComponent(FakeDBComponent):
         num_lines = self.logs[logid]['num_lines'] = len(lines)
         return defer.succeed((num_lines - len(content), num_lines - 1))
 
+    def flushAppends(self):
+        return defer.succeed(None)
+
     def finishLog(self, logid):
-        if id in self.logs:
-            self.logs['id'].complete = 1
+        if logid in self.logs:
+            self.logs[logid]['complete'] = 1
         return defer.succeed(None)
 
     def compressLog(self, logid):
-        return defer.succeed(None)
+        return defer.succeed(0)
+
+    def compressFinishedLogs(self):
+        return defer.succeed(0)
 
 
 class FakeUsersComponent(FakeDBComponent):
@@ -94,6 +94,15 @@ class FakeMQConnector(object):
 
 class FakeQueueRef(object):
 
+    overflow = queueSize = None
+
+    def setDelivery(self, overflow=None, queueSize=None):
+        # messages are delivered synchronously, so this is just recorded
+        if overflow is not None:
+            self.overflow = overflow
+        if queueSize is not None:
+            self.queueSize = queueSize
+
     def stopConsuming(self):
         if self in self.qrefs:
             self.qrefs.remove(self)
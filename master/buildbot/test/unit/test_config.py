@@ -27,6 +27,7 @@ from buildbot import interfaces
 from buildbot import locks
 from buildbot import revlinks
 from buildbot.changes import base as changes_base
+from buildbot.db import logs as dblogs
 from buildbot.process import factory
 from buildbot.process import properties
 from buildbot.schedulers import base as schedulers_base
@@ -437,7 +438,14 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
     def test_load_global_logCompressionMethod_invalid(self):
         self.cfg.load_global(self.filename,
                              dict(logCompressionMethod='foo'))
-        self.assertConfigError(self.errors, "must be 'bz2' or 'gz'")
+        self.assertConfigError(self.errors,
+                               "must be 'raw', 'bz2', 'gz' or 'lz4'")
+
+    def test_load_global_logCompressionMethod_lz4_missing(self):
+        self.patch(dblogs, 'lz4', None)
+        self.cfg.load_global(self.filename,
+                             dict(logCompressionMethod='lz4'))
+        self.assertConfigError(self.errors, "lz4 module is not installed")
 
     def test_load_global_codebaseGenerator(self):
         func = lambda _: "dummy"
@@ -575,6 +583,23 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
                          dict(db=dict(db_url='abcd', db_poll_interval=10, bar='bar')))
         self.assertConfigError(self.errors, "unrecognized keys in")
 
+    def test_load_db_log_storage(self):
+        self.cfg.load_db(self.filename,
+                         dict(db=dict(db_url='abcd', log_storage='files',
+                                      log_dir='/var/logs')))
+        self.assertResults(db=dict(db_url='abcd', log_storage='files',
+                                   log_dir='/var/logs'))
+
+    def test_load_db_log_storage_unknown(self):
+        self.cfg.load_db(self.filename,
+                         dict(db=dict(db_url='abcd', log_storage='nfs')))
+        self.assertConfigError(self.errors, "must be 'db' or 'files'")
+
+    def test_load_db_log_dir_not_string(self):
+        self.cfg.load_db(self.filename,
+                         dict(db=dict(db_url='abcd', log_dir=12)))
+        self.assertConfigError(self.errors, "must be a string")
+
     def test_load_mq_defaults(self):
         self.cfg.load_mq(self.filename, {})
         self.assertResults(mq=dict(type='simple'))
@@ -593,6 +618,34 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
                          dict(mq=dict(bar='bar')))
         self.assertConfigError(self.errors, "unrecognized keys in")
 
+    def test_load_mq_delivery(self):
+        self.cfg.load_mq(self.filename,
+                         dict(mq=dict(queue_size=10, overflow='coalesce')))
+        self.assertResults(mq=dict(type='simple', queue_size=10,
+                                   overflow='coalesce'))
+
+    def test_load_mq_bad_queue_size(self):
+        self.cfg.load_mq(self.filename, dict(mq=dict(queue_size=-1)))
+        self.assertConfigError(self.errors,
+                               "c['mq']['queue_size'] must be an integer")
+
+    def test_load_mq_bad_overflow(self):
+        self.cfg.load_mq(self.filename, dict(mq=dict(overflow='explode')))
+        self.assertConfigError(self.errors,
+                               "c['mq']['overflow'] must be one of")
+
+    def test_load_mq_network(self):
+        self.cfg.load_mq(self.filename,
+                         dict(mq=dict(type='network',
+                                      broker='tcp:host=mq:port=9990')))
+        self.assertResults(mq=dict(type='network',
+                                   broker='tcp:host=mq:port=9990'))
+
+    def test_load_mq_network_no_broker(self):
+        self.cfg.load_mq(self.filename, dict(mq=dict(type='network')))
+        self.assertConfigError(self.errors,
+                               "c['mq']['broker'] must be the endpoint")
+
     def test_load_metrics_defaults(self):
         self.cfg.load_metrics(self.filename, {})
         self.assertResults(metrics=None)
@@ -835,6 +888,42 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
                                     avatar_methods={'name': 'gravatar'}
                                     ))
 
+    def test_load_www_compression(self):
+        self.cfg.load_www(self.filename,
+                          dict(www=dict(compression_threshold=0,
+                                        compression_level=9)))
+        self.assertResults(www=dict(port=None, url='http://localhost:8080/',
+                                    compression_threshold=0,
+                                    compression_level=9,
+                                    plugins={}, auth={'name': 'NoAuth'},
+                                    avatar_methods={'name': 'gravatar'}))
+
+    def test_load_www_compression_threshold_invalid(self):
+        self.cfg.load_www(self.filename,
+                          dict(www=dict(compression_threshold=-1)))
+        self.assertConfigError(self.errors,
+                               "www compression_threshold must be None")
+
+    def test_load_www_compression_level_invalid(self):
+        self.cfg.load_www(self.filename,
+                          dict(www=dict(compression_level=10)))
+        self.assertConfigError(self.errors,
+                               "www compression_level must be an integer")
+
+    def test_load_www_event_coalesce_interval(self):
+        self.cfg.load_www(self.filename,
+                          dict(www=dict(event_coalesce_interval=0.5)))
+        self.assertResults(www=dict(port=None, url='http://localhost:8080/',
+                                    event_coalesce_interval=0.5,
+                                    plugins={}, auth={'name': 'NoAuth'},
+                                    avatar_methods={'name': 'gravatar'}))
+
+    def test_load_www_event_coalesce_interval_invalid(self):
+        self.cfg.load_www(self.filename,
+                          dict(www=dict(event_coalesce_interval=-1)))
+        self.assertConfigError(self.errors,
+                               "www event_coalesce_interval must be a number")
+
     def test_load_www_unknown(self):
         self.cfg.load_www(self.filename,
                           dict(www=dict(foo="bar")))
@@ -16,6 +16,7 @@
 import mock
 
 from buildbot.data import base
+from buildbot.data import resultspec
 from buildbot.test.fake import fakemaster
 from buildbot.test.util import endpoint
 from twisted.trial import unittest
@@ -96,6 +97,9 @@ class Endpoint(endpoint.EndpointMixin, unittest.TestCase):
     def test_sets_master(self):
         self.assertIdentical(self.master, self.ep.master)
 
+    def test_getStream_unsupported(self):
+        self.assertEqual(self.ep.getStream(resultspec.ResultSpec(), {}), None)
+
 
 class ListResult(unittest.TestCase):
 
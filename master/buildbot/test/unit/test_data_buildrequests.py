@@ -145,18 +145,19 @@ class TestBuildRequestsEndpoint(endpoint.EndpointMixin, unittest.TestCase):
 
     @defer.inlineCallbacks
     def testGetNoFilters(self):
-        getBuildRequestsMock = mock.Mock(return_value={})
+        getBuildRequestsMock = mock.Mock(return_value=defer.succeed([]))
         self.patch(self.master.db.buildrequests, 'getBuildRequests', getBuildRequestsMock)
         yield self.callGet(('buildrequests',))
         getBuildRequestsMock.assert_called_with(
             buildername=None,
             bsid=None,
             complete=None,
-            claimed=None)
+            claimed=None,
+            resultSpec=mock.ANY)
 
     @defer.inlineCallbacks
     def testGetFilters(self):
-        getBuildRequestsMock = mock.Mock(return_value={})
+        getBuildRequestsMock = mock.Mock(return_value=defer.succeed([]))
         self.patch(self.master.db.buildrequests, 'getBuildRequests', getBuildRequestsMock)
         f1 = resultspec.Filter('complete', 'eq', [False])
         f2 = resultspec.Filter('claimed', 'eq', [True])
@@ -170,11 +171,12 @@ class TestBuildRequestsEndpoint(endpoint.EndpointMixin, unittest.TestCase):
             buildername=None,
             bsid=55,
             complete=False,
-            claimed=True)
+            claimed=True,
+            resultSpec=mock.ANY)
 
     @defer.inlineCallbacks
     def testGetClaimedByMasterIdFilters(self):
-        getBuildRequestsMock = mock.Mock(return_value={})
+        getBuildRequestsMock = mock.Mock(return_value=defer.succeed([]))
         self.patch(self.master.db.buildrequests, 'getBuildRequests', getBuildRequestsMock)
         f1 = resultspec.Filter('claimed', 'eq', [True])
         f2 = resultspec.Filter('claimed_by_masterid', 'eq',
@@ -186,7 +188,8 @@ class TestBuildRequestsEndpoint(endpoint.EndpointMixin, unittest.TestCase):
             buildername=None,
             bsid=None,
             complete=None,
-            claimed=fakedb.FakeBuildRequestsComponent.MASTER_ID)
+            claimed=fakedb.FakeBuildRequestsComponent.MASTER_ID,
+            resultSpec=mock.ANY)
 
 
 class TestBuildRequest(interfaces.InterfaceTests, unittest.TestCase):
@@ -16,6 +16,7 @@
 import mock
 
 from buildbot.data import builds
+from buildbot.data import resultspec
 from buildbot.test.fake import fakedb
 from buildbot.test.fake import fakemaster
 from buildbot.test.util import endpoint
@@ -56,6 +57,14 @@ class BuildEndpoint(endpoint.EndpointMixin, unittest.TestCase):
         self.validateData(build)
         self.assertEqual(build['number'], 4)
 
+    @defer.inlineCallbacks
+    def test_isImmutable(self):
+        build = yield self.callGet(('builds', 14))
+        self.assertFalse((yield self.ep.isImmutable(build, {'buildid': 14})))
+        yield self.db.builds.finishBuild(14, 0)
+        build = yield self.callGet(('builds', 14))
+        self.assertTrue((yield self.ep.isImmutable(build, {'buildid': 14})))
+
     @defer.inlineCallbacks
     def test_get_missing(self):
         build = yield self.callGet(('builds', 9999))
@@ -115,6 +124,24 @@ class BuildsEndpoint(endpoint.EndpointMixin, unittest.TestCase):
         [self.validateData(build) for build in builds]
         self.assertEqual(sorted([b['number'] for b in builds]), [5])
 
+    @defer.inlineCallbacks
+    def test_getStream(self):
+        self.ep.streamBatchSize = 2
+        stream = self.ep.getStream(
+            resultspec.ResultSpec(order=['-number'], fields=['number']), {})
+        batches = []
+        while True:
+            batch = yield stream.nextBatch()
+            if not batch:
+                break
+            batches.append(batch)
+        self.assertEqual(batches, [[{'number': 5}, {'number': 4}],
+                                   [{'number': 3}]])
+
+    def test_getStream_unmapped_order(self):
+        self.assertEqual(self.ep.getStream(
+            resultspec.ResultSpec(order=['complete']), {}), None)
+
     @defer.inlineCallbacks
     def test_get_buildrequest(self):
         builds = yield self.callGet(('buildrequests', 82, 'builds'))
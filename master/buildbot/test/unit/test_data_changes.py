@@ -16,6 +16,7 @@
 import mock
 
 from buildbot.data import changes
+from buildbot.data import resultspec
 from buildbot.process.users import users
 from buildbot.test.fake import fakedb
 from buildbot.test.fake import fakemaster
@@ -94,6 +95,17 @@ class ChangesEndpoint(endpoint.EndpointMixin, unittest.TestCase):
             self.assertEqual(changes[1]['changeid'], 14)
         return d
 
+    def test_get_without_sourcestamp(self):
+        self.master.data.get = mock.Mock()
+        rs = resultspec.ResultSpec(fields=['changeid'])
+        d = self.callGet(('changes',), resultSpec=rs)
+
+        @d.addCallback
+        def check(changes):
+            self.assertEqual(changes[0]['sourcestamp'], None)
+            self.assertFalse(self.master.data.get.called)
+        return d
+
     def test_startConsuming(self):
         return self.callStartConsuming({}, {},
                                        expected_filter=('changes',
@@ -26,9 +26,8 @@ from twisted.internet import defer
 from twisted.trial import unittest
 
 
-class LogChunkEndpoint(endpoint.EndpointMixin, unittest.TestCase):
+class LogChunkEndpointBase(endpoint.EndpointMixin):
 
-    endpointClass = logchunks.LogChunkEndpoint
     resourceTypeClass = logchunks.LogChunk
 
     def setUp(self):
@@ -76,6 +75,25 @@ class LogChunkEndpoint(endpoint.EndpointMixin, unittest.TestCase):
     def tearDown(self):
         self.tearDownEndpoint()
 
+
+class LogChunkEndpoint(LogChunkEndpointBase, unittest.TestCase):
+
+    endpointClass = logchunks.LogChunkEndpoint
+
+    @defer.inlineCallbacks
+    def test_isImmutable(self):
+        logchunk = yield self.callGet(('logs', 60, 'contents'))
+        self.assertFalse((yield self.ep.isImmutable(logchunk, {'logid': 60})))
+        yield self.db.logs.finishLog(60)
+        # the lines fetched earlier may not have been the last
+        self.assertFalse((yield self.ep.isImmutable(logchunk, {'logid': 60})))
+        logchunk = yield self.callGet(('logs', 60, 'contents'))
+        self.assertTrue(logchunk.immutable)
+        self.assertTrue((yield self.ep.isImmutable(logchunk, {'logid': 60})))
+        # without the log's completion, it is fetched
+        self.assertTrue((yield self.ep.isImmutable(dict(logchunk),
+                                                   {'logid': 60})))
+
     @defer.inlineCallbacks
     def do_test_chunks(self, path, logid, expLines):
         # get the whole thing in one go
@@ -171,6 +189,50 @@ class LogChunkEndpoint(endpoint.EndpointMixin, unittest.TestCase):
         self.assertEqual(logchunk['logid'], 61)
 
 
+class RawLogChunkEndpoint(LogChunkEndpointBase, unittest.TestCase):
+
+    endpointClass = logchunks.RawLogChunkEndpoint
+
+    @defer.inlineCallbacks
+    def test_get_logid_60(self):
+        info = yield self.callGet(('logs', 60, 'raw'))
+        self.assertEqual(info, {'logid': 60, 'firstline': 0, 'lastline': 6,
+                                'num_lines': 7, 'type': 's',
+                                'filename': 'stdio', 'complete': False})
+
+    @defer.inlineCallbacks
+    def test_isImmutable(self):
+        info = yield self.callGet(('logs', 60, 'raw'))
+        self.assertFalse((yield self.ep.isImmutable(info, {'logid': 60})))
+        yield self.db.logs.finishLog(60)
+        info = yield self.callGet(('logs', 60, 'raw'))
+        self.assertTrue((yield self.ep.isImmutable(info, {'logid': 60})))
+
+    @defer.inlineCallbacks
+    def test_get_range(self):
+        info = yield self.callGet(('logs', 61, 'raw'),
+                                  resultSpec=resultspec.ResultSpec(offset=95, limit=10))
+        self.assertEqual((info['firstline'], info['lastline']), (95, 99))
+
+    @defer.inlineCallbacks
+    def test_get_empty(self):
+        info = yield self.callGet(('logs', 62, 'raw'))
+        self.assertEqual((info['firstline'], info['lastline']), (0, -1))
+
+    @defer.inlineCallbacks
+    def test_get_missing(self):
+        info = yield self.callGet(('logs', 99, 'raw'))
+        self.assertEqual(info, None)
+
+    @defer.inlineCallbacks
+    def test_get_by_builder_step_name(self):
+        info = yield self.callGet(
+            ('builders', 77, 'builds', 3, 'steps', 'make',
+             'logs', 'errors', 'raw'))
+        self.assertEqual(info['logid'], 61)
+        self.assertEqual(info['filename'], 'errors')
+
+
 class LogChunk(interfaces.InterfaceTests, unittest.TestCase):
 
     def setUp(self):
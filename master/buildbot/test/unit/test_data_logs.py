@@ -67,6 +67,14 @@ class LogEndpoint(endpoint.EndpointMixin, unittest.TestCase):
         log = yield self.callGet(('logs', 62))
         self.assertEqual(log, None)
 
+    @defer.inlineCallbacks
+    def test_isImmutable(self):
+        log = yield self.callGet(('logs', 60))
+        self.assertFalse((yield self.ep.isImmutable(log, {'logid': 60})))
+        yield self.db.logs.finishLog(60)
+        log = yield self.callGet(('logs', 60))
+        self.assertTrue((yield self.ep.isImmutable(log, {'logid': 60})))
+
     @defer.inlineCallbacks
     def test_get_by_stepid(self):
         log = yield self.callGet(('steps', 50, 'logs', 'errors'))
@@ -131,6 +139,28 @@ class LogsEndpoint(endpoint.EndpointMixin, unittest.TestCase):
         self.assertEqual(sorted([b['name'] for b in logs]),
                          ['errors', 'stdio'])
 
+    @defer.inlineCallbacks
+    def test_isImmutable(self):
+        kwargs = {'stepid': 50}
+        logs = yield self.callGet(('steps', 50, 'logs'))
+        self.assertFalse((yield self.ep.isImmutable(logs, kwargs)))
+
+        # the logs are complete, but more may be added to the step
+        yield self.db.logs.finishLog(60)
+        yield self.db.logs.finishLog(61)
+        logs = yield self.callGet(('steps', 50, 'logs'))
+        self.assertFalse((yield self.ep.isImmutable(logs, kwargs)))
+
+        yield self.db.steps.finishStep(50, 0)
+        # the logs fetched earlier may have been fetched before the step was
+        # complete, so only a later result is immutable
+        self.assertFalse((yield self.ep.isImmutable(logs, kwargs)))
+        logs = yield self.callGet(('steps', 50, 'logs'))
+        self.assertTrue(logs.immutable)
+        self.assertTrue((yield self.ep.isImmutable(logs, kwargs)))
+        # without the step's completion, it is fetched
+        self.assertTrue((yield self.ep.isImmutable(list(logs), kwargs)))
+
     @defer.inlineCallbacks
     def test_get_stepid_empty(self):
         logs = yield self.callGet(('steps', 52, 'logs'))
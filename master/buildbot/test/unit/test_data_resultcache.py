@@ -0,0 +1,257 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+
+from buildbot.data import resultcache
+from buildbot.data import resultspec
+from buildbot.test.fake import fakemaster
+from twisted.internet import defer
+from twisted.trial import unittest
+
+
+class ResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.master = fakemaster.make_master(wantData=True, testcase=self)
+        self.master.mq.verifyMessages = False
+        self.cache = resultcache.ResultCache(self.master)
+        self.fetches = []
+
+    def makeEndpoint(self, rtype=None, result=None):
+        ep = mock.Mock()
+        ep.rtype = rtype or self.master.data.rtypes.build
+        ep.isRaw = False
+
+        def get(resultSpec, kwargs):
+            self.fetches.append(kwargs)
+            return defer.succeed(result if result is not None
+                                 else [{'buildid': 1}, {'buildid': 2}])
+        ep.get = get
+        return ep
+
+    def get(self, ep, path, kwargs={}, **rsKwargs):
+        return self.cache.get(ep, kwargs, path,
+                              resultspec.ResultSpec(**rsKwargs))
+
+    def event(self, *routingKey):
+        self.master.mq.callConsumer(routingKey, {})
+
+    @defer.inlineCallbacks
+    def test_hit(self):
+        ep = self.makeEndpoint()
+        res1 = yield self.get(ep, ('builds',), limit=1)
+        res2 = yield self.get(ep, ('builds',), limit=1)
+        self.assertEqual(list(res1), [{'buildid': 1}])
+        self.assertIdentical(res1, res2)
+        self.assertEqual(len(self.fetches), 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    @defer.inlineCallbacks
+    def test_peek(self):
+        ep = self.makeEndpoint()
+        rs = resultspec.ResultSpec(limit=1)
+        self.assertEqual(self.cache.peek(ep, {}, ('builds',), rs), None)
+        res = yield self.get(ep, ('builds',), limit=1)
+        self.assertIdentical(
+            self.cache.peek(ep, {}, ('builds',), resultspec.ResultSpec(limit=1)),
+            res)
+        # peeking never fetches
+        self.assertEqual(len(self.fetches), 1)
+
+    @defer.inlineCallbacks
+    def test_different_resultSpec(self):
+        ep = self.makeEndpoint()
+        yield self.get(ep, ('builds',), limit=1)
+        res = yield self.get(ep, ('builds',), limit=2)
+        self.assertEqual(len(res), 2)
+        self.assertEqual(len(self.fetches), 2)
+
+    @defer.inlineCallbacks
+    def test_invalidated_by_event(self):
+        ep = self.makeEndpoint()
+        yield self.get(ep, ('builders', '7', 'builds'), {'builderid': 7})
+        yield self.get(ep, ('builders', '8', 'builds'), {'builderid': 8})
+        yield self.get(ep, ('builds',))
+        self.assertEqual(len(self.fetches), 3)
+
+        # both builds and builders/7/builds are invalidated, but not
+        # builders/8/builds
+        self.event('builders', '7', 'builds', '3', 'new')
+        self.event('builds', '13', 'new')
+        yield self.get(ep, ('builders', '7', 'builds'), {'builderid': 7})
+        yield self.get(ep, ('builders', '8', 'builds'), {'builderid': 8})
+        yield self.get(ep, ('builds',))
+        self.assertEqual(len(self.fetches), 5)
+
+    @defer.inlineCallbacks
+    def test_invalidated_during_fetch(self):
+        d = defer.Deferred()
+        ep = self.makeEndpoint()
+        ep.get = lambda resultSpec, kwargs: d
+        res_d = self.get(ep, ('builds',))
+        self.event('builds', '13', 'finished')
+        d.callback([{'buildid': 13}])
+        res = yield res_d
+        self.assertEqual(list(res), [{'buildid': 13}])
+        # the result was not cached, since it may be out of date
+        self.assertEqual(self.cache.entries, {})
+
+    @defer.inlineCallbacks
+    def test_concurrent_misses(self):
+        d = defer.Deferred()
+        ep = self.makeEndpoint()
+        ep.get = mock.Mock(return_value=d)
+        d1 = self.get(ep, ('builds',))
+        d2 = self.get(ep, ('builds',))
+        d.callback([{'buildid': 13}])
+        res1, res2 = yield defer.gatherResults([d1, d2])
+        self.assertIdentical(res1, res2)
+        self.assertEqual(ep.get.call_count, 1)
+
+    @defer.inlineCallbacks
+    def test_not_cacheable_rtype(self):
+        ep = self.makeEndpoint(rtype=self.master.data.rtypes.master)
+        yield self.get(ep, ('masters',))
+        yield self.get(ep, ('masters',))
+        self.assertEqual(len(self.fetches), 2)
+
+    @defer.inlineCallbacks
+    def test_path_not_covered_by_events(self):
+        # steps by name are not identified by the step events' routing keys
+        ep = self.makeEndpoint(rtype=self.master.data.rtypes.step)
+        kwargs = {'buildid': 13, 'step_name': 'compile'}
+        yield self.get(ep, ('builds', '13', 'steps', 'compile'), kwargs)
+        yield self.get(ep, ('builds', '13', 'steps', 'compile'), kwargs)
+        self.assertEqual(len(self.fetches), 2)
+
+    @defer.inlineCallbacks
+    def test_multiMaster_simple_mq(self):
+        self.master.config.multiMaster = True
+        ep = self.makeEndpoint()
+        yield self.get(ep, ('builds',))
+        yield self.get(ep, ('builds',))
+        self.assertEqual(len(self.fetches), 2)
+
+    @defer.inlineCallbacks
+    def test_eviction(self):
+        self.master.config.caches['DataResults'] = 2
+        ep = self.makeEndpoint()
+        for limit in 1, 2, 1, 3:
+            yield self.get(ep, ('builds',), limit=limit)
+        # limit=2 was least recently used
+        self.assertEqual(sorted(k[1][3] for k in self.cache.entries), [1, 3])
+        self.assertEqual(len(self.cache.keysByPath[('builds',)]), 2)
+
+    @defer.inlineCallbacks
+    def test_changeStamp(self):
+        ep = self.makeEndpoint()
+        yield self.get(ep, ('builds',))
+        stamp = self.cache.changeStamp(ep, {}, ('builds',))
+        stamp1 = self.cache.changeStamp(ep, {'buildid': 1}, ('builds', '1'))
+        self.assertNotEqual(stamp, None)
+        self.assertEqual(self.cache.changeStamp(ep, {}, ('builds',)), stamp)
+
+        # an event changes the stamps of the prefixes of its path
+        self.event('builds', '2', 'new')
+        self.assertNotEqual(self.cache.changeStamp(ep, {}, ('builds',)),
+                            stamp)
+        self.assertEqual(
+            self.cache.changeStamp(ep, {'buildid': 1}, ('builds', '1')),
+            stamp1)
+
+        stamp = self.cache.changeStamp(ep, {}, ('builds',))
+        self.cache.invalidatePrefix(('builds',))
+        self.assertNotEqual(self.cache.changeStamp(ep, {}, ('builds',)),
+                            stamp)
+        self.assertNotEqual(
+            self.cache.changeStamp(ep, {'buildid': 1}, ('builds', '1')),
+            stamp1)
+
+        stamp = self.cache.changeStamp(ep, {}, ('builds',))
+        self.cache.invalidateAll()
+        self.assertNotEqual(self.cache.changeStamp(ep, {}, ('builds',)),
+                            stamp)
+
+    @defer.inlineCallbacks
+    def test_changeStamp_not_cacheable(self):
+        ep = self.makeEndpoint(rtype=self.master.data.rtypes.master)
+        yield self.get(ep, ('masters',))
+        self.assertEqual(self.cache.changeStamp(ep, {}, ('masters',)), None)
+
+    @defer.inlineCallbacks
+    def test_put(self):
+        ep = self.makeEndpoint()
+        yield self.get(ep, ('builds', '1'), {'buildid': 1})
+        rs = resultspec.ResultSpec(limit=1)
+        stamp = self.cache.changeStamp(ep, {}, ('builds',))
+        self.cache.put(ep, {}, ('builds',), rs.cacheKey(), ['res'], stamp)
+        self.assertEqual(self.cache.peek(ep, {}, ('builds',), rs), ['res'])
+
+        # a result fetched while the path changed is not cached
+        stamp = self.cache.changeStamp(ep, {}, ('builds',))
+        self.event('builds', '2', 'new')
+        self.cache.put(ep, {}, ('builds',), rs.cacheKey(), ['res'], stamp)
+        self.assertEqual(self.cache.peek(ep, {}, ('builds',), rs), None)
+
+    @defer.inlineCallbacks
+    def test_put_not_cacheable(self):
+        ep = self.makeEndpoint(rtype=self.master.data.rtypes.master)
+        yield self.get(ep, ('masters',))
+        rs = resultspec.ResultSpec()
+        self.cache.put(ep, {}, ('masters',), rs.cacheKey(), ['res'], None)
+        self.assertEqual(self.cache.entries, {})
+
+    @defer.inlineCallbacks
+    def test_invalidatePrefix(self):
+        ep = self.makeEndpoint(rtype=self.master.data.rtypes.change)
+        yield self.get(ep, ('changes',))
+        yield self.get(ep, ('changes', 1), {'changeid': 1})
+        bep = self.makeEndpoint()
+        yield self.get(bep, ('builds',))
+        self.cache.invalidatePrefix(('changes',))
+        self.assertEqual(self.cache.keysByPath.keys(), [('builds',)])
+        self.assertEqual(len(self.cache.entries), 1)
+        yield self.get(ep, ('changes',))
+        self.assertEqual(len(self.fetches), 4)
+
+    @defer.inlineCallbacks
+    def test_startConsuming_fails(self):
+        calls = []
+        startConsuming = self.master.mq.startConsuming
+
+        def failOnce(callback, filter, persistent_name=None):
+            calls.append(filter)
+            if len(calls) == 1:
+                return defer.fail(RuntimeError('no mq'))
+            return startConsuming(callback, filter, persistent_name)
+        self.master.mq.startConsuming = failOnce
+        ep = self.makeEndpoint()
+        yield self.get(ep, ('builds',))
+        yield self.get(ep, ('builds',))
+        self.assertEqual(len(self.fetches), 2)
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+        # the consumers that did start were stopped again, and the next use
+        # started them all
+        self.assertEqual(len(self.master.mq.qrefs), len(self.cache._qrefs))
+        self.assertEqual(self.cache._consuming.called, True)
+
+    @defer.inlineCallbacks
+    def test_stopConsuming(self):
+        ep = self.makeEndpoint()
+        yield self.get(ep, ('builds',))
+        self.cache.stopConsuming()
+        self.assertEqual(self.master.mq.qrefs, [])
+        self.assertEqual(self.cache.entries, {})
@@ -14,9 +14,12 @@
 # Copyright Buildbot Team Members
 
 import random
+import sqlalchemy as sa
 
 from buildbot.data import base
 from buildbot.data import resultspec
+from buildbot.util import epoch2datetime
+from twisted.internet import defer
 from twisted.trial import unittest
 
 
@@ -70,6 +73,31 @@ class Filter(unittest.TestCase):
                          mklist('num', 10, 15))
 
 
+class Aggregate(unittest.TestCase):
+
+    def test_name(self):
+        self.assertEqual(resultspec.Aggregate('count').name, 'count')
+        self.assertEqual(resultspec.Aggregate('avg', 'num').name, 'avg_num')
+
+    def test_apply(self):
+        items = mklist('num', 10, None, 30, 20)
+        self.assertEqual(
+            [resultspec.Aggregate(*a)._apply(items) for a in
+             [('count',), ('count', 'num'), ('min', 'num'), ('max', 'num'),
+              ('avg', 'num')]],
+            [4, 3, 10, 30, 20.0])
+
+    def test_apply_no_values(self):
+        self.assertEqual(
+            resultspec.Aggregate('max', 'num')._apply(mklist('num', None)),
+            None)
+
+    def test_apply_datetime(self):
+        items = mklist('when', epoch2datetime(1000), epoch2datetime(3000))
+        self.assertEqual(resultspec.Aggregate('max', 'when')._apply(items),
+                         3000)
+
+
 class ResultSpec(unittest.TestCase):
 
     def assertListResultEqual(self, a, b):
@@ -89,6 +117,12 @@ class ResultSpec(unittest.TestCase):
             resultspec.ResultSpec(fields=['name', 'id']).apply(data),
             dict(name="clyde", id=14))
 
+    def test_apply_details_fields_immutable(self):
+        data = base.ItemResult(dict(name="clyde", id=14), immutable=True)
+        res = resultspec.ResultSpec(fields=['name']).apply(data)
+        self.assertEqual(res, dict(name="clyde"))
+        self.assertTrue(res.immutable)
+
     def test_apply_collection_fields(self):
         data = mklist(('a', 'b', 'c'),
                       (1, 11, 111),
@@ -146,6 +180,16 @@ class ResultSpec(unittest.TestCase):
             resultspec.ResultSpec(filters=[f, f2]).apply(data),
             base.ListResult(mklist('name', 'cedric'), total=1))
 
+    def test_apply_filter_immutable(self):
+        # a ListResult without pagination is filtered as a bare list
+        data = base.ListResult(mklist('name', 'albert', 'bruce', 'cedric'),
+                               immutable=True)
+        f = resultspec.Filter(field='name', op='gt', values=['albert'])
+        res = resultspec.ResultSpec(filters=[f], order=['-name']).apply(data)
+        self.assertListResultEqual(
+            res, base.ListResult(mklist('name', 'cedric', 'bruce'), total=2))
+        self.assertTrue(res.immutable)
+
     def test_apply_missing_fields(self):
         data = mklist(('fn', 'ln'),
                       ('cedric', 'willis'),
@@ -197,6 +241,14 @@ class ResultSpec(unittest.TestCase):
             base.ListResult(mklist('x', *range(10, 20)),
                             offset=10, total=30, limit=10))
 
+    def test_pagination_prepaginated_fields(self):
+        data = base.ListResult(mklist(('x', 'y'), (10, 1), (11, 2)),
+                               offset=10, total=30, limit=2)
+        self.assertListResultEqual(
+            resultspec.ResultSpec(fields=['x']).apply(data),
+            base.ListResult(mklist('x', 10, 11),
+                            offset=10, total=30, limit=2))
+
     def test_pagination_prepaginated_without_clearing_resultspec(self):
         data = base.ListResult(mklist('x', *range(10, 20)))
         data.offset = 10
@@ -214,6 +266,35 @@ class ResultSpec(unittest.TestCase):
         self.assertRaises(AssertionError, lambda:
                           resultspec.ResultSpec(filters=[f]).apply(data))
 
+    def test_apply_after(self):
+        data = mklist(('fn', 'ln'),
+                      ('cedric', 'willis'),
+                      ('albert', 'engelbert'),
+                      ('bruce', 'willis'),
+                      ('dwayne', 'montague'))
+        random.shuffle(data)
+        self.assertListResultEqual(
+            resultspec.ResultSpec(order=['-ln', 'fn'], limit=2,
+                                  after=['willis', 'bruce']).apply(data),
+            base.ListResult(mklist(('fn', 'ln'),
+                                   ('cedric', 'willis'),
+                                   ('dwayne', 'montague')),
+                            total=4, limit=2))
+
+    def test_apply_after_none(self):
+        data = mklist('n', 1, None, 3)
+        self.assertEqual(
+            resultspec.ResultSpec(order=['n'], after=[None]).apply(data),
+            base.ListResult(mklist('n', 1, 3), total=3))
+        self.assertEqual(
+            resultspec.ResultSpec(order=['-n'], after=[1]).apply(data),
+            base.ListResult(mklist('n', None), total=3))
+
+    def test_apply_after_without_order(self):
+        self.assertRaises(AssertionError,
+                          resultspec.ResultSpec(after=[1]).apply,
+                          mklist('n', 1, 2))
+
     def test_popFilter(self):
         rs = resultspec.ResultSpec(filters=[
             resultspec.Filter('foo', 'eq', [10]),
@@ -243,7 +324,332 @@ class ResultSpec(unittest.TestCase):
         self.assertTrue(rs.popField('foo'))
         self.assertEqual(rs.fields, ['bar'])
 
+    def test_apply_aggregates(self):
+        data = mklist(('id', 'builderid', 'results'),
+                      (1, 7, 0), (2, 8, 2), (3, 7, 2), (4, 7, None))
+        rs = resultspec.ResultSpec(
+            filters=[resultspec.Filter('id', 'gt', [1])],
+            aggregates=[resultspec.Aggregate('count'),
+                        resultspec.Aggregate('avg', 'results')],
+            groupBy=['builderid'])
+        self.assertListResultEqual(rs.apply(data), base.ListResult([
+            {'builderid': 7, 'count': 2, 'avg_results': 2.0},
+            {'builderid': 8, 'count': 1, 'avg_results': 2.0},
+        ], total=2))
+
+    def test_apply_aggregates_ungrouped_empty(self):
+        rs = resultspec.ResultSpec(aggregates=[resultspec.Aggregate('count')])
+        self.assertListResultEqual(rs.apply([]),
+                                   base.ListResult([{'count': 0}], total=1))
+
+    def test_apply_aggregates_precomputed(self):
+        rs = resultspec.ResultSpec(aggregates=[resultspec.Aggregate('count')])
+        data = base.ListResult([], aggregates=[{'count': 13}])
+        self.assertListResultEqual(rs.apply(data),
+                                   base.ListResult([{'count': 13}], total=1))
+
+    def test_cacheKey_aggregates(self):
+        count = resultspec.Aggregate('count')
+        self.assertNotEqual(
+            resultspec.ResultSpec().cacheKey(),
+            resultspec.ResultSpec(aggregates=[count]).cacheKey())
+        self.assertNotEqual(
+            resultspec.ResultSpec(aggregates=[count]).cacheKey(),
+            resultspec.ResultSpec(aggregates=[count],
+                                  groupBy=['num']).cacheKey())
+
     def test_popField_not_present(self):
         rs = resultspec.ResultSpec(fields=['foo', 'bar'])
         self.assertFalse(rs.popField('nosuch'))
         self.assertEqual(rs.fields, ['foo', 'bar'])
+
+
+class SQLResultSpec(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        metadata = sa.MetaData()
+        self.tbl = sa.Table('items', metadata,
+                            sa.Column('id', sa.Integer, primary_key=True),
+                            sa.Column('name', sa.String(20)),
+                            sa.Column('num', sa.Integer),
+                            sa.Column('when', sa.Integer))
+        metadata.create_all(bind=self.engine)
+        self.conn = self.engine.connect()
+        self.conn.execute(self.tbl.insert(), [
+            dict(id=1, name='a', num=10, when=1000),
+            dict(id=2, name='b', num=None, when=2000),
+            dict(id=3, name='c', num=30, when=3000),
+            dict(id=4, name='d', num=10, when=4000),
+        ])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def execute(self, rs):
+        rs.fieldMapping = {'itemid': 'items.id', 'name': 'items.name',
+                           'num': 'items.num', 'when': 'items.when'}
+        return rs.thd_execute(self.conn, self.tbl.select(),
+                              lambda row: row.id)
+
+    def assertFiltered(self, field, op, values, exp):
+        rs = resultspec.ResultSpec(
+            filters=[resultspec.Filter(field, op, values)])
+        self.assertEqual(sorted(self.execute(rs)), exp)
+        self.assertEqual(rs.filters, [])
+
+    def test_filters(self):
+        self.assertFiltered('num', 'eq', [10], [1, 4])
+        self.assertFiltered('num', 'ne', [10], [3])
+        self.assertFiltered('num', 'lt', [30], [1, 4])
+        self.assertFiltered('num', 'le', [30], [1, 3, 4])
+        self.assertFiltered('num', 'gt', [10], [3])
+        self.assertFiltered('num', 'ge', [10], [1, 3, 4])
+        self.assertFiltered('num', 'eq', [10, 30], [1, 3, 4])
+
+    def test_filters_null(self):
+        # these match the in-memory behavior of the filters
+        self.assertFiltered('num', 'eq', [None], [2])
+        self.assertFiltered('num', 'ne', [None], [1, 3, 4])
+        self.assertFiltered('num', 'eq', [30, None], [2, 3])
+        self.assertFiltered('num', 'ne', [10, 30], [2])
+        self.assertFiltered('num', 'ne', [10, None], [3])
+
+    def test_filters_datetime(self):
+        self.assertFiltered('when', 'gt', [epoch2datetime(2000)], [3, 4])
+
+    def test_order(self):
+        rs = resultspec.ResultSpec(order=['num', '-itemid'])
+        self.assertEqual(self.execute(rs), [2, 4, 1, 3])
+        self.assertEqual(rs.order, None)
+
+    def test_pagination(self):
+        rs = resultspec.ResultSpec(
+            filters=[resultspec.Filter('itemid', 'gt', [1])],
+            order=['-itemid'], offset=1, limit=2)
+        self.assertEqual(self.execute(rs),
+                         base.ListResult([3, 2], offset=1, total=3, limit=2))
+        self.assertEqual((rs.offset, rs.limit), (None, None))
+
+    def test_pagination_no_total(self):
+        rs = resultspec.ResultSpec(order=['-itemid'], limit=2,
+                                   countTotal=False)
+        rs.fieldMapping = {'itemid': 'items.id'}
+        query, countQuery = rs.applyToSQLQuery(self.tbl.select())
+        self.assertEqual(countQuery, None)
+        rs = resultspec.ResultSpec(order=['-itemid'], limit=2,
+                                   countTotal=False)
+        self.assertEqual(self.execute(rs), [4, 3])
+
+    def test_after(self):
+        rs = resultspec.ResultSpec(order=['num', '-itemid'], limit=2,
+                                   after=[10, 4])
+        self.assertEqual(self.execute(rs),
+                         base.ListResult([1, 3], total=4, limit=2))
+        self.assertEqual(rs.after, None)
+
+    def test_after_null(self):
+        # NULL sorts before everything else, as None does in memory
+        rs = resultspec.ResultSpec(order=['num', 'itemid'], after=[None, 2])
+        self.assertEqual(self.execute(rs), base.ListResult([1, 4, 3], total=4))
+        rs = resultspec.ResultSpec(order=['-num', 'itemid'], after=[10, 4])
+        self.assertEqual(self.execute(rs), base.ListResult([2], total=4))
+
+    def test_order_nulls(self):
+        # NULLs sort as in memory, whatever the database's default
+        for order in (['num', 'itemid'], ['-num', 'itemid'],
+                      ['-num', '-itemid']):
+            rows = [dict(itemid=i, num=n) for i, n in
+                    [(1, 10), (2, None), (3, 30), (4, 10)]]
+            expected = [r['itemid'] for r in
+                        resultspec.ResultSpec(order=order).apply(rows)]
+            self.assertEqual(self.execute(resultspec.ResultSpec(order=order)),
+                             expected)
+
+    def test_order_nulls_explicit(self):
+        from sqlalchemy.dialects import postgresql
+        rs = resultspec.ResultSpec(order=['-num', 'itemid'])
+        rs.fieldMapping = {'itemid': 'items.id', 'num': 'items.num'}
+        query, _ = rs.applyToSQLQuery(self.tbl.select())
+        sql = str(query.compile(dialect=postgresql.dialect()))
+        orderBy = sql[sql.index('ORDER BY'):]
+        # only the nullable column needs the explicit NULL ordering
+        self.assertEqual(orderBy.count('CASE WHEN'), 1)
+        self.assertIn('END DESC, items.num DESC, items.id', orderBy)
+
+    @defer.inlineCallbacks
+    def test_stream_nulls(self):
+        self.conn.execute(self.tbl.insert(), [
+            dict(id=5, name='e', num=None, when=5000),
+        ])
+        for order, names in [(['num'], 'beadc'), (['-num'], 'cadbe')]:
+            rs = resultspec.ResultSpec(order=order, fields=['name'])
+            batches = yield self.getBatches(rs, 1)
+            self.assertEqual(''.join(b[0]['name'] for b in batches), names)
+
+    def test_after_unmapped_order(self):
+        rs = resultspec.ResultSpec(order=['color'], after=['red'])
+        self.assertEqual(sorted(self.execute(rs)), [1, 2, 3, 4])
+        self.assertEqual((rs.order, rs.after), (['color'], ['red']))
+
+    def test_unmapped_filter(self):
+        f = resultspec.Filter('color', 'eq', ['red'])
+        rs = resultspec.ResultSpec(
+            filters=[f, resultspec.Filter('num', 'eq', [10])],
+            order=['itemid'], limit=1)
+        self.assertEqual(sorted(self.execute(rs)), [1, 4])
+        # the remaining parts are left for apply
+        self.assertEqual((rs.filters, rs.order, rs.limit),
+                         ([f], ['itemid'], 1))
+
+    def test_unmapped_order(self):
+        rs = resultspec.ResultSpec(order=['color'], limit=1)
+        self.assertEqual(sorted(self.execute(rs)), [1, 2, 3, 4])
+        self.assertEqual((rs.order, rs.limit), (['color'], 1))
+
+    def executeAggregates(self, rs):
+        rs.fieldMapping = {'itemid': 'items.id', 'name': 'items.name',
+                           'num': 'items.num', 'when': 'items.when',
+                           'label': ('items.name', 'items.num')}
+        return rs.thd_execute(self.conn, self.tbl.select(),
+                              lambda row: dict(itemid=row.id, name=row.name,
+                                               num=row.num, when=row.when))
+
+    def test_aggregates(self):
+        rs = resultspec.ResultSpec(
+            filters=[resultspec.Filter('itemid', 'gt', [1])],
+            aggregates=[resultspec.Aggregate('count'),
+                        resultspec.Aggregate('min', 'when'),
+                        resultspec.Aggregate('avg', 'itemid')],
+            groupBy=['num'])
+        res = self.executeAggregates(rs)
+        self.assertEqual(list(res), [])
+        self.assertEqual(res.aggregates, [
+            {'num': None, 'count': 1, 'min_when': 2000, 'avg_itemid': 2.0},
+            {'num': 10, 'count': 1, 'min_when': 4000, 'avg_itemid': 4.0},
+            {'num': 30, 'count': 1, 'min_when': 3000, 'avg_itemid': 3.0},
+        ])
+        # apply returns the rows
+        self.assertEqual(list(rs.apply(res)), res.aggregates)
+
+    def test_aggregates_count(self):
+        rs = resultspec.ResultSpec(
+            aggregates=[resultspec.Aggregate('count'),
+                        resultspec.Aggregate('count', 'num')])
+        self.assertEqual(self.executeAggregates(rs).aggregates,
+                         [{'count': 4, 'count_num': 3}])
+
+    def test_aggregates_unmapped_filter(self):
+        # the aggregates are computed in memory, from the filtered rows
+        f = resultspec.Filter('color', 'eq', ['red'])
+        rs = resultspec.ResultSpec(
+            filters=[f, resultspec.Filter('num', 'eq', [10])],
+            aggregates=[resultspec.Aggregate('count')])
+        res = self.executeAggregates(rs)
+        self.assertFalse(isinstance(res, base.ListResult))
+        self.assertEqual(sorted(r['itemid'] for r in res), [1, 4])
+        self.assertEqual(rs.filters, [f])
+
+    def test_aggregates_computed_field(self):
+        rs = resultspec.ResultSpec(
+            aggregates=[resultspec.Aggregate('count')], groupBy=['label'])
+        res = self.executeAggregates(rs)
+        self.assertFalse(isinstance(res, base.ListResult))
+        self.assertEqual(len(res), 4)
+
+    def executeRows(self, rs):
+        rs.fieldMapping = {'itemid': 'items.id', 'name': 'items.name',
+                           'num': 'items.num', 'when': 'items.when',
+                           'label': ('items.name', 'items.num')}
+        return rs.thd_execute(self.conn, self.tbl.select(),
+                              lambda row: (row.id, row.name, row.num, row.when))
+
+    def test_projection(self):
+        rs = resultspec.ResultSpec(fields=['itemid', 'name'],
+                                   filters=[resultspec.Filter('num', 'eq', [10])])
+        # the filter is applied in SQL, so 'num' is not needed
+        self.assertEqual(sorted(self.executeRows(rs)),
+                         [(1, 'a', None, None), (4, 'd', None, None)])
+
+    def test_projection_computed_field(self):
+        rs = resultspec.ResultSpec(fields=['label'], order=['itemid'])
+        self.assertEqual(self.executeRows(rs),
+                         [(None, 'a', 10, None), (None, 'b', None, None),
+                          (None, 'c', 30, None), (None, 'd', 10, None)])
+
+    def test_projection_remaining_filter(self):
+        f = resultspec.Filter('label', 'eq', ['x'])
+        rs = resultspec.ResultSpec(fields=['itemid'], filters=[f])
+        # computed fields cannot be filtered in SQL, so their columns are
+        # selected for the in-memory filter
+        self.assertEqual(sorted(self.executeRows(rs))[0], (1, 'a', 10, None))
+        self.assertEqual(rs.filters, [f])
+
+    def test_projection_unmapped_field(self):
+        rs = resultspec.ResultSpec(fields=['itemid', 'color'])
+        self.assertEqual(sorted(self.executeRows(rs))[0], (1, 'a', 10, 1000))
+
+    def getBatch(self, rs):
+        # the batches do not count the whole collection
+        self.assertFalse(rs.countTotal)
+        rs.fieldMapping = {'itemid': 'items.id', 'name': 'items.name',
+                           'num': 'items.num', 'when': 'items.when'}
+        rows = rs.thd_execute(self.conn, self.tbl.select(),
+                              lambda row: dict(itemid=row.id, name=row.name,
+                                               num=row.num, when=row.when))
+        return defer.succeed(rs.apply(rows))
+
+    @defer.inlineCallbacks
+    def getBatches(self, rs, batchSize):
+        stream = rs.stream(self.getBatch, 'itemid', batchSize)
+        batches = []
+        while True:
+            batch = yield stream.nextBatch()
+            if not batch:
+                break
+            batches.append(batch)
+        defer.returnValue(batches)
+
+    @defer.inlineCallbacks
+    def test_stream(self):
+        rs = resultspec.ResultSpec(order=['-num'], fields=['name'])
+        batches = yield self.getBatches(rs, 2)
+        self.assertEqual(batches, [mklist('name', 'c', 'a'),
+                                   mklist('name', 'd', 'b')])
+
+    @defer.inlineCallbacks
+    def test_stream_filter(self):
+        rs = resultspec.ResultSpec(
+            filters=[resultspec.Filter('num', 'eq', [10])])
+        batches = yield self.getBatches(rs, 1)
+        self.assertEqual([[i['name'] for i in b] for b in batches],
+                         [['a'], ['d']])
+
+    def test_canStream(self):
+        mapping = {'a': 't.a', 'b': ('t.b',)}
+        Filter = resultspec.Filter
+        self.assertTrue(resultspec.ResultSpec(
+            filters=[Filter('a', 'eq', [1])], order=['-a'], fields=['b'],
+        ).canStream(mapping))
+        self.assertFalse(resultspec.ResultSpec(
+            filters=[Filter('b', 'eq', [1])]).canStream(mapping))
+        self.assertFalse(resultspec.ResultSpec(
+            order=['c']).canStream(mapping))
+        self.assertFalse(resultspec.ResultSpec(limit=10).canStream(mapping))
+        self.assertFalse(resultspec.ResultSpec(offset=10).canStream(mapping))
+        self.assertFalse(resultspec.ResultSpec(
+            aggregates=[resultspec.Aggregate('count')]).canStream(mapping))
+
+    def test_includesField(self):
+        rs = resultspec.ResultSpec(fields=['a'],
+                                   filters=[resultspec.Filter('b', 'eq', [1])],
+                                   order=['-c'])
+        self.assertEqual([rs.includesField(f) for f in 'abcd'],
+                         [True, True, True, False])
+        self.assertTrue(resultspec.ResultSpec().includesField('d'))
+
+    def test_includesField_aggregates(self):
+        rs = resultspec.ResultSpec(
+            aggregates=[resultspec.Aggregate('max', 'a')], groupBy=['b'])
+        self.assertEqual([rs.includesField(f) for f in 'abc'],
+                         [True, True, False])
@@ -102,6 +102,13 @@ class StepEndpoint(endpoint.EndpointMixin, unittest.TestCase):
         step = yield self.callGet(('steps', 9999))
         self.assertEqual(step, None)
 
+    @defer.inlineCallbacks
+    def test_isImmutable(self):
+        self.assertFalse((yield self.ep.isImmutable({'complete': False}, {})))
+        self.assertTrue((yield self.ep.isImmutable({'complete': True}, {})))
+        # the field may not have been requested
+        self.assertFalse((yield self.ep.isImmutable({'stepid': 72}, {})))
+
 
 class StepsEndpoint(endpoint.EndpointMixin, unittest.TestCase):
 
@@ -146,6 +153,24 @@ class StepsEndpoint(endpoint.EndpointMixin, unittest.TestCase):
         [self.validateData(step) for step in steps]
         self.assertEqual([s['number'] for s in steps], [0, 1, 2])
 
+    @defer.inlineCallbacks
+    def test_isImmutable(self):
+        kwargs = {'builderid': 77, 'build_number': 7}
+        self.assertFalse((yield self.ep.isImmutable([], kwargs)))
+        yield self.db.builds.finishBuild(30, 0)
+        self.assertTrue((yield self.ep.isImmutable([], kwargs)))
+        self.assertFalse((yield self.ep.isImmutable([], {'buildid': 31})))
+
+    @defer.inlineCallbacks
+    def test_isImmutable_result(self):
+        steps = yield self.callGet(('builds', 30, 'steps'))
+        self.assertFalse(steps.immutable)
+        yield self.db.builds.finishBuild(30, 0)
+        self.assertFalse((yield self.ep.isImmutable(steps, {'buildid': 30})))
+        steps = yield self.callGet(('builds', 30, 'steps'))
+        self.assertTrue(steps.immutable)
+        self.assertTrue((yield self.ep.isImmutable(steps, {'buildid': 30})))
+
 
 class Step(interfaces.InterfaceTests, unittest.TestCase):
 
@@ -15,6 +15,7 @@
 
 import datetime
 
+from buildbot.data import resultspec
 from buildbot.db import buildrequests
 from buildbot.test.fake import fakedb
 from buildbot.test.fake import fakemaster
@@ -23,6 +24,7 @@ from buildbot.test.util import db
 from buildbot.test.util import interfaces
 from buildbot.util import UTC
 from buildbot.util import epoch2datetime
+from twisted.internet import defer
 from twisted.internet import task
 from twisted.trial import unittest
 
@@ -754,3 +756,25 @@ class TestRealDB(unittest.TestCase,
 
     def tearDown(self):
         return self.tearDownConnectorComponent()
+
+    @defer.inlineCallbacks
+    def test_getBuildRequests_resultSpec_aggregates(self):
+        yield self.insertTestData([
+            fakedb.BuildRequest(id=8, buildsetid=self.BSID, buildername='bb'),
+            fakedb.BuildRequest(id=9, buildsetid=self.BSID, buildername='cc'),
+            fakedb.BuildRequest(id=10, buildsetid=self.BSID, buildername='cc'),
+            fakedb.BuildRequest(id=11, buildsetid=self.BSID, buildername='cc'),
+            fakedb.BuildRequestClaim(brid=11, masterid=self.MASTER_ID,
+                                     claimed_at=self.CLAIMED_AT_EPOCH),
+        ])
+        rs = resultspec.ResultSpec(
+            aggregates=[resultspec.Aggregate('count')],
+            groupBy=['buildername'])
+        rs.fieldMapping = {'buildername': 'buildrequests.buildername'}
+        brlist = yield self.db.buildrequests.getBuildRequests(
+            claimed=False, resultSpec=rs)
+        # the counts are computed in SQL, from the joined query
+        self.assertEqual(brlist.aggregates, [
+            {'buildername': 'bb', 'count': 1},
+            {'buildername': 'cc', 'count': 2},
+        ])
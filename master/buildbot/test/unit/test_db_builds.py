@@ -13,6 +13,8 @@
 #
 # Copyright Buildbot Team Members
 
+from buildbot.data import base
+from buildbot.data import resultspec
 from buildbot.db import builds
 from buildbot.test.fake import fakedb
 from buildbot.test.fake import fakemaster
@@ -90,7 +92,8 @@ class Tests(interfaces.InterfaceTests):
 
     def test_signature_getBuilds(self):
         @self.assertArgSpecMatches(self.db.builds.getBuilds)
-        def getBuilds(self, builderid=None, buildrequestid=None):
+        def getBuilds(self, builderid=None, buildrequestid=None,
+                      resultSpec=None):
             pass
 
     def test_signature_addBuild(self):
@@ -257,6 +260,70 @@ class Tests(interfaces.InterfaceTests):
 
 class RealTests(Tests):
 
+    def makeResultSpec(self, **kwargs):
+        rs = resultspec.ResultSpec(**kwargs)
+        rs.fieldMapping = {'buildid': 'builds.id', 'number': 'builds.number',
+                           'started_at': 'builds.started_at'}
+        return rs
+
+    @defer.inlineCallbacks
+    def test_getBuilds_resultSpec(self):
+        yield self.insertTestData(self.backgroundData + self.threeBuilds)
+        rs = self.makeResultSpec(
+            filters=[resultspec.Filter('started_at', 'gt',
+                                       [epoch2datetime(TIME1)])],
+            order=['-number'], limit=1, offset=1)
+        bdicts = yield self.db.builds.getBuilds(resultSpec=rs)
+        self.assertEqual(bdicts, base.ListResult([self.threeBdicts[51]],
+                                                 offset=1, total=2, limit=1))
+        # everything was applied, so nothing is left to do
+        self.assertEqual((rs.filters, rs.order, rs.limit, rs.offset),
+                         ([], None, None, None))
+
+    @defer.inlineCallbacks
+    def test_getBuilds_resultSpec_unmapped_filter(self):
+        yield self.insertTestData(self.backgroundData + self.threeBuilds)
+        complete = resultspec.Filter('complete', 'eq', [False])
+        rs = self.makeResultSpec(
+            filters=[complete, resultspec.Filter('buildid', 'ne', [50])],
+            order=['number'], limit=1)
+        bdicts = yield self.db.builds.getBuilds(resultSpec=rs)
+        # the buildid filter is applied, but the rest is left in the result
+        # spec to be applied in memory
+        self.assertEqual(sorted(bdicts, key=lambda bd: bd['id']),
+                         [self.threeBdicts[51], self.threeBdicts[52]])
+        self.assertEqual((rs.filters, rs.order, rs.limit),
+                         ([complete], ['number'], 1))
+
+    @defer.inlineCallbacks
+    def test_getBuilds_resultSpec_fields(self):
+        yield self.insertTestData(self.backgroundData + self.threeBuilds)
+        rs = self.makeResultSpec(fields=['buildid', 'number'])
+        bdicts = yield self.db.builds.getBuilds(resultSpec=rs)
+        # only the requested columns are selected
+        self.assertEqual(sorted(bdicts, key=lambda bd: bd['id'])[0],
+                         dict(id=50, number=5, builderid=None,
+                              buildrequestid=None, buildslaveid=None,
+                              masterid=None, started_at=None,
+                              complete_at=None, state_strings=None,
+                              results=None))
+
+    @defer.inlineCallbacks
+    def test_getBuilds_resultSpec_aggregates(self):
+        yield self.insertTestData(self.backgroundData + self.threeBuilds)
+        rs = self.makeResultSpec(
+            aggregates=[resultspec.Aggregate('count'),
+                        resultspec.Aggregate('max', 'started_at')],
+            groupBy=['builderid'])
+        rs.fieldMapping['builderid'] = 'builds.builderid'
+        bdicts = yield self.db.builds.getBuilds(resultSpec=rs)
+        # the aggregates are computed in SQL, instead of fetching the builds
+        self.assertEqual(list(bdicts), [])
+        self.assertEqual(bdicts.aggregates, [
+            {'builderid': 77, 'count': 2, 'max_started_at': TIME3},
+            {'builderid': 88, 'count': 1, 'max_started_at': TIME2},
+        ])
+
     @defer.inlineCallbacks
     def test_addBuild_existing_race(self):
         clock = task.Clock()
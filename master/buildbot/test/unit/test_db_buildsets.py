@@ -16,6 +16,7 @@
 import datetime
 import mock
 
+from buildbot.data import resultspec
 from buildbot.db import buildsets
 from buildbot.test.fake import fakedb
 from buildbot.test.fake import fakemaster
@@ -62,7 +63,7 @@ class Tests(interfaces.InterfaceTests):
 
     def test_signature_getBuildsets(self):
         @self.assertArgSpecMatches(self.db.buildsets.getBuildsets)
-        def getBuildsets(self, complete=None):
+        def getBuildsets(self, complete=None, resultSpec=None):
             pass
 
     def test_signature_getRecentBuildsets(self):
@@ -544,6 +545,19 @@ class RealTests(Tests):
         d.addCallback(check)
         return d
 
+    @defer.inlineCallbacks
+    def test_getBuildsets_resultSpec_fields(self):
+        yield self.insert_test_getBuildsets_data()
+        rs = resultspec.ResultSpec(fields=['bsid', 'reason'])
+        rs.fieldMapping = {'bsid': 'buildsets.id',
+                           'reason': 'buildsets.reason',
+                           'sourcestamps': ('buildsets.id',)}
+        bsdictlist = yield self.db.buildsets.getBuildsets(resultSpec=rs)
+        # the sourcestamps are not fetched, since they were not requested
+        self.assertEqual(sorted((bs['bsid'], bs['reason'], bs['sourcestamps'])
+                                for bs in bsdictlist),
+                         [(91, 'rsn1', []), (92, 'rsn2', [])])
+
 
 class TestFakeDB(unittest.TestCase, Tests):
 
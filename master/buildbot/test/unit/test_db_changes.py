@@ -13,8 +13,11 @@
 #
 # Copyright Buildbot Team Members
 
+import mock
 import sqlalchemy as sa
 
+from buildbot.data import base
+from buildbot.data import resultspec
 from buildbot.db import changes
 from buildbot.db import sourcestamps
 from buildbot.test.fake import fakedb
@@ -220,7 +223,7 @@ class Tests(interfaces.InterfaceTests):
 
     def test_signature_getChanges(self):
         @self.assertArgSpecMatches(self.db.changes.getChanges)
-        def getChanges(self):
+        def getChanges(self, resultSpec=None):
             pass
 
     def insert7Changes(self):
@@ -303,6 +306,23 @@ class Tests(interfaces.InterfaceTests):
         d.addCallback(check)
         return d
 
+    def test_signature_getChangesByIds(self):
+        @self.assertArgSpecMatches(self.db.changes.getChangesByIds)
+        def getChangesByIds(self, changeids):
+            pass
+
+    @defer.inlineCallbacks
+    def test_getChangesByIds(self):
+        yield self.insert7Changes()
+        changes = yield self.db.changes.getChangesByIds([14, 99, 13, 9])
+        # in the requested order, omitting missing changes
+        self.assertEqual([c['changeid'] for c in changes], [14, 13, 9])
+        self.assertEqual(changes[0], self.change14_dict)
+        self.assertEqual(sorted(changes[1]['files']),
+                         ['master/README.txt', 'slave/README.txt'])
+        self.assertEqual(changes[1]['properties'],
+                         {'notest': ('no', 'Change')})
+
     def test_signature_getLatestChangeid(self):
         @self.assertArgSpecMatches(self.db.changes.getLatestChangeid)
         def getLatestChangeid(self):
@@ -337,6 +357,50 @@ class RealTests(Tests):
 
     # tests that only "real" implementations will pass
 
+    @defer.inlineCallbacks
+    def test_getChanges_resultSpec(self):
+        yield self.insert7Changes()
+        rs = resultspec.ResultSpec(
+            filters=[resultspec.Filter('changeid', 'ge', [10])],
+            order=['-changeid'], limit=2, offset=1)
+        rs.fieldMapping = {'changeid': 'changes.changeid'}
+        changes = yield self.db.changes.getChanges(resultSpec=rs)
+        self.assertIsInstance(changes, base.ListResult)
+        self.assertEqual([c['changeid'] for c in changes], [13, 12])
+        self.assertEqual((changes.offset, changes.total, changes.limit),
+                         (1, 5, 2))
+
+    @defer.inlineCallbacks
+    def test_getChanges_resultSpec_fields(self):
+        yield self.insert7Changes()
+        rs = resultspec.ResultSpec(fields=['author'])
+        rs.fieldMapping = {'changeid': 'changes.changeid',
+                           'author': 'changes.author'}
+        changes = yield self.db.changes.getChanges(resultSpec=rs)
+        # complete chdicts are returned, since they are cached
+        self.assertEqual(sorted(changes)[-1], self.change14_dict)
+
+    @defer.inlineCallbacks
+    def test_getRecentChanges_bulk(self):
+        yield self.insert7Changes()
+        self.db.changes.BULK_BATCH_SIZE = 2
+        put = self.db.changes.getChange.cache.put = mock.Mock()
+        queries = []
+        sa.event.listen(self.db.pool.engine, 'before_execute',
+                        lambda conn, clauseelement, multiparams, params:
+                        queries.append(clauseelement))
+        changes = yield self.db.changes.getRecentChanges(5)
+        self.assertEqual([c['changeid'] for c in changes], [10, 11, 12, 13, 14])
+        self.assertEqual(changes[3]['properties'],
+                         {'notest': ('no', 'Change')})
+        # one query for the changes, and one each for the files and
+        # properties of each batch of changes
+        self.assertEqual(len(queries), 1 + 2 * 3)
+
+        # and they are fed to the cache used by getChange
+        put.assert_any_call(14, self.change14_dict)
+        self.assertEqual(put.call_count, 5)
+
     def test_addChange(self):
         clock = task.Clock()
         clock.advance(SOMETIME)
@@ -40,8 +40,12 @@ class DBConnector(db.RealDatabaseMixin, unittest.TestCase):
 
         self.master = fakemaster.make_master()
         self.master.config = config.MasterConfig()
+        self.master.data = mock.Mock()
         self.db = connector.DBConnector(self.master,
                                         os.path.abspath('basedir'))
+        # the connector's in-memory database has no tables to compress
+        self.db.logs.compressFinishedLogs = mock.Mock(
+            side_effect=lambda: defer.succeed(0))
 
     @defer.inlineCallbacks
     def tearDown(self):
@@ -70,6 +74,7 @@ class DBConnector(db.RealDatabaseMixin, unittest.TestCase):
             return_value=defer.succeed(None))
         self.db._doCleanup()
         self.assertFalse(self.db.changes.pruneChanges.called)
+        self.assertFalse(self.db.logs.compressFinishedLogs.called)
 
     def test_doCleanup_configured(self):
         self.db.changes.pruneChanges = mock.Mock(
@@ -80,6 +85,9 @@ class DBConnector(db.RealDatabaseMixin, unittest.TestCase):
         def check(_):
             self.db._doCleanup()
             self.assertTrue(self.db.changes.pruneChanges.called)
+            self.master.data.resultCache.invalidatePrefix.assert_called_with(
+                ('changes',))
+            self.assertTrue(self.db.logs.compressFinishedLogs.called)
         return d
 
     def test_setup_check_version_bad(self):
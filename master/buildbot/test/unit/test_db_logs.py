@@ -13,15 +13,19 @@
 #
 # Copyright Buildbot Team Members
 
+import mock
+import os
 import textwrap
 
 from buildbot.db import logs
 from buildbot.test.fake import fakedb
 from buildbot.test.fake import fakemaster
 from buildbot.test.util import connector_component
+from buildbot.test.util import dirs
 from buildbot.test.util import interfaces
 from buildbot.test.util import validation
 from twisted.internet import defer
+from twisted.internet import task
 from twisted.trial import unittest
 
 
@@ -57,6 +61,7 @@ class Tests(interfaces.InterfaceTests):
                         content="yet another line"),
     ]
 
+    @defer.inlineCallbacks
     def checkTestLogLines(self):
         expLines = ['line zero', 'line 1', 'line TWO', 'line 3', 'line 2**2',
                     'another line', 'yet another line']
@@ -65,10 +70,10 @@ class Tests(interfaces.InterfaceTests):
                 got_lines = yield self.db.logs.getLogLines(201,
                                                            first_line, last_line)
                 self.assertEqual(got_lines,
-                                 "\n".join(expLines[first_line:last_line + 1] + "\n"))
+                                 "\n".join(expLines[first_line:last_line + 1]) + "\n")
         # check overflow
         self.assertEqual((yield self.db.logs.getLogLines(201, 5, 20)),
-                         "\n".join(expLines[5:7] + "\n"))
+                         "\n".join(expLines[5:7]) + "\n")
 
     # signature tests
 
@@ -102,6 +107,11 @@ class Tests(interfaces.InterfaceTests):
         def appendLog(self, logid, content):
             pass
 
+    def test_signature_flushAppends(self):
+        @self.assertArgSpecMatches(self.db.logs.flushAppends)
+        def flushAppends(self):
+            pass
+
     def test_signature_finishLog(self):
         @self.assertArgSpecMatches(self.db.logs.finishLog)
         def finishLog(self, logid):
@@ -112,6 +122,11 @@ class Tests(interfaces.InterfaceTests):
         def compressLog(self, logid):
             pass
 
+    def test_signature_compressFinishedLogs(self):
+        @self.assertArgSpecMatches(self.db.logs.compressFinishedLogs)
+        def compressFinishedLogs(self):
+            pass
+
     # method tests
 
     @defer.inlineCallbacks
@@ -176,7 +191,7 @@ class Tests(interfaces.InterfaceTests):
     @defer.inlineCallbacks
     def test_getLogLines(self):
         yield self.insertTestData(self.backgroundData + self.testLogLines)
-        self.checkTestLogLines()
+        yield self.checkTestLogLines()
 
         # check line number reversal
         self.assertEqual((yield self.db.logs.getLogLines(201, 6, 3)), '')
@@ -236,12 +251,39 @@ class Tests(interfaces.InterfaceTests):
             'type': u's',
         })
 
+    @defer.inlineCallbacks
+    def test_appendLog_overlapping(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        res = yield defer.gatherResults([
+            self.db.logs.appendLog(201, u'abc\ndef\n'),
+            self.db.logs.appendLog(201, u'ghi\n'),
+            self.db.logs.appendLog(201, u'\n'),
+            self.db.logs.appendLog(201, u'jkl\n'),
+        ])
+        self.assertEqual(res, [(7, 8), (9, 9), (10, 10), (11, 11)])
+        self.assertEqual((yield self.db.logs.getLogLines(201, 6, 11)),
+                         u"yet another line\nabc\ndef\nghi\n\njkl\n")
+        self.assertEqual((yield self.db.logs.getLog(201))['num_lines'], 12)
+
+    @defer.inlineCallbacks
+    def test_finishLog(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.finishLog(201)
+        logdict = yield self.db.logs.getLog(201)
+        self.assertEqual(logdict['complete'], True)
+
     @defer.inlineCallbacks
     def test_compressLog(self):
         yield self.insertTestData(self.backgroundData + self.testLogLines)
         yield self.db.logs.compressLog(201)
         # test log lines should still be readable just the same
-        self.checkTestLogLines()
+        yield self.checkTestLogLines()
+
+    @defer.inlineCallbacks
+    def test_compressFinishedLogs(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.compressFinishedLogs()
+        yield self.checkTestLogLines()
 
     @defer.inlineCallbacks
     def test_addLogLines_big_chunk(self):
@@ -296,6 +338,89 @@ class RealTests(Tests):
             line = yield self.db.logs.getLogLines(201, lineno, lineno)
             self.assertEqual(len(line), 65537)
 
+    @defer.inlineCallbacks
+    def test_appendLog_batched(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        logid = yield self.db.logs.addLog(
+            stepid=102, name=u'another', slug=u'another', type=u's')
+        self.db.logs._reactor = clock = task.Clock()
+        self.patch(self.db.pool, 'do', mock.Mock(wraps=self.db.pool.do))
+
+        d = defer.gatherResults([
+            self.db.logs.appendLog(201, u'abc\n'),
+            self.db.logs.appendLog(logid, u'xyz\n'),
+            self.db.logs.appendLog(201, u'def\nghi\n'),
+        ])
+        self.assertFalse(d.called)
+
+        clock.advance(self.db.logs.APPEND_BATCH_DELAY)
+        self.assertEqual((yield d), [(7, 7), (0, 0), (8, 9)])
+        # all of that was written in a single DB thread call
+        self.assertEqual(self.db.pool.do.call_count, 1)
+
+        # appends to the same log were coalesced into a single chunk
+        rows = yield self.getLogChunkRows(201)
+        self.assertEqual([(r['first_line'], r['last_line'], r['content'])
+                          for r in rows[4:]],
+                         [(7, 9, 'abc\ndef\nghi')])
+        self.assertEqual((yield self.db.logs.getLog(201))['num_lines'], 10)
+        self.assertEqual((yield self.db.logs.getLog(logid))['num_lines'], 1)
+
+    @defer.inlineCallbacks
+    def test_appendLog_batch_size(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        self.db.logs._reactor = task.Clock()
+        self.patch(self.db.logs, 'APPEND_BATCH_SIZE', 10)
+        d1 = self.db.logs.appendLog(201, u'abc\n')
+        # the batch is written as soon as it is big enough, without waiting
+        res = yield self.db.logs.appendLog(201, u'0123456789\n')
+        self.assertEqual(res, (8, 8))
+        self.assertEqual((yield d1), (7, 7))
+
+    @defer.inlineCallbacks
+    def test_appendLog_failed_batch(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        self.assertEqual((yield self.db.logs.appendLog(201, u'abc\n')),
+                         (7, 7))
+
+        storage = self.db.logs.getStorage()
+        thdAddChunks = storage.thdAddChunks
+
+        def failingAddChunks(conn, chunks):
+            # fail after writing the chunks, which must be rolled back
+            thdAddChunks(conn, chunks)
+            self.patch(storage, 'thdAddChunks', thdAddChunks)
+            raise RuntimeError("oh noes")
+        self.patch(storage, 'thdAddChunks', failingAddChunks)
+        yield self.assertFailure(self.db.logs.appendLog(201, u'def\n'),
+                                 RuntimeError)
+        self.flushLoggedErrors(RuntimeError)
+
+        # the failed batch left no gap in the line numbers
+        self.assertEqual((yield self.db.logs.appendLog(201, u'ghi\n')),
+                         (8, 8))
+        self.assertEqual((yield self.db.logs.getLogLines(201, 7, 8)),
+                         u'abc\nghi\n')
+        self.assertEqual((yield self.db.logs.getLog(201))['num_lines'], 9)
+
+    @defer.inlineCallbacks
+    def test_appendLog_missing_log(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        self.assertEqual((yield self.db.logs.appendLog(999, u'abc\n')), None)
+
+    @defer.inlineCallbacks
+    def test_finishLog_writes_pending(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        self.db.logs._reactor = task.Clock()
+        d = self.db.logs.appendLog(201, u'abc\n')
+        yield self.db.logs.finishLog(201)
+        self.assertEqual((yield d), (7, 7))
+        logdict = yield self.db.logs.getLog(201)
+        self.assertEqual((logdict['complete'], logdict['num_lines']),
+                         (True, 8))
+        self.assertEqual((yield self.db.logs.getLogLines(201, 7, 7)),
+                         u'abc\n')
+
     def test_splitBigChunk_unicode_misalignment(self):
         unaligned = (u'a ' + u'\N{SNOWMAN}' * 30000 + '\n').encode('utf-8')
         # the first 65536 bytes of that line are not valid utf-8
@@ -306,8 +431,156 @@ class RealTests(Tests):
         self.assertEqual(len(chunk), 65534)
         chunk.decode('utf-8')
 
-    # TODO: test compressing with >64k
-    # TODO: test compressing compressed size >64k
+    def getLogChunkRows(self, logid):
+        def thd(conn):
+            tbl = self.db.model.logchunks
+            q = tbl.select(whereclause=(tbl.c.logid == logid))
+            q = q.order_by(tbl.c.first_line)
+            return [dict(row) for row in conn.execute(q).fetchall()]
+        return self.db.pool.do(thd)
+
+    @defer.inlineCallbacks
+    def test_compressLog_merges_chunks(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.compressLog(201)
+        rows = yield self.getLogChunkRows(201)
+        self.assertEqual([(r['first_line'], r['last_line']) for r in rows],
+                         [(0, 6)])
+        yield self.checkTestLogLines()
+
+    @defer.inlineCallbacks
+    def do_test_compressLog_method(self, method, compressed):
+        self.db.master.config.logCompressionMethod = method
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.appendLog(201, u'abc\n' * 20000)  # 80k
+        saved = yield self.db.logs.compressLog(201)
+        self.assertTrue(saved > 0)
+
+        rows = yield self.getLogChunkRows(201)
+        # adjacent chunks are merged as long as the uncompressed result fits
+        # in a single chunk
+        self.assertEqual([(r['first_line'], r['last_line']) for r in rows],
+                         [(0, 6), (7, 16390), (16391, 20006)])
+        self.assertEqual([r['compressed'] for r in rows[1:]],
+                         [compressed, compressed])
+        self.assertEqual((yield self.db.logs.getLogLines(201, 5, 6)),
+                         u'another line\nyet another line\n')
+        lines = yield self.db.logs.getLogLines(201, 7, 50000)
+        self.assertEqual(lines, u'abc\n' * 20000)
+
+        # compressing again does not change anything
+        self.assertEqual((yield self.db.logs.compressLog(201)), 0)
+
+    def test_compressLog_gz(self):
+        return self.do_test_compressLog_method('gz', 1)
+
+    def test_compressLog_bz2(self):
+        return self.do_test_compressLog_method('bz2', 2)
+
+    def test_compressLog_lz4(self):
+        if not logs.lz4:
+            raise unittest.SkipTest("lz4 is not installed")
+        return self.do_test_compressLog_method('lz4', 3)
+
+    @defer.inlineCallbacks
+    def test_compressLog_raw(self):
+        self.db.master.config.logCompressionMethod = 'raw'
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.compressLog(201)
+        rows = yield self.getLogChunkRows(201)
+        self.assertEqual([(r['first_line'], r['last_line'], r['compressed'])
+                          for r in rows],
+                         [(0, 6, 0)])
+        yield self.checkTestLogLines()
+
+    @defer.inlineCallbacks
+    def test_getLogLines_offsets_cached(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.appendLog(201, u'abc\n' * 20000)
+        yield self.db.logs.compressLog(201)
+        cache = self.db.logs._lineOffsets
+        cache.hits = cache.misses = 0
+        for first_line in 100, 5000, 16000:
+            lines = yield self.db.logs.getLogLines(201, first_line,
+                                                   first_line + 9)
+            self.assertEqual(lines, u'abc\n' * 10)
+        # the index for the chunk holding those lines was built only once
+        self.assertEqual((cache.misses, cache.hits), (1, 2))
+
+    @defer.inlineCallbacks
+    def test_compressFinishedLogs_batches(self):
+        self.db.master.config.logCompressionMethod = 'gz'
+        self.patch(self.db.logs, 'COMPRESS_BATCH_SIZE', 1)
+        yield self.insertTestData(self.backgroundData + self.testLogLines + [
+            fakedb.Log(id=202, stepid=101, name=u'done', slug=u'done',
+                       complete=1, num_lines=2, type=u's'),
+            fakedb.LogChunk(logid=202, first_line=0, last_line=0,
+                            compressed=0, content='x' * 1000),
+            fakedb.LogChunk(logid=202, first_line=1, last_line=1,
+                            compressed=0, content='y' * 1000),
+            fakedb.Log(id=203, stepid=102, name=u'done', slug=u'done',
+                       complete=1, num_lines=1, type=u's'),
+            fakedb.LogChunk(logid=203, first_line=0, last_line=0,
+                            compressed=0, content='z' * 1000),
+        ])
+
+        # one call handles every batch
+        self.assertTrue((yield self.db.logs.compressFinishedLogs()) > 0)
+        self.assertEqual([r['compressed'] for r in
+                          (yield self.getLogChunkRows(202))], [1])
+        self.assertEqual([r['compressed'] for r in
+                          (yield self.getLogChunkRows(203))], [1])
+
+        # the unfinished log is left alone, and there is nothing left to do
+        self.assertEqual((yield self.db.logs.compressFinishedLogs()), 0)
+        self.assertEqual(len((yield self.getLogChunkRows(201))), 4)
+        self.assertEqual((yield self.db.logs.getLogLines(202, 0, 1)),
+                         'x' * 1000 + '\n' + 'y' * 1000 + '\n')
+
+
+class FileStorageTests(Tests):
+
+    @defer.inlineCallbacks
+    def test_appendLog_writes_file(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        yield self.db.logs.appendLog(201, u'abc\ndef\n')
+        yield self.db.logs.appendLog(201, u'ghi\n')
+
+        filename = self.db.logs.getStorage().getFilename(201)
+        self.assertEqual(filename, os.path.join(os.path.abspath('basedir'),
+                                                'logs', '0', '201.log'))
+        with open(filename) as f:
+            content = f.read()
+        self.assertTrue(content.endswith('yet another lineabc\ndefghi'))
+
+        def thd(conn):
+            tbl = self.db.model.logsegments
+            q = tbl.select(whereclause=(tbl.c.first_line > 6))
+            q = q.order_by(tbl.c.first_line)
+            return [dict(row) for row in conn.execute(q).fetchall()]
+        rows = yield self.db.pool.do(thd)
+        end = len(content) - len('abc\ndefghi')
+        self.assertEqual(rows, [
+            dict(logid=201, first_line=7, last_line=8, offset=end, length=7),
+            dict(logid=201, first_line=9, last_line=9, offset=end + 7,
+                 length=3),
+        ])
+
+    @defer.inlineCallbacks
+    def test_getLogLines_empty_lines_only(self):
+        yield self.insertTestData(self.backgroundData + [
+            fakedb.Log(id=201, stepid=101, name=u'stdio', slug=u'stdio',
+                       complete=0, num_lines=0, type=u's'),
+        ])
+        yield self.db.logs.appendLog(201, u'\n\n')
+        self.assertEqual((yield self.db.logs.getLogLines(201, 0, 5)),
+                         u'\n\n')
+
+    @defer.inlineCallbacks
+    def test_compressLog_leaves_files(self):
+        yield self.insertTestData(self.backgroundData + self.testLogLines)
+        self.assertEqual((yield self.db.logs.compressLog(201)), 0)
+        yield self.checkTestLogLines()
 
 
 class TestFakeDB(unittest.TestCase, Tests):
@@ -336,3 +609,38 @@ class TestRealDB(unittest.TestCase,
 
     def tearDown(self):
         return self.tearDownConnectorComponent()
+
+
+class TestRealDBFileStorage(unittest.TestCase,
+                            connector_component.ConnectorComponentMixin,
+                            dirs.DirsMixin,
+                            FileStorageTests):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        yield self.setUpDirs('basedir')
+        yield self.setUpConnectorComponent(
+            table_names=['logs', 'logsegments', 'steps', 'builds', 'builders',
+                         'masters', 'buildrequests', 'buildsets',
+                         'buildslaves'])
+        self.db.basedir = os.path.abspath('basedir')
+        self.db.master.config.db['log_storage'] = 'files'
+        self.db.logs = logs.LogsConnectorComponent(self.db)
+
+    def insertTestData(self, rows):
+        # log chunks go to the log files rather than to the database
+        chunks = [dict(logid=row.logid, first_line=row.first_line,
+                       last_line=row.last_line, content=row.content)
+                  for row in rows if isinstance(row, fakedb.LogChunk)]
+        d = connector_component.ConnectorComponentMixin.insertTestData(
+            self, [row for row in rows
+                   if not isinstance(row, fakedb.LogChunk)])
+        if chunks:
+            d.addCallback(lambda _: self.db.pool.do(
+                self.db.logs.getStorage().thdAddChunks, chunks))
+        return d
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        yield self.tearDownConnectorComponent()
+        yield self.tearDownDirs()
@@ -0,0 +1,59 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import sqlalchemy as sa
+
+from buildbot.test.util import migration
+from sqlalchemy.engine import reflection
+from twisted.trial import unittest
+
+
+class Migration(migration.MigrateTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        return self.setUpMigrateTest()
+
+    def tearDown(self):
+        return self.tearDownMigrateTest()
+
+    def test_migration(self):
+        def setup_thd(conn):
+            metadata = sa.MetaData()
+            metadata.bind = conn
+
+            sa.Table('logs', metadata,
+                     sa.Column('id', sa.Integer, primary_key=True),
+                     # ..
+                     ).create()
+
+        def verify_thd(conn):
+            metadata = sa.MetaData()
+            metadata.bind = conn
+
+            logsegments = sa.Table('logsegments', metadata, autoload=True)
+
+            q = sa.select([logsegments.c.logid, logsegments.c.first_line,
+                           logsegments.c.last_line, logsegments.c.offset,
+                           logsegments.c.length])
+            self.assertEqual(conn.execute(q).fetchall(), [])
+
+            insp = reflection.Inspector.from_engine(conn)
+            indexes = insp.get_indexes('logsegments')
+            self.assertEqual(
+                sorted([(i['name'], i['column_names']) for i in indexes]),
+                [('logsegments_firstline', ['logid', 'first_line']),
+                 ('logsegments_lastline', ['logid', 'last_line'])])
+
+        return self.do_test_migration(36, 37, setup_thd, verify_thd)
@@ -44,7 +44,7 @@ class Tests(interfaces.InterfaceTests):
 
     def test_signature_getSourceStamps(self):
         @self.assertArgSpecMatches(self.db.sourcestamps.getSourceStamps)
-        def getSourceStamps(self):
+        def getSourceStamps(self, resultSpec=None):
             pass
 
     @defer.inlineCallbacks
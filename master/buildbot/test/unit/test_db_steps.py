@@ -15,6 +15,7 @@
 
 import time
 
+from buildbot.data import resultspec
 from buildbot.db import steps
 from buildbot.test.fake import fakedb
 from buildbot.test.fake import fakemaster
@@ -89,7 +90,7 @@ class Tests(interfaces.InterfaceTests):
 
     def test_signature_getSteps(self):
         @self.assertArgSpecMatches(self.db.steps.getSteps)
-        def getSteps(self, buildid):
+        def getSteps(self, buildid, resultSpec=None):
             pass
 
     def test_signature_addStep(self):
@@ -268,6 +269,16 @@ class Tests(interfaces.InterfaceTests):
 
 class RealTests(Tests):
 
+    @defer.inlineCallbacks
+    def test_getSteps_resultSpec_order(self):
+        yield self.insertTestData(self.backgroundData + self.stepRows)
+        rs = resultspec.ResultSpec(order=['-number'])
+        rs.fieldMapping = {'number': 'steps.number'}
+        stepdicts = yield self.db.steps.getSteps(buildid=30, resultSpec=rs)
+        # the requested order replaces the default order
+        self.assertEqual(stepdicts, self.stepDicts[2::-1])
+        self.assertEqual(rs.order, None)
+
     # the fake connector doesn't deal with this edge case
 
     @defer.inlineCallbacks
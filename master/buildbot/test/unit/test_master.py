@@ -266,3 +266,14 @@ class StartupAndReconfig(dirs.DirsMixin, logging.LoggingMixin, unittest.TestCase
 
         self.assertRaises(config.ConfigErrors, lambda:
                           self.master.reconfigService(new))
+
+    @defer.inlineCallbacks
+    def test_reconfigService_log_storage_changed(self):
+        old = self.master.config = config.MasterConfig()
+        yield self.master.reconfigService(old)
+
+        new = config.MasterConfig()
+        new.db['log_storage'] = 'files'
+
+        self.assertRaises(config.ConfigErrors, lambda:
+                          self.master.reconfigService(new))
@@ -19,6 +19,7 @@ from buildbot.mq import simple
 from buildbot.test.fake import fakemaster
 from buildbot.test.util import interfaces
 from buildbot.test.util import tuplematching
+from buildbot.util import eventual
 from twisted.internet import defer
 from twisted.trial import unittest
 
@@ -62,6 +63,7 @@ class RealTests(tuplematching.TupleMatchingMixin, Tests):
         cb = mock.Mock()
         yield self.mq.startConsuming(cb, filter)
         self.mq.produce(routingKey, 'x')
+        yield eventual.flushEventualQueue()
         self.assertEqual(shouldMatch, cb.call_count == 1)
         if shouldMatch:
             cb.assert_called_once_with(routingKey, 'x')
@@ -71,8 +73,10 @@ class RealTests(tuplematching.TupleMatchingMixin, Tests):
         cb = mock.Mock()
         qref = yield self.mq.startConsuming(cb, ('abc',))
         self.mq.produce(('abc',), dict(x=1))
+        yield eventual.flushEventualQueue()
         qref.stopConsuming()
         self.mq.produce(('abc',), dict(x=1))
+        yield eventual.flushEventualQueue()
         cb.assert_called_once_with(('abc',), dict(x=1))
 
     @defer.inlineCallbacks
@@ -93,8 +97,10 @@ class RealTests(tuplematching.TupleMatchingMixin, Tests):
 
         qref.stopConsuming()
         self.mq.produce(('abc',), '{}')
+        yield eventual.flushEventualQueue()
 
         qref = yield self.mq.startConsuming(cb, ('abc',))
+        yield eventual.flushEventualQueue()
         qref.stopConsuming()
         qref2.stopConsuming()
 
@@ -111,6 +117,7 @@ class RealTests(tuplematching.TupleMatchingMixin, Tests):
         self.mq.produce(('abc',), '{}')
 
         qref = yield self.mq.startConsuming(cb, ('abc',), persistent_name='ABC')
+        yield eventual.flushEventualQueue()
         qref.stopConsuming()
 
         self.assertTrue(cb.called)
@@ -0,0 +1,147 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import datetime
+import struct
+
+from buildbot.mq import broker
+from buildbot.util import UTC
+from buildbot.util import json
+from twisted.internet import task
+from twisted.python import failure
+from twisted.test import proto_helpers
+from twisted.trial import unittest
+
+
+class Broker(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.broker = broker.Broker(historySize=3)
+        self.factory = broker.BrokerFactory(self.broker)
+
+    def connect(self):
+        proto = self.factory.buildProtocol(None)
+        proto._reactor = self.clock
+        proto.makeConnection(proto_helpers.StringTransport())
+        return proto
+
+    def send(self, proto, *ops):
+        frame = json.dumps(ops)
+        proto.dataReceived(struct.pack('!I', len(frame)) + frame)
+
+    def received(self, proto):
+        # flush, and return the operations sent in each frame
+        self.clock.advance(0)
+        data = proto.transport.value()
+        proto.transport.clear()
+        frames = []
+        while data:
+            length, = struct.unpack('!I', data[:4])
+            frames.append(json.loads(data[4:4 + length]))
+            data = data[4 + length:]
+        return frames
+
+    def test_routing(self):
+        a = self.connect()
+        b = self.connect()
+        self.send(a, ['sub', ['build', None, 'new']])
+        self.send(b, ['sub', ['build', '1', None]],
+                  ['pub', ['build', '1', 'new'], {'x': 1}],
+                  ['pub', ['build', '2', 'new'], {'x': 2}],
+                  ['pub', ['build', '1', 'finished'], {'x': 3}])
+        self.assertEqual(self.received(a), [[
+            ['msg', 1, ['build', '1', 'new'], {'x': 1}],
+            ['msg', 2, ['build', '2', 'new'], {'x': 2}],
+        ]])
+        # the messages for b arrive in a single frame
+        self.assertEqual(self.received(b), [[
+            ['msg', 1, ['build', '1', 'new'], {'x': 1}],
+            ['msg', 3, ['build', '1', 'finished'], {'x': 3}],
+        ]])
+
+    def test_overlapping_filters(self):
+        a = self.connect()
+        self.send(a, ['sub', ['a', None]], ['sub', [None, 'b']])
+        self.send(self.connect(), ['pub', ['a', 'b'], {}])
+        self.assertEqual(self.received(a), [[['msg', 1, ['a', 'b'], {}]]])
+
+    def test_unsub(self):
+        a = self.connect()
+        self.send(a, ['sub', ['a']], ['sub', ['a']], ['unsub', ['a']])
+        self.send(a, ['pub', ['a'], 1])
+        self.send(a, ['unsub', ['a']], ['pub', ['a'], 2])
+        self.assertEqual(self.received(a), [[['msg', 1, ['a'], 1]]])
+
+    def test_connectionLost(self):
+        a = self.connect()
+        self.send(a, ['sub', ['a']])
+        a.connectionLost(failure.Failure(Exception()))
+        self.assertEqual(self.broker.subscriptions.match(('a',)), [])
+
+    def test_resume_new_client(self):
+        self.broker.publish(('a',), 1)
+        a = self.connect()
+        self.send(a, ['sub', ['a']], ['resume', None, 0])
+        self.assertEqual(self.received(a),
+                         [[['welcome', self.broker.epoch, 1, True]]])
+
+    def test_resume_replay(self):
+        for i in range(1, 4):
+            self.broker.publish(('a' if i % 2 else 'b',), i)
+        a = self.connect()
+        self.send(a, ['sub', ['a']], ['resume', self.broker.epoch, 1])
+        self.assertEqual(self.received(a), [[
+            ['welcome', self.broker.epoch, 3, True],
+            ['msg', 3, ['a'], 3],
+        ]])
+
+    def test_resume_history_exceeded(self):
+        for i in range(1, 6):
+            self.broker.publish(('a',), i)
+        a = self.connect()
+        self.send(a, ['sub', ['a']], ['resume', self.broker.epoch, 1])
+        self.assertEqual(self.received(a), [[
+            ['welcome', self.broker.epoch, 5, False],
+            ['msg', 3, ['a'], 3],
+            ['msg', 4, ['a'], 4],
+            ['msg', 5, ['a'], 5],
+        ]])
+
+    def test_resume_other_epoch(self):
+        self.broker.publish(('a',), 1)
+        a = self.connect()
+        self.send(a, ['sub', ['a']], ['resume', 'old-broker', 0])
+        self.assertEqual(self.received(a),
+                         [[['welcome', self.broker.epoch, 1, False]]])
+
+    def test_invalid_frame(self):
+        a = self.connect()
+        a.dataReceived(struct.pack('!I', 3) + 'abc')
+        self.assertTrue(a.transport.disconnecting)
+
+
+class Body(unittest.TestCase):
+
+    def test_encode_decode(self):
+        body = dict(at=datetime.datetime(2014, 6, 1, 12, 30, 5, 250000,
+                                         tzinfo=UTC),
+                    props={'x': (1, 'src')}, lst=[(1, 2), 'a'], n=None)
+        encoded = broker.encodeBody(body)
+        self.assertEqual(encoded['at'], {'$datetime': 1401625805.25})
+        self.assertEqual(encoded['props'], {'x': {'$tuple': [1, 'src']}})
+        decoded = broker.decodeBody(json.loads(json.dumps(encoded)))
+        self.assertEqual(decoded, body)
+        self.assertIsInstance(decoded['props']['x'], tuple)
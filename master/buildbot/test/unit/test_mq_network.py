@@ -0,0 +1,232 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import datetime
+
+from buildbot import config
+from buildbot.mq import broker
+from buildbot.mq import network
+from buildbot.mq import simple
+from buildbot.test.fake import fakemaster
+from buildbot.util import UTC
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.internet import task
+from twisted.trial import unittest
+
+
+class Consumer(object):
+
+    # collects messages, firing a Deferred once it has the expected number
+
+    def __init__(self, expected=1):
+        self.messages = []
+        self.expected = expected
+        self.d = defer.Deferred()
+
+    def __call__(self, routingKey, data):
+        self.messages.append((routingKey, data))
+        if len(self.messages) == self.expected:
+            self.d.callback(self.messages)
+
+
+class NetworkMQ(unittest.TestCase):
+
+    # several masters, each with a NetworkMQ, talking through a broker on
+    # the loopback interface
+
+    def setUp(self):
+        self.broker = broker.Broker()
+        self.port = reactor.listenTCP(0, broker.BrokerFactory(self.broker),
+                                      interface='127.0.0.1')
+        self.address = ('tcp:host=127.0.0.1:port=%d'
+                        % self.port.getHost().port)
+        self.mqs = []
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        for mq in self.mqs:
+            if mq.running:
+                yield mq.stopService()
+        if self.port.connected:
+            yield self.port.stopListening()
+
+    @defer.inlineCallbacks
+    def makeMQ(self):
+        master = fakemaster.make_master()
+        mq = network.NetworkMQ(master)
+        mq.INITIAL_DELAY = 0.01
+        new_config = config.MasterConfig()
+        new_config.mq = dict(type='network', broker=self.address)
+        yield mq.reconfigService(new_config)
+        mq.startService()
+        self.mqs.append(mq)
+        yield mq.whenConnected()
+        defer.returnValue(mq)
+
+    @defer.inlineCallbacks
+    def test_between_masters(self):
+        mq1 = yield self.makeMQ()
+        mq2 = yield self.makeMQ()
+        consumer1 = Consumer(2)
+        consumer2 = Consumer(2)
+        yield mq1.startConsuming(consumer1, ('build', None, 'new'))
+        yield mq2.startConsuming(consumer2, ('build', None, 'new'))
+        # wait for the subscriptions to reach the broker
+        yield self.roundTrip(mq1, mq2)
+
+        mq1.produce(('build', '1', 'new'), dict(buildid=1))
+        mq1.produce(('build', '1', 'finished'), dict(buildid=1))
+        mq2.produce(('build', '2', 'new'), dict(buildid=2))
+        messages1 = yield consumer1.d
+        messages2 = yield consumer2.d
+        self.assertEqual(sorted(messages1),
+                         [(('build', '1', 'new'), dict(buildid=1)),
+                          (('build', '2', 'new'), dict(buildid=2))])
+        self.assertEqual(sorted(messages2), sorted(messages1))
+
+        # the messages relayed back by the broker are not delivered again
+        yield self.roundTrip(mq1, mq2)
+        self.assertEqual(len(consumer1.messages), 2)
+        self.assertEqual(len(consumer2.messages), 2)
+
+    @defer.inlineCallbacks
+    def test_types(self):
+        # consumers on other masters see the same types as those on the
+        # producing master, and as with SimpleMQ
+        mq1 = yield self.makeMQ()
+        mq2 = yield self.makeMQ()
+        simpleMQ = simple.SimpleMQ(fakemaster.make_master())
+        consumers = [Consumer(), Consumer(), Consumer()]
+        for mq, consumer in zip([mq1, mq2, simpleMQ], consumers):
+            yield mq.startConsuming(consumer, ('build', None, 'new'))
+        yield self.roundTrip(mq1, mq2)
+
+        data = dict(buildid=1, started_at=datetime.datetime(
+            2014, 6, 1, 12, 30, 5, 250000, tzinfo=UTC),
+            properties={'x': (1, 'src')}, tags=['a', 'b'])
+        mq1.produce(('build', '1', 'new'), data)
+        simpleMQ.produce(('build', '1', 'new'), data)
+        messages = yield defer.gatherResults([c.d for c in consumers])
+        for [(routingKey, received)] in messages:
+            self.assertEqual((routingKey, received),
+                             (('build', '1', 'new'), data))
+            self.assertIsInstance(routingKey, tuple)
+            self.assertIsInstance(received['started_at'], datetime.datetime)
+            self.assertIsInstance(received['properties']['x'], tuple)
+            self.assertIsInstance(received['tags'], list)
+
+    @defer.inlineCallbacks
+    def test_stopConsuming(self):
+        mq1 = yield self.makeMQ()
+        mq2 = yield self.makeMQ()
+        consumer = Consumer()
+        qref = yield mq1.startConsuming(consumer, ('a',))
+        yield self.roundTrip(mq1)
+        qref.stopConsuming()
+        yield self.roundTrip(mq1)
+        self.assertEqual(mq1.filterCounts, {})
+        self.assertEqual(self.broker.subscriptions.match(('a',)), [])
+
+        mq2.produce(('a',), {})
+        yield self.roundTrip(mq2)
+        self.assertEqual(consumer.messages, [])
+
+    @defer.inlineCallbacks
+    def test_reconnect_replay(self):
+        mq1 = yield self.makeMQ()
+        mq2 = yield self.makeMQ()
+        consumer = Consumer(3)
+        yield mq1.startConsuming(consumer, ('a', None))
+        yield self.roundTrip(mq1)
+        mq2.produce(('a', '1'), {})
+        yield self.roundTrip(mq2)
+
+        # drop mq1's connection; messages produced while it is disconnected
+        # are replayed, and its own are sent once it reconnects
+        mq1.protocol.transport.loseConnection()
+        mq2.produce(('a', '2'), {})
+        mq1.produce(('a', '3'), {})
+        yield self.roundTrip(mq2)
+        yield mq1.whenConnected()
+
+        messages = yield consumer.d
+        self.assertEqual(sorted(rk for rk, _ in messages),
+                         [('a', '1'), ('a', '2'), ('a', '3')])
+        yield self.roundTrip(mq1)
+        self.assertEqual(len(consumer.messages), 3)
+
+    @defer.inlineCallbacks
+    def test_local_delivery_while_disconnected(self):
+        mq1 = yield self.makeMQ()
+        mq2 = yield self.makeMQ()
+        consumer1 = Consumer()
+        consumer2 = Consumer()
+        yield mq1.startConsuming(consumer1, ('a',))
+        yield mq2.startConsuming(consumer2, ('a',))
+        yield self.roundTrip(mq1, mq2)
+
+        # the local consumers get the messages while the broker is down,
+        # and the other masters once it is back
+        mq1.protocol.transport.loseConnection()
+        mq1.produce(('a',), {})
+        yield consumer1.d
+        yield consumer2.d
+        yield self.roundTrip(mq1)
+        self.assertEqual(consumer1.messages, [(('a',), {})])
+
+    @defer.inlineCallbacks
+    def test_unreachable_broker(self):
+        yield self.port.stopListening()
+        master = fakemaster.make_master()
+        mq = network.NetworkMQ(master)
+        new_config = config.MasterConfig()
+        new_config.mq = dict(type='network', broker=self.address)
+        yield mq.reconfigService(new_config)
+        mq.startService()
+        self.mqs.append(mq)
+        consumer = Consumer()
+        yield mq.startConsuming(consumer, ('a',))
+        # messages are delivered locally, and kept for the other masters
+        # until the broker is reachable
+        mq.produce(('a',), {})
+        self.assertEqual(list(mq.unsent), [(('a',), {})])
+        messages = yield consumer.d
+        self.assertEqual(messages, [(('a',), {})])
+        yield mq.stopService()
+        self.assertEqual(mq.connectCall, None)
+        self.flushLoggedErrors()
+
+    @defer.inlineCallbacks
+    def roundTrip(self, *mqs):
+        # wait until the broker has handled everything sent so far by each
+        # of mqs, and sent out what it relays, by publishing a message and
+        # waiting for it to come back
+        for mq in mqs:
+            received = []
+            qref = yield mq.startConsuming(
+                lambda rk, data: None, ('roundtrip',))
+            origMessageReceived = mq.messageReceived
+
+            def messageReceived(seq, routingKey, data, origin=None):
+                if routingKey == ('roundtrip',):
+                    received.append(routingKey)
+                return origMessageReceived(seq, routingKey, data, origin)
+            mq.messageReceived = messageReceived
+            mq.produce(('roundtrip',), {})
+            while not received:
+                yield task.deferLater(reactor, 0.01, lambda: None)
+            mq.messageReceived = origMessageReceived
+            qref.stopConsuming()
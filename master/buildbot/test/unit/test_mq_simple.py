@@ -15,7 +15,10 @@
 
 import mock
 
+from buildbot import config
 from buildbot.mq import simple
+from buildbot.util import eventual
+from twisted.internet import defer
 from twisted.trial import unittest
 
 
@@ -27,3 +30,158 @@ class SimpleMQ(unittest.TestCase):
 
     # this class *only* implements the interface, so there's little left to
     # test
+
+    @defer.inlineCallbacks
+    def test_produce_order(self):
+        calls = []
+        self.mq.startConsuming(lambda rk, d: calls.append(1), ('a', None))
+        self.mq.startConsuming(lambda rk, d: calls.append(2), ('a', 'b'))
+        self.mq.startConsuming(lambda rk, d: calls.append(3), (None, 'b'))
+        self.mq.produce(('a', 'b'), {})
+        yield eventual.flushEventualQueue()
+        # consumers are invoked in the order they started consuming
+        self.assertEqual(calls, [1, 2, 3])
+
+    @defer.inlineCallbacks
+    def test_stopConsuming_during_produce(self):
+        calls = []
+        qrefs = []
+
+        def first(rk, d):
+            calls.append(1)
+            qrefs[1].stopConsuming()
+        self.mq.startConsuming(first, ('a',)).addCallback(qrefs.append)
+        self.mq.startConsuming(lambda rk, d: calls.append(2),
+                               ('a',)).addCallback(qrefs.append)
+        self.mq.produce(('a',), {})
+        yield eventual.flushEventualQueue()
+        self.assertEqual(calls, [1])
+        self.assertEqual(self.mq.qrefs.match(('a',)), [qrefs[0]])
+
+    @defer.inlineCallbacks
+    def test_delivery_is_asynchronous(self):
+        calls = []
+        self.mq.startConsuming(lambda rk, d: calls.append(d), ('a',))
+        self.mq.produce(('a',), 1)
+        self.mq.produce(('a',), 2)
+        self.assertEqual(calls, [])
+        yield eventual.flushEventualQueue()
+        self.assertEqual(calls, [1, 2])
+
+    @defer.inlineCallbacks
+    def test_delivery_limited_per_turn(self):
+        self.mq.DELIVERIES_PER_TURN = 2
+        calls = []
+        self.mq.startConsuming(lambda rk, d: calls.append(d), ('a',))
+        for i in range(5):
+            self.mq.produce(('a',), i)
+        self.mq.drain()
+        self.assertEqual(calls, [0, 1])
+        yield eventual.flushEventualQueue()
+        self.assertEqual(calls, [0, 1, 2, 3, 4])
+
+    @defer.inlineCallbacks
+    def test_block_full_queue(self):
+        calls = []
+        qref = yield self.mq.startConsuming(lambda rk, d: calls.append(d),
+                                            ('a',))
+        qref.setDelivery('block', 2)
+        for i in range(3):
+            self.mq.produce(('a',), i)
+        # the producer delivered the full queue before queueing the last
+        self.assertEqual(calls, [0, 1])
+        yield eventual.flushEventualQueue()
+        self.assertEqual(calls, [0, 1, 2])
+        self.assertEqual(qref.dropped, 0)
+
+    @defer.inlineCallbacks
+    def test_block_synchronous(self):
+        calls = []
+        qref = yield self.mq.startConsuming(lambda rk, d: calls.append(d),
+                                            ('a',))
+        qref.setDelivery('block', 0)
+        self.mq.produce(('a',), 1)
+        self.assertEqual(calls, [1])
+
+    @defer.inlineCallbacks
+    def test_drop_oldest(self):
+        calls = []
+        qref = yield self.mq.startConsuming(lambda rk, d: calls.append(d),
+                                            ('a',))
+        qref.setDelivery('drop-oldest', 2)
+        for i in range(4):
+            self.mq.produce(('a',), i)
+        yield eventual.flushEventualQueue()
+        self.assertEqual(calls, [2, 3])
+        self.assertEqual(qref.dropped, 2)
+
+    @defer.inlineCallbacks
+    def test_coalesce(self):
+        calls = []
+        qref = yield self.mq.startConsuming(
+            lambda rk, d: calls.append((rk, d)), ('a', None))
+        qref.setDelivery('coalesce', 2)
+        self.mq.produce(('a', 'x'), 1)
+        self.mq.produce(('a', 'y'), 2)
+        self.mq.produce(('a', 'x'), 3)
+        yield eventual.flushEventualQueue()
+        # the newer message replaced the older one, in its place
+        self.assertEqual(calls, [(('a', 'x'), 3), (('a', 'y'), 2)])
+        self.assertEqual(qref.dropped, 0)
+
+        self.mq.produce(('a', 'x'), 4)
+        self.mq.produce(('a', 'y'), 5)
+        self.mq.produce(('a', 'z'), 6)
+        yield eventual.flushEventualQueue()
+        self.assertEqual(calls[2:], [(('a', 'y'), 5), (('a', 'z'), 6)])
+        self.assertEqual(qref.dropped, 1)
+
+    @defer.inlineCallbacks
+    def test_persistent_bounded_while_stopped(self):
+        calls = []
+        qref = yield self.mq.startConsuming(lambda rk, d: calls.append(d),
+                                            ('a',), persistent_name='P')
+        qref.setDelivery('drop-oldest', 2)
+        qref.stopConsuming()
+        for i in range(4):
+            self.mq.produce(('a',), i)
+        yield eventual.flushEventualQueue()
+        self.assertEqual(calls, [])
+
+        yield self.mq.startConsuming(lambda rk, d: calls.append(d),
+                                     ('a',), persistent_name='P')
+        yield eventual.flushEventualQueue()
+        self.assertEqual(calls, [2, 3])
+        self.assertEqual(qref.dropped, 2)
+
+    @defer.inlineCallbacks
+    def test_persistent_block_bounded_while_stopped(self):
+        calls = []
+        qref = yield self.mq.startConsuming(lambda rk, d: calls.append(d),
+                                            ('a',), persistent_name='P')
+        qref.setDelivery('block', 2)
+        qref.stopConsuming()
+        # a stopped consumer cannot block, so the oldest messages are dropped
+        for i in range(4):
+            self.mq.produce(('a',), i)
+        self.assertEqual(len(qref.queue), 2)
+        self.assertEqual(qref.dropped, 2)
+
+        yield self.mq.startConsuming(lambda rk, d: calls.append(d),
+                                     ('a',), persistent_name='P')
+        yield eventual.flushEventualQueue()
+        self.assertEqual(calls, [2, 3])
+
+    @defer.inlineCallbacks
+    def test_reconfig_applies_to_consumers(self):
+        qref1 = yield self.mq.startConsuming(lambda rk, d: None, ('a',))
+        qref2 = yield self.mq.startConsuming(lambda rk, d: None, ('b',))
+        qref2.setDelivery('coalesce')
+        new_config = config.MasterConfig()
+        new_config.mq = dict(type='simple', overflow='drop-oldest',
+                             queue_size=10)
+        yield self.mq.reconfigService(new_config)
+        self.assertEqual((qref1.overflow, qref1.queueSize),
+                         ('drop-oldest', 10))
+        # the consumer's own choice is kept
+        self.assertEqual((qref2.overflow, qref2.queueSize), ('coalesce', 10))
@@ -0,0 +1,119 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import cStringIO
+import sys
+
+from buildbot.scripts import mqbroker
+from buildbot.scripts import runner
+from buildbot.test.util import misc
+from twisted.internet import defer
+from twisted.internet import endpoints
+from twisted.internet import error
+from twisted.python import log
+from twisted.trial import unittest
+
+
+class FakeReactor(object):
+
+    def __init__(self):
+        self.running = False
+        self.stopped = False
+
+        self.whenRunning = []
+
+    def run(self):
+        self.running = True
+        for f in self.whenRunning:
+            f()
+
+    def stop(self):
+        self.stopped = True
+
+
+class FakeEndpoint(object):
+
+    def __init__(self, result):
+        self.result = result
+        self.factories = []
+
+    def listen(self, factory):
+        self.factories.append(factory)
+        return self.result
+
+
+class TestMQBroker(misc.StdoutAssertionsMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.setUpStdoutAssertions()
+        self.stderr = cStringIO.StringIO()
+        self.patch(sys, 'stderr', self.stderr)
+        self.reactor = FakeReactor()
+        self.patch(mqbroker, 'reactor', self.reactor)
+        self.logStarted = []
+        self.patch(log, 'startLogging', self.logStarted.append)
+        self.endpoints = []
+
+    def mkconfig(self, *args):
+        opts = runner.MQBrokerOptions()
+        opts.parseOptions(args)
+        return dict(opts)
+
+    def run_mqbroker(self, config, result=None):
+        def serverFromString(reactor, description):
+            ep = FakeEndpoint(result or defer.succeed(None))
+            self.endpoints.append((reactor, description, ep))
+            return ep
+        self.patch(endpoints, 'serverFromString', serverFromString)
+        return mqbroker.mqbroker(config)
+
+    def test_defaults(self):
+        rc = self.run_mqbroker(self.mkconfig())
+        self.assertEqual(rc, 0)
+        [(reactor, description, ep)] = self.endpoints
+        self.assertIdentical(reactor, self.reactor)
+        self.assertEqual(description, 'tcp:9990')
+        [factory] = ep.factories
+        self.assertEqual(factory.broker.history.maxlen, 10000)
+        self.assertEqual(self.logStarted, [sys.stdout])
+        self.assertTrue(self.reactor.running)
+        self.assertFalse(self.reactor.stopped)
+
+    def test_options(self):
+        rc = self.run_mqbroker(self.mkconfig('--quiet', '--port', 'tcp:1234',
+                                             '--history', '10'))
+        self.assertEqual(rc, 0)
+        [(_, description, ep)] = self.endpoints
+        self.assertEqual(description, 'tcp:1234')
+        self.assertEqual(ep.factories[0].broker.history.maxlen, 10)
+        self.assertEqual(self.logStarted, [])
+
+    def test_listen_fails(self):
+        rc = self.run_mqbroker(
+            self.mkconfig('--quiet'),
+            defer.fail(error.CannotListenError('', 9990, 'in use')))
+        self.assertEqual(rc, 1)
+        self.assertFalse(self.reactor.running)
+        self.assertIn('could not listen on tcp:9990', self.stderr.getvalue())
+        self.assertWasQuiet()
+
+    def test_listen_fails_later(self):
+        d = defer.Deferred()
+        self.reactor.whenRunning.append(
+            lambda: d.errback(error.CannotListenError('', 9990, 'in use')))
+        rc = self.run_mqbroker(self.mkconfig('--quiet'), d)
+        self.assertEqual(rc, 1)
+        self.assertTrue(self.reactor.stopped)
+        self.assertIn('could not listen on tcp:9990', self.stderr.getvalue())
@@ -579,6 +579,32 @@ class TestTryServerOptions(OptionsMixin, unittest.TestCase):
         self.assertOptions(opts, exp)
 
 
+class TestMQBrokerOptions(OptionsMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.setUpOptions()
+
+    def parse(self, *args):
+        self.opts = runner.MQBrokerOptions()
+        self.opts.parseOptions(args)
+        return self.opts
+
+    def test_synopsis(self):
+        opts = runner.MQBrokerOptions()
+        self.assertIn('buildbot mqbroker', opts.getSynopsis())
+
+    def test_defaults(self):
+        opts = self.parse()
+        exp = dict(port='tcp:9990', history=10000, quiet=False)
+        self.assertOptions(opts, exp)
+
+    def test_options(self):
+        opts = self.parse('--port', 'unix:/tmp/mq.sock', '--history', '50',
+                          '-q')
+        exp = dict(port='unix:/tmp/mq.sock', history=50, quiet=True)
+        self.assertOptions(opts, exp)
+
+
 class TestCheckConfigOptions(OptionsMixin, unittest.TestCase):
 
     def setUp(self):
@@ -28,3 +28,48 @@ class MatchTuple(tuplematching.TupleMatchingMixin, unittest.TestCase):
                          % (routingKey,
                             'should match' if shouldMatch else "shouldn't match",
                             filter))
+
+
+class TupleIndex(tuplematching.TupleMatchingMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.index = tuplematch.TupleIndex()
+
+    # called by the TupleMatchingMixin methods
+
+    def do_test_match(self, routingKey, shouldMatch, filter):
+        self.index.add(filter, 'v')
+        self.assertEqual(self.index.match(routingKey),
+                         ['v'] if shouldMatch else [])
+
+    def test_match_order(self):
+        filters = [('a', None, 'c'), ('a', 'b', 'c'), (None, None, None),
+                   ('a', 'b', 'x'), ('a', 'b', 'c'), ('b', 'b', 'c')]
+        for i, filter in enumerate(filters):
+            self.index.add(filter, i)
+        self.assertEqual(self.index.match(('a', 'b', 'c')), [0, 1, 2, 4])
+        self.assertEqual(self.index.match(('b', 'b', 'c')), [2, 5])
+
+    def test_remove(self):
+        v1, v2 = object(), object()
+        self.index.add(('a', None), v1)
+        self.index.add(('a', None), v2)
+        self.assertTrue(self.index.remove(('a', None), v1))
+        self.assertEqual(self.index.match(('a', 'b')), [v2])
+        self.assertFalse(self.index.remove(('a', None), v1))
+        self.assertFalse(self.index.remove(('a', 'b'), v2))
+        self.assertFalse(self.index.remove(('a', None, 'c'), v2))
+
+    def test_remove_prunes(self):
+        self.index.add(('a', 'b', 'c'), 1)
+        self.index.add(('a', None, 'c'), 2)
+        self.index.remove(('a', 'b', 'c'), 1)
+        self.index.remove(('a', None, 'c'), 2)
+        self.assertEqual(self.index._roots, {})
+
+    def test_values(self):
+        self.index.add(('a', 'b'), 1)
+        self.index.add(('a', None), 2)
+        self.index.add(('c',), 3)
+        self.index.add(('a', 'b'), 4)
+        self.assertEqual(self.index.values(), [1, 2, 3, 4])
@@ -51,3 +51,13 @@ class IndexResource(www.WwwTestMixin, unittest.TestCase):
         res = yield self.render_resource(rsrc, '/')
         exp = '{"url": "h:/a/c/", "user": {"anonymous": true}, "auth": {"name": "NoAuth"}, "port": null}'
         self.assertIn(res, exp)
+
+    def test_asset(self):
+        app = mock.Mock()
+        app.assetPath = lambda name: name.replace('.', '.abc.')
+        master = self.make_master(url='h:/a/b/')
+        rsrc = config.IndexResource(master, "foo", {'base': app})
+        tpl = rsrc.jinja.from_string(
+            "{{ asset('scripts.js') }} {{ asset('styles.css', 'base') }} "
+            "{{ asset('scripts.js', 'other') }}")
+        self.assertEqual(tpl.render(), "scripts.abc.js styles.abc.css scripts.js")
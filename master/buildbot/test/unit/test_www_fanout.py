@@ -0,0 +1,240 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+
+from buildbot.www import fanout
+from twisted.internet import defer
+from twisted.internet import task
+from twisted.trial import unittest
+
+
+class Fanout(unittest.TestCase):
+
+    def setUp(self):
+        self.consumers = {}
+        self.qrefs = {}
+        self.encoded = []
+        self.fanout = fanout.Fanout(self.startConsuming, self.encode)
+
+    def startConsuming(self, callback, key):
+        self.consumers[key] = callback
+        self.qrefs[key] = qref = mock.Mock(name='qref')
+        return defer.succeed(qref)
+
+    def encode(self, routingKey, message):
+        self.encoded.append(routingKey)
+        return '%s:%s' % ('.'.join(routingKey), message)
+
+    @defer.inlineCallbacks
+    def test_shared_consumer(self):
+        written = []
+        yield self.fanout.subscribe('k', lambda d: written.append((1, d)))
+        yield self.fanout.subscribe('k', lambda d: written.append((2, d)))
+        self.assertEqual(self.consumers.keys(), ['k'])
+        self.qrefs['k'].setDelivery.assert_called_with('coalesce')
+
+        self.consumers['k'](('a', 'b'), 'm')
+        self.assertEqual(written, [(1, 'a.b:m'), (2, 'a.b:m')])
+        # the same object is written to both
+        self.assertIdentical(written[0][1], written[1][1])
+
+    @defer.inlineCallbacks
+    def test_encoded_once_for_all_keys(self):
+        written = []
+        yield self.fanout.subscribe('k1', written.append)
+        yield self.fanout.subscribe('k2', written.append)
+        routingKey, message = ('a', 'b'), 'm'
+        self.consumers['k1'](routingKey, message)
+        self.consumers['k2'](routingKey, message)
+        self.assertEqual(written, ['a.b:m', 'a.b:m'])
+        self.assertEqual(self.encoded, [routingKey])
+
+    @defer.inlineCallbacks
+    def test_frame(self):
+        self.fanout.frame = lambda key, encoded: '%s[%s]' % (key, encoded)
+        written = []
+        yield self.fanout.subscribe('k', written.append)
+        self.consumers['k'](('a',), 'm')
+        self.assertEqual(written, ['k[a:m]'])
+
+    @defer.inlineCallbacks
+    def test_packer(self):
+        made = []
+
+        class Packer(object):
+
+            def __init__(self, packetKey):
+                self.packetKey = packetKey
+
+            def makePacket(self, data):
+                made.append((self.packetKey, data))
+                return '%s<%s>' % (self.packetKey, data)
+        written = []
+        yield self.fanout.subscribe('k', written.append, packer=Packer('x'))
+        yield self.fanout.subscribe('k', written.append, packer=Packer('x'))
+        yield self.fanout.subscribe('k', written.append, packer=Packer('y'))
+        yield self.fanout.subscribe('k', written.append)
+        self.consumers['k'](('a',), 'm')
+        self.assertEqual(written, ['x<a:m>', 'x<a:m>', 'y<a:m>', 'a:m'])
+        self.assertIdentical(written[0], written[1])
+        # each packet is made once
+        self.assertEqual(made, [('x', 'a:m'), ('y', 'a:m')])
+
+    @defer.inlineCallbacks
+    def test_stopConsuming(self):
+        written = []
+        sub1 = yield self.fanout.subscribe('k', lambda d: written.append(1))
+        sub2 = yield self.fanout.subscribe('k', lambda d: written.append(2))
+        sub1.stopConsuming()
+        self.consumers['k'](('a',), 'm')
+        self.assertEqual(written, [2])
+        self.assertFalse(self.qrefs['k'].stopConsuming.called)
+
+        sub2.stopConsuming()
+        sub2.stopConsuming()
+        self.assertEqual(self.qrefs['k'].stopConsuming.call_count, 1)
+        self.assertEqual(self.fanout.groups, {})
+
+    def test_stopConsuming_before_started(self):
+        started = defer.Deferred()
+        self.fanout.startConsuming = lambda callback, key: started
+        subscribed = []
+        self.fanout.subscribe('k', None).addCallback(subscribed.append)
+        self.assertEqual(subscribed, [])
+        qref = mock.Mock(name='qref')
+        self.fanout.groups['k'].subscriptions[0].stopConsuming()
+        started.callback(qref)
+        qref.stopConsuming.assert_called_with()
+        self.assertEqual(len(subscribed), 1)
+
+    def test_startConsuming_fails(self):
+        self.fanout.startConsuming = \
+            lambda callback, key: defer.fail(RuntimeError('oops'))
+        d = self.fanout.subscribe('k', None)
+        self.assertEqual(self.fanout.groups, {})
+        return self.assertFailure(d, RuntimeError)
+
+    def test_startConsuming_raises(self):
+        def startConsuming(callback, key):
+            raise NotImplementedError
+        self.fanout.startConsuming = startConsuming
+        self.assertRaises(NotImplementedError,
+                          lambda: self.fanout.subscribe('k', None))
+        self.assertEqual(self.fanout.groups, {})
+
+
+class Coalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.written = []
+        self.fanout = fanout.Fanout(self.startConsuming,
+                                    lambda rk, msg: (rk, msg),
+                                    coalesceInterval=lambda: 0.5)
+        self.fanout._reactor = self.clock
+        return self.fanout.subscribe('k', self.written.append)
+
+    def startConsuming(self, callback, key):
+        self.deliver = callback
+        return defer.succeed(mock.Mock(name='qref'))
+
+    def test_updates_merged(self):
+        self.deliver(('builds', '1', 'update'), dict(state='a'))
+        self.deliver(('builds', '2', 'update'), dict(state='b'))
+        self.deliver(('builds', '1', 'update'), dict(state='c'))
+        self.assertEqual(self.written, [])
+        self.clock.advance(0.5)
+        self.assertEqual(self.written, [
+            (('builds', '1', 'update'), dict(state='c')),
+            (('builds', '2', 'update'), dict(state='b')),
+        ])
+        self.clock.advance(1)
+        self.assertEqual(len(self.written), 2)
+
+    @defer.inlineCallbacks
+    def test_window_written_together(self):
+        seqs = []
+        yield self.fanout.subscribe('k', None, seqs.append)
+        self.deliver(('builds', '1', 'update'), dict(state='a'))
+        self.deliver(('builds', '2', 'update'), dict(state='b'))
+        self.clock.advance(0.5)
+        self.assertEqual(seqs, [[
+            (('builds', '1', 'update'), dict(state='a')),
+            (('builds', '2', 'update'), dict(state='b')),
+        ]])
+        # subscribers without writeSequence get one write per message
+        self.assertEqual(len(self.written), 2)
+
+    @defer.inlineCallbacks
+    def test_window_packed(self):
+        packer = mock.Mock(name='packer')
+        packer.packetKey = 'x'
+        packer.makePacket = lambda data: ('packet', data)
+        seqs1, seqs2 = [], []
+        yield self.fanout.subscribe('k', None, seqs1.append, packer)
+        yield self.fanout.subscribe('k', None, seqs2.append, packer)
+        self.deliver(('builds', '1', 'update'), dict(state='a'))
+        self.deliver(('builds', '2', 'update'), dict(state='b'))
+        self.clock.advance(0.5)
+        self.assertEqual(seqs1, [[
+            ('packet', (('builds', '1', 'update'), dict(state='a'))),
+            ('packet', (('builds', '2', 'update'), dict(state='b'))),
+        ]])
+        self.assertIdentical(seqs1[0], seqs2[0])
+
+    def test_other_events_flush(self):
+        self.deliver(('builds', '1', 'update'), dict(state='a'))
+        self.deliver(('builds', '1', 'finished'), dict(state='done'))
+        # the final state comes last, without waiting for the window
+        self.assertEqual(self.written, [
+            (('builds', '1', 'update'), dict(state='a')),
+            (('builds', '1', 'finished'), dict(state='done')),
+        ])
+        self.clock.advance(0.5)
+        self.assertEqual(len(self.written), 2)
+
+    def test_log_appends(self):
+        self.deliver(('logs', '7', 'new'), dict(logid=7, num_lines=0))
+        self.deliver(('logs', '7', 'append'), dict(logid=7, num_lines=3))
+        self.deliver(('logs', '7', 'append'), dict(logid=7, num_lines=10))
+        self.clock.advance(0.5)
+        self.deliver(('logs', '7', 'append'), dict(logid=7, num_lines=12))
+        self.clock.advance(0.5)
+        self.assertEqual(self.written, [
+            (('logs', '7', 'new'), dict(logid=7, num_lines=0)),
+            (('logs', '7', 'append'), dict(logid=7, num_lines=10,
+                                           lines=[0, 9])),
+            (('logs', '7', 'append'), dict(logid=7, num_lines=12,
+                                           lines=[10, 11])),
+        ])
+
+    def test_log_appends_unknown_start(self):
+        self.deliver(('logs', '7', 'append'), dict(logid=7, num_lines=3))
+        self.clock.advance(0.5)
+        self.assertEqual(self.written, [
+            (('logs', '7', 'append'), dict(logid=7, num_lines=3)),
+        ])
+
+    def test_disabled(self):
+        self.fanout.coalesceInterval = lambda: 0
+        self.deliver(('builds', '1', 'update'), dict(state='a'))
+        self.deliver(('builds', '1', 'update'), dict(state='b'))
+        self.assertEqual(len(self.written), 2)
+
+    def test_stopConsuming_cancels_window(self):
+        self.deliver(('builds', '1', 'update'), dict(state='a'))
+        self.fanout.groups['k'].subscriptions[0].stopConsuming()
+        self.assertEqual(self.clock.getDelayedCalls(), [])
@@ -0,0 +1,139 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import gzip
+import os
+import shutil
+
+from buildbot.www import plugin
+from twisted.internet import defer
+from twisted.trial import unittest
+from twisted.web import server
+from twisted.web.test.requesthelper import DummyRequest
+
+
+class StaticFile(unittest.TestCase):
+
+    def setUp(self):
+        self.static_dir = os.path.abspath("static")
+        if os.path.exists(self.static_dir):
+            shutil.rmtree(self.static_dir)
+        os.makedirs(self.static_dir)
+        self.rsrc = plugin.StaticFile(self.static_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.static_dir)
+
+    def writeFile(self, name, content, gzipped=False):
+        path = os.path.join(self.static_dir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        if gzipped:
+            gz = gzip.open(path + ".gz", "wb")
+            gz.write(content)
+            gz.close()
+        return path
+
+    def render(self, name, acceptEncoding=None):
+        request = DummyRequest([name])
+        if acceptEncoding is not None:
+            request.headers['accept-encoding'] = acceptEncoding
+        child = self.rsrc.getChild(name, request)
+        rv = child.render(request)
+        if rv is server.NOT_DONE_YET:
+            if request.finished:
+                d = defer.succeed(None)
+            else:
+                d = request.notifyFinish()
+        else:
+            request.write(rv)
+            request.finish()
+            d = defer.succeed(None)
+
+        @d.addCallback
+        def done(_):
+            return request
+        return d
+
+    def test_fingerprintedName(self):
+        self.writeFile("scripts.js", "var a;")
+        self.writeFile("scripts.min.js", "var b;")
+        name = self.rsrc.fingerprintedName("scripts.js")
+        self.assertRegexpMatches(name, r"^scripts\.[0-9a-f]{16}\.js$")
+        self.assertNotEqual(self.rsrc.fingerprintedName("scripts.min.js"), name)
+        self.assertRegexpMatches(self.rsrc.fingerprintedName("scripts.min.js"),
+                                 r"^scripts\.min\.[0-9a-f]{16}\.js$")
+
+    def test_fingerprintedName_changes_with_content(self):
+        path = self.writeFile("scripts.js", "var a;")
+        name = self.rsrc.fingerprintedName("scripts.js")
+        self.writeFile("scripts.js", "var a = 1;")
+        # make sure the change is seen whatever the resolution of mtime
+        os.utime(path, (0, 0))
+        self.assertNotEqual(self.rsrc.fingerprintedName("scripts.js"), name)
+
+    def test_fingerprintedName_missing(self):
+        self.assertEqual(self.rsrc.fingerprintedName("nosuch.js"), "nosuch.js")
+        self.assertEqual(self.rsrc.fingerprintedName("../nosuch.js"), "../nosuch.js")
+
+    @defer.inlineCallbacks
+    def test_render_fingerprinted(self):
+        self.writeFile("scripts.js", "var a;")
+        name = self.rsrc.fingerprintedName("scripts.js")
+        request = yield self.render(name)
+        self.assertEqual("".join(request.written), "var a;")
+        self.assertEqual(request.outgoingHeaders.get('cache-control'),
+                         plugin.FINGERPRINTED_CACHE_CONTROL)
+
+    @defer.inlineCallbacks
+    def test_render_stale_fingerprint(self):
+        self.writeFile("scripts.js", "var a;")
+        request = yield self.render("scripts.0123456789abcdef.js")
+        self.assertEqual("".join(request.written), "var a;")
+        self.assertNotIn('cache-control', request.outgoingHeaders)
+
+    @defer.inlineCallbacks
+    def test_render_plain_name(self):
+        self.writeFile("scripts.js", "var a;")
+        request = yield self.render("scripts.js")
+        self.assertEqual("".join(request.written), "var a;")
+        self.assertNotIn('cache-control', request.outgoingHeaders)
+
+    @defer.inlineCallbacks
+    def test_render_gzipped(self):
+        self.writeFile("styles.css", "body {}", gzipped=True)
+        request = yield self.render("styles.css", acceptEncoding="deflate, gzip")
+        self.assertEqual(request.outgoingHeaders.get('content-encoding'), 'gzip')
+        self.assertEqual(request.outgoingHeaders.get('content-type'), 'text/css')
+        self.assertEqual(request.outgoingHeaders.get('vary'), 'accept-encoding')
+        with open(os.path.join(self.static_dir, "styles.css.gz"), "rb") as f:
+            self.assertEqual("".join(request.written), f.read())
+
+    @defer.inlineCallbacks
+    def test_render_gzip_not_accepted(self):
+        self.writeFile("styles.css", "body {}", gzipped=True)
+        for acceptEncoding in [None, "deflate", "gzip;q=0"]:
+            request = yield self.render("styles.css", acceptEncoding=acceptEncoding)
+            self.assertNotIn('content-encoding', request.outgoingHeaders)
+            self.assertEqual(request.outgoingHeaders.get('vary'), 'accept-encoding')
+            self.assertEqual("".join(request.written), "body {}")
+
+    @defer.inlineCallbacks
+    def test_render_gzipped_outdated(self):
+        path = self.writeFile("styles.css", "body {}", gzipped=True)
+        os.utime(path + ".gz", (0, 0))
+        request = yield self.render("styles.css", acceptEncoding="gzip")
+        self.assertNotIn('content-encoding', request.outgoingHeaders)
+        self.assertEqual("".join(request.written), "body {}")
@@ -13,15 +13,21 @@
 #
 # Copyright Buildbot Team Members
 
+import base64
+import hashlib
 import mock
 import re
+import zlib
 
+from buildbot.data import base
 from buildbot.test.fake import endpoint
+from buildbot.test.fake import fakedb
 from buildbot.test.util import compat
 from buildbot.test.util import www
 from buildbot.util import json
 from buildbot.www import rest
 from buildbot.www.rest import JSONRPC_CODES
+from cStringIO import StringIO
 from twisted.internet import defer
 from twisted.trial import unittest
 
@@ -403,12 +409,128 @@ class V2RootResource_REST(www.WwwTestMixin, unittest.TestCase):
         self.assertRestError(message="cannot order on un-selected fields",
                              responseCode=400)
 
+    @defer.inlineCallbacks
+    def test_api_collection_cursor(self):
+        yield self.render_resource(self.rsrc, '/test?order=-id&limit=3')
+        content = json.loads(self.request.written)
+        self.assertEqual([t['id'] for t in content['tests']], [20, 19, 18])
+        cursor = content['meta']['next_cursor']
+        self.assertEqual(content['meta']['total'], 8)
+
+        # the cursor carries the order
+        yield self.render_resource(self.rsrc,
+                                   '/test?cursor=%s&limit=3' % (cursor,))
+        content = json.loads(self.request.written)
+        self.assertEqual([t['id'] for t in content['tests']], [17, 16, 15])
+        self.assertEqual(content['meta']['total'], 8)
+
+        # a partial page has no cursor
+        yield self.render_resource(self.rsrc,
+                                   '/test?cursor=%s&limit=10' % (cursor,))
+        content = json.loads(self.request.written)
+        self.assertEqual([t['id'] for t in content['tests']],
+                         [17, 16, 15, 14, 13])
+        self.assertEqual(content['meta'], {'total': 8})
+
+    @defer.inlineCallbacks
+    def test_api_collection_cursor_sql(self):
+        # the endpoint consumes the order and limit of the result spec
+        yield self.render_resource(self.rsrc, '/test/sql?order=-id&limit=3')
+        content = json.loads(self.request.written)
+        self.assertEqual([t['id'] for t in content['tests']], [20, 19, 18])
+        self.assertEqual(content['meta'], {
+            'total': 8,
+            'next_cursor': self.rsrc.encodeCursor(['-id'],
+                                                  endpoint.testData[18])})
+
+        yield self.render_resource(
+            self.rsrc, '/test/sql?limit=3&cursor=%s'
+            % (content['meta']['next_cursor'],))
+        content = json.loads(self.request.written)
+        self.assertEqual([t['id'] for t in content['tests']], [17, 16, 15])
+        self.assertIn('next_cursor', content['meta'])
+
+    @defer.inlineCallbacks
+    def test_api_collection_cursor_no_order(self):
+        yield self.render_resource(self.rsrc, '/test?limit=3')
+        content = json.loads(self.request.written)
+        self.assertNotIn('next_cursor', content['meta'])
+
+    @defer.inlineCallbacks
+    def test_api_collection_invalid_cursor(self):
+        yield self.render_resource(self.rsrc, '/test?cursor=xyz')
+        self.assertRestError(message="invalid cursor", responseCode=400)
+
+    @defer.inlineCallbacks
+    def test_api_collection_cursor_unknown_field(self):
+        cursor = base64.urlsafe_b64encode(json.dumps([['color'], ['red']]))
+        yield self.render_resource(self.rsrc, '/test?cursor=' + cursor)
+        self.assertRestError(message="invalid cursor", responseCode=400)
+
+    @defer.inlineCallbacks
+    def test_api_collection_cursor_order_mismatch(self):
+        cursor = self.rsrc.encodeCursor(['id'], {'id': 14})
+        yield self.render_resource(self.rsrc,
+                                   '/test?order=info&cursor=' + cursor)
+        self.assertRestError(message="cursor does not match order",
+                             responseCode=400)
+
+    @defer.inlineCallbacks
+    def test_api_collection_cursor_offset(self):
+        cursor = self.rsrc.encodeCursor(['id'], {'id': 14})
+        yield self.render_resource(self.rsrc,
+                                   '/test?offset=2&cursor=' + cursor)
+        self.assertRestError(message="cannot use both cursor and offset",
+                             responseCode=400)
+
     @defer.inlineCallbacks
     def test_api_collection_filter_on_unselected(self):
         yield self.render_resource(self.rsrc, '/test?field=id&info__gt=xx')
         self.assertRestError(message="cannot filter on un-selected fields",
                              responseCode=400)
 
+    @defer.inlineCallbacks
+    def test_api_collection_aggregates(self):
+        yield self.render_resource(
+            self.rsrc, '/test?info__ne=ok&aggregate=count&aggregate=max:id'
+            '&group_by=success')
+        self.assertRestCollection(
+            typeName='aggregates',
+            items=[{'success': False, 'count': 3, 'max_id': 20},
+                   {'success': True, 'count': 4, 'max_id': 19}],
+            total=2, orderSignificant=True)
+
+    @defer.inlineCallbacks
+    def test_api_collection_count(self):
+        yield self.render_resource(self.rsrc, '/test?aggregate=count')
+        self.assertRestCollection(typeName='aggregates',
+                                  items=[{'count': 8}], total=1)
+
+    @defer.inlineCallbacks
+    def test_api_collection_invalid_aggregate(self):
+        for agg in 'median:id', 'max', 'max:nosuch':
+            yield self.render_resource(self.rsrc, '/test?aggregate=' + agg)
+            self.assertEqual(self.request.responseCode, 400)
+
+    @defer.inlineCallbacks
+    def test_api_collection_aggregate_with_pagination(self):
+        yield self.render_resource(self.rsrc, '/test?aggregate=count&limit=2')
+        self.assertRestError(
+            message="aggregates cannot be combined with fields, order or "
+            "pagination", responseCode=400)
+
+    @defer.inlineCallbacks
+    def test_api_collection_group_by_without_aggregate(self):
+        yield self.render_resource(self.rsrc, '/test?group_by=success')
+        self.assertRestError(message="group_by requires an aggregate",
+                             responseCode=400)
+
+    @defer.inlineCallbacks
+    def test_api_details_aggregate(self):
+        yield self.render_resource(self.rsrc, '/test/13?aggregate=count')
+        self.assertRestError(message="this is not a collection",
+                             responseCode=400)
+
     @defer.inlineCallbacks
     def test_api_collection_filter_pagination(self):
         yield self.render_resource(self.rsrc, '/test?success=false&limit=2')
@@ -446,6 +568,268 @@ class V2RootResource_REST(www.WwwTestMixin, unittest.TestCase):
         self.assertRestDetails(typeName='tests',
                                item={'info': endpoint.testData[13]['info']})
 
+    @defer.inlineCallbacks
+    def test_api_etag(self):
+        yield self.render_resource(self.rsrc, '/test/13')
+        [etag] = self.request.headers['etag']
+        self.assertEqual(self.request.headers.get('cache-control'), None)
+
+        # a different representation has a different ETag
+        yield self.render_resource(self.rsrc, '/test/13?field=info')
+        self.assertNotEqual(self.request.headers['etag'], [etag])
+
+        yield self.render_resource(self.rsrc, '/test/13',
+                                   extraHeaders={'if-none-match': etag})
+        self.assertRequest(content='', responseCode=304,
+                           headers={'etag': [etag]})
+
+    @defer.inlineCallbacks
+    def test_api_etag_mismatch(self):
+        yield self.render_resource(self.rsrc, '/test/13',
+                                   extraHeaders={'if-none-match': '"abc", "def"'})
+        self.assertRestDetails(typeName='tests', item=endpoint.testData[13])
+
+    @defer.inlineCallbacks
+    def test_api_etag_collection_weak(self):
+        yield self.render_resource(self.rsrc, '/test')
+        [etag] = self.request.headers['etag']
+        yield self.render_resource(self.rsrc, '/test',
+                                   extraHeaders={'if-none-match': '"x", W/' + etag})
+        self.assertRequest(content='', responseCode=304)
+
+    def makeCacheable(self):
+        # track the changes to the test resources, as the result cache does
+        # for the cacheable resource types
+        self.patch(endpoint.Test, 'cacheable', True)
+        self.patch(endpoint.Test, 'eventPathPatterns', "/test/:testid")
+        self.master.mq.verifyMessages = False
+        self.gets = []
+        get = endpoint.TestEndpoint.get
+
+        def trackGet(ep, resultSpec, kwargs):
+            self.gets.append(kwargs)
+            return get(ep, resultSpec, kwargs)
+        self.patch(endpoint.TestEndpoint, 'get', trackGet)
+
+    @defer.inlineCallbacks
+    def test_api_etag_change_stamp(self):
+        self.makeCacheable()
+        resultCache = self.master.data.resultCache
+        yield self.render_resource(self.rsrc, '/test/13')
+        [etag] = self.request.headers['etag']
+        self.assertEqual(len(self.gets), 1)
+
+        # the ETag is checked before anything is fetched
+        resultCache.entries.clear()
+        resultCache.keysByPath.clear()
+        yield self.render_resource(self.rsrc, '/test/13',
+                                   extraHeaders={'if-none-match': etag})
+        self.assertRequest(content='', responseCode=304,
+                           headers={'etag': [etag]})
+        self.assertEqual(len(self.gets), 1)
+
+        # and changes with the resource
+        self.master.mq.callConsumer(('test', '13', 'changed'), {})
+        yield self.render_resource(self.rsrc, '/test/13',
+                                   extraHeaders={'if-none-match': etag})
+        self.assertRestDetails(typeName='tests', item=endpoint.testData[13])
+        self.assertNotEqual(self.request.headers['etag'], [etag])
+        self.assertEqual(len(self.gets), 2)
+
+    @defer.inlineCallbacks
+    def test_api_etag_change_stamp_encoding(self):
+        self.makeCacheable()
+        self.rsrc.compression_threshold = 0
+        yield self.render_resource(self.rsrc, '/test/13',
+                                   extraHeaders={'accept-encoding': 'gzip'})
+        [etag] = self.request.headers['etag']
+        self.assertTrue(etag.endswith('-gzip"'))
+        yield self.render_resource(self.rsrc, '/test/13',
+                                   extraHeaders={'accept-encoding': 'gzip',
+                                                 'if-none-match': etag})
+        self.assertRequest(content='', responseCode=304,
+                           headers={'etag': [etag]})
+
+    @defer.inlineCallbacks
+    def test_api_etag_change_stamp_changed_during_fetch(self):
+        self.makeCacheable()
+        get = endpoint.TestEndpoint.get
+
+        def changingGet(ep, resultSpec, kwargs):
+            self.master.mq.callConsumer(('test', '13', 'changed'), {})
+            return get(ep, resultSpec, kwargs)
+        self.patch(endpoint.TestEndpoint, 'get', changingGet)
+        yield self.render_resource(self.rsrc, '/test/13')
+        # the result may be newer than the stamp, so it is tagged by content
+        [etag] = self.request.headers['etag']
+        self.assertEqual(etag, '"%s"' % (hashlib.sha1(
+            self.request.written).hexdigest(),))
+
+    @defer.inlineCallbacks
+    def test_api_gzip(self):
+        self.rsrc.compression_threshold = 0
+        yield self.render_resource(self.rsrc, '/test',
+                                   extraHeaders={'accept-encoding': 'gzip'})
+        self.assertRequest(responseCode=200,
+                           headers={'content-encoding': ['gzip'],
+                                    'vary': ['Accept-Encoding']})
+        self.request.written = zlib.decompress(self.request.written,
+                                               16 + zlib.MAX_WBITS)
+        self.assertRestCollection(typeName='tests',
+                                  items=endpoint.testData.values(), total=8)
+
+    @defer.inlineCallbacks
+    def test_api_deflate_threaded(self):
+        self.rsrc.compression_threshold = 0
+        self.rsrc.THREADED_COMPRESSION_SIZE = 0
+        yield self.render_resource(self.rsrc, '/test/13',
+                                   extraHeaders={'accept-encoding': 'deflate'})
+        self.assertRequest(responseCode=200,
+                           headers={'content-encoding': ['deflate']})
+        self.request.written = zlib.decompress(self.request.written)
+        self.assertRestDetails(typeName='tests', item=endpoint.testData[13])
+
+    @defer.inlineCallbacks
+    def test_api_compression_threshold(self):
+        self.rsrc.compression_threshold = 100000
+        yield self.render_resource(self.rsrc, '/test/13',
+                                   extraHeaders={'accept-encoding': 'gzip'})
+        self.assertRequest(headers={'content-encoding': None,
+                                    'vary': ['Accept-Encoding']})
+        self.assertRestDetails(typeName='tests', item=endpoint.testData[13])
+
+    @defer.inlineCallbacks
+    def test_api_compression_disabled(self):
+        self.rsrc.compression_threshold = None
+        yield self.render_resource(self.rsrc, '/test',
+                                   extraHeaders={'accept-encoding': 'gzip'})
+        self.assertRequest(headers={'content-encoding': None, 'vary': None})
+
+    @defer.inlineCallbacks
+    def test_api_etag_encoding(self):
+        self.rsrc.compression_threshold = 0
+        yield self.render_resource(self.rsrc, '/test/13')
+        etag = self.request.headers['etag']
+        yield self.render_resource(self.rsrc, '/test/13',
+                                   extraHeaders={'accept-encoding': 'gzip'})
+        self.assertNotEqual(self.request.headers['etag'], etag)
+
+    @defer.inlineCallbacks
+    def test_api_stream_list(self):
+        self.rsrc.STREAM_BATCH_SIZE = 3
+        yield self.render_resource(self.rsrc, '/test')
+        self.assertEqual(self.request.headers.get('etag'), None)
+        self.assertRestCollection(typeName='tests',
+                                  items=endpoint.testData.values(), total=8)
+
+    def patchStreaming(self):
+        self.patch(endpoint.TestsEndpoint, 'streamKeyField', 'id')
+        self.patch(endpoint.TestsEndpoint, 'streamBatchSize', 3)
+        self.getStreamCalls = []
+        getStream = endpoint.TestsEndpoint.getStream
+
+        def trackGetStream(ep, resultSpec, kwargs):
+            self.getStreamCalls.append(resultSpec)
+            return getStream(ep, resultSpec, kwargs)
+        self.patch(endpoint.TestsEndpoint, 'getStream', trackGetStream)
+
+    @defer.inlineCallbacks
+    def test_api_stream_endpoint(self):
+        self.patchStreaming()
+        yield self.render_resource(self.rsrc, '/test?order=-info',
+                                   accept='application/json')
+        self.assertEqual(len(self.getStreamCalls), 1)
+        self.assertEqual(self.request.headers.get('etag'), None)
+        self.assertRestCollection(
+            typeName='tests',
+            items=sorted(endpoint.testData.values(),
+                         key=lambda v: v['info'], reverse=True),
+            total=8, contentType='application/json; charset=utf-8',
+            orderSignificant=True)
+
+    @defer.inlineCallbacks
+    def test_api_stream_endpoint_gzip(self):
+        self.patchStreaming()
+        self.rsrc.compression_threshold = 0
+        yield self.render_resource(self.rsrc, '/test?field=id',
+                                   extraHeaders={'accept-encoding': 'gzip'})
+        self.assertEqual(self.request.headers['content-encoding'], ['gzip'])
+        self.request.written = zlib.decompress(self.request.written,
+                                               16 + zlib.MAX_WBITS)
+        self.assertRestCollection(
+            typeName='tests', items=[{'id': id} for id in range(13, 21)],
+            total=8, orderSignificant=True)
+
+    @defer.inlineCallbacks
+    def test_api_stream_endpoint_one_batch(self):
+        self.patchStreaming()
+        self.patch(endpoint.TestsEndpoint, 'streamBatchSize', 4)
+        yield self.render_resource(self.rsrc, '/test?success=false')
+        # a result that fits in the first batch is rendered as usual
+        self.assertEqual(len(self.getStreamCalls), 1)
+        self.assertIn('etag', self.request.headers)
+        self.assertRestCollection(
+            typeName='tests',
+            items=[v for v in endpoint.testData.values() if not v['success']],
+            total=3)
+
+    @defer.inlineCallbacks
+    def test_api_stream_endpoint_one_batch_cached(self):
+        self.patchStreaming()
+        self.patch(endpoint.TestsEndpoint, 'streamBatchSize', 4)
+        self.makeCacheable()
+        self.patch(endpoint.TestsEndpoint, 'get', lambda ep, rs, kw:
+                   self.gets.append(kw) or
+                   defer.succeed(sorted(endpoint.testData.values(),
+                                        key=lambda v: v['id'])))
+        yield self.render_resource(self.rsrc, '/test?success=false')
+        yield self.render_resource(self.rsrc, '/test?success=false')
+        # the first request's batch was cached
+        self.assertEqual(len(self.getStreamCalls), 1)
+        self.assertEqual(len(self.gets), 1)
+        self.assertRestCollection(
+            typeName='tests',
+            items=[v for v in endpoint.testData.values() if not v['success']],
+            total=3)
+
+        # but not if the collection changed while it was fetched
+        def changingGet(ep, rs, kw):
+            self.master.mq.callConsumer(('test', '13', 'changed'), {})
+            return defer.succeed([endpoint.testData[14]])
+        self.patch(endpoint.TestsEndpoint, 'get', changingGet)
+        yield self.render_resource(self.rsrc, '/test?success=false&id=14')
+        self.assertEqual(
+            len(self.master.data.resultCache.keysByPath.get(('test',), ())),
+            0)
+
+    @defer.inlineCallbacks
+    def test_api_stream_endpoint_cached(self):
+        self.patchStreaming()
+        cached = base.ListResult([endpoint.testData[13]], total=1)
+        self.master.data.resultCache.peek = \
+            lambda ep, kwargs, path, rspec: cached
+        yield self.render_resource(self.rsrc, '/test')
+        yield self.render_resource(self.rsrc, '/test')
+        # cached results are not streamed
+        self.assertEqual(self.getStreamCalls, [])
+        self.assertRestCollection(typeName='tests',
+                                  items=[endpoint.testData[13]], total=1)
+
+    @defer.inlineCallbacks
+    def test_api_stream_endpoint_limit(self):
+        self.patchStreaming()
+        yield self.render_resource(self.rsrc, '/test?limit=5')
+        self.assertIn('etag', self.request.headers)
+
+    @defer.inlineCallbacks
+    def test_api_immutable(self):
+        self.patch(endpoint.TestEndpoint, 'isImmutable',
+                   lambda self, data, kwargs: defer.succeed(True))
+        yield self.render_resource(self.rsrc, '/test/13')
+        self.assertRequest(
+            responseCode=200,
+            headers={'cache-control': ['max-age=31536000, immutable']})
+
     @defer.inlineCallbacks
     def test_api_with_accept(self):
         # when 'application/json' is accepted, the result has that type
@@ -497,6 +881,26 @@ class V2RootResource_JSONRPC2(www.WwwTestMixin, unittest.TestCase):
 
         self.assertEqual(got, exp)
 
+    @defer.inlineCallbacks
+    def test_gzip(self):
+        self.rsrc.compression_threshold = 0
+        self.make_request('/test/13')
+        self.request.method = 'POST'
+        self.request.content = StringIO(json.dumps(
+            {'jsonrpc': '2.0', 'method': 'testy', 'params': {'foo': 3, 'bar': 5},
+             'id': self.UUID}))
+        self.request.input_headers = {'content-type': 'application/json',
+                                      'accept-encoding': 'gzip'}
+        self.rsrc.render(self.request)
+        yield self.request.deferred
+        self.assertEqual(self.request.headers['content-encoding'], ['gzip'])
+        self.assertEqual(
+            json.loads(zlib.decompress(self.request.written,
+                                       16 + zlib.MAX_WBITS)),
+            {'id': self.UUID, 'jsonrpc': '2.0',
+             'result': {'action': 'testy', 'args': {'foo': 3, 'bar': 5},
+                        'kwargs': {'testid': 13}}})
+
     @defer.inlineCallbacks
     def test_invalid_path(self):
         yield self.render_control_resource(self.rsrc, '/not/found')
@@ -635,3 +1039,328 @@ class V2RootResource_JSONRPC2(www.WwwTestMixin, unittest.TestCase):
             responseCode=500)
         # the error gets logged, too:
         self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+
+
+class V2RootResource_Batch(www.WwwTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.master = self.make_master(url='h:/')
+        self.master.data._scanModule(endpoint)
+        self.rsrc = rest.V2RootResource(self.master)
+        self.rsrc.reconfigResource(self.master.config)
+
+    def render_batch(self, urls, extraHeaders={}):
+        self.make_request('/batch')
+        self.request.method = 'POST'
+        self.request.content = StringIO(json.dumps(urls))
+        self.request.input_headers = {'content-type': 'application/json'}
+        self.request.input_headers.update(extraHeaders)
+        self.rsrc.render(self.request)
+        return self.request.deferred
+
+    @defer.inlineCallbacks
+    def test_batch(self):
+        yield self.render_batch(['test/13', '/test?success=false&field=id&field=success',
+                                 'test?limit=2&order=id'])
+        self.assertRequest(
+            contentType='application/json', responseCode=200,
+            contentJson={'responses': [
+                {'status': 200,
+                 'body': {'tests': [endpoint.testData[13]], 'meta': {}}},
+                {'status': 200,
+                 'body': {'tests': [{'id': id, 'success': False}
+                                    for id in (14, 18, 20)],
+                          'meta': {'total': 3}}},
+                {'status': 200,
+                 'body': {'tests': [endpoint.testData[13],
+                                    endpoint.testData[14]],
+                          'meta': {'total': 8,
+                                   'next_cursor': self.rsrc.encodeCursor(
+                                       ['id'], endpoint.testData[14])}}},
+            ]})
+
+    @defer.inlineCallbacks
+    def test_batch_quoted_path(self):
+        yield self.render_batch(['test/%31%33'])
+        self.assertRequest(
+            contentType='application/json', responseCode=200,
+            contentJson={'responses': [
+                {'status': 200,
+                 'body': {'tests': [endpoint.testData[13]], 'meta': {}}},
+            ]})
+
+    def test_decodeBatch_unquotes(self):
+        self.make_request('/batch')
+        self.request.content = StringIO(json.dumps(
+            ['/builders/a%2Fb%20c/builds?x=%2F']))
+        self.assertEqual(self.rsrc.decodeBatch(self.request),
+                         [(('builders', 'a/b c', 'builds'), {'x': ['/']})])
+
+    @defer.inlineCallbacks
+    def test_batch_concurrent(self):
+        d = defer.Deferred()
+        self.patch(endpoint.TestEndpoint, 'get',
+                   lambda self, resultSpec, kwargs: d)
+        self.render_batch(['test/13', 'test?field=id'])
+        # the collection is fetched while the other request is waiting
+        self.assertEqual(self.request.written, '')
+        d.callback(endpoint.testData[13])
+        yield self.request.deferred
+        responses = json.loads(self.request.written)['responses']
+        self.assertEqual([r['status'] for r in responses], [200, 200])
+
+    @compat.usesFlushLoggedErrors
+    @defer.inlineCallbacks
+    def test_batch_errors(self):
+        yield self.render_batch(['test/0', 'not/found', 'test?limit=x',
+                                 'test/fail', 'test/14'])
+        self.assertRequest(
+            responseCode=200,
+            contentJson={'responses': [
+                {'status': 404, 'body': {'error': 'not found'}},
+                {'status': 404, 'body': {'error': 'invalid path'}},
+                {'status': 400, 'body': {'error': 'invalid limit'}},
+                {'status': 500, 'body': {'error': "RuntimeError('oh noes',)"}},
+                {'status': 200,
+                 'body': {'tests': [endpoint.testData[14]], 'meta': {}}},
+            ]})
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+
+    @defer.inlineCallbacks
+    def test_batch_not_list(self):
+        yield self.render_batch({'test': 13})
+        self.assertRequest(responseCode=400, contentJson={
+            'error': 'batch must be a list of strings'})
+
+    @defer.inlineCallbacks
+    def test_batch_too_large(self):
+        self.rsrc.MAX_BATCH_REQUESTS = 2
+        yield self.render_batch(['test/13'] * 3)
+        self.assertRequest(responseCode=400, contentJson={
+            'error': 'batch is limited to 2 requests'})
+
+    @defer.inlineCallbacks
+    def test_batch_gzip(self):
+        self.rsrc.compression_threshold = 0
+        yield self.render_batch(['test/13'],
+                                extraHeaders={'accept-encoding': 'gzip'})
+        self.assertEqual(self.request.headers['content-encoding'], ['gzip'])
+        self.assertEqual(
+            json.loads(zlib.decompress(self.request.written,
+                                       16 + zlib.MAX_WBITS)),
+            {'responses': [{'status': 200, 'body': {
+                'tests': [endpoint.testData[13]], 'meta': {}}}]})
+
+
+class V2RootResource_RawLog(www.WwwTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.master = self.make_master(url='h:/')
+        self.rsrc = rest.V2RootResource(self.master)
+        self.rsrc.reconfigResource(self.master.config)
+        self.rsrc.RAW_LOG_LINES_PER_WRITE = 2
+        self.master.db.insertTestData([
+            fakedb.Builder(id=77),
+            fakedb.Buildslave(id=13, name='sl'),
+            fakedb.Master(id=88),
+            fakedb.Buildset(id=8822),
+            fakedb.BuildRequest(id=82, buildsetid=8822),
+            fakedb.Build(id=13, builderid=77, masterid=88, buildslaveid=13,
+                         buildrequestid=82, number=3),
+            fakedb.Step(id=50, buildid=13, number=9, name='make'),
+            fakedb.Log(id=60, stepid=50, name='stdio', slug='stdio', type='s',
+                       num_lines=5),
+            fakedb.LogChunk(logid=60, first_line=0, last_line=4, compressed=0,
+                            content='hheader\noout 1\neerr 1\noout 2\n'
+                                    'oout 3'),
+            fakedb.Log(id=61, stepid=50, name='notes', slug='notes', type='h',
+                       num_lines=3),
+            fakedb.LogChunk(logid=61, first_line=0, last_line=2, compressed=0,
+                            content=u'<b>\n\N{SNOWMAN}\n</b>'),
+            fakedb.Log(id=62, stepid=50, name='empty', slug='empty', type='t',
+                       num_lines=0),
+        ])
+
+    @defer.inlineCallbacks
+    def test_stdio(self):
+        yield self.render_resource(self.rsrc, '/logs/60/raw')
+        self.assertRequest(
+            content='header\nout 1\nerr 1\nout 2\nout 3\n',
+            contentType='text/plain; charset=utf-8',
+            responseCode=200,
+            headers={'content-disposition': ['attachment; filename=stdio.log'],
+                     'content-encoding': None})
+        # the producer was registered, and unregistered once done
+        self.assertEqual(self.request.producer, None)
+
+    @defer.inlineCallbacks
+    def test_html_by_step_path(self):
+        yield self.render_resource(self.rsrc,
+                                   '/builders/77/builds/3/steps/make/logs/notes/raw')
+        self.assertRequest(
+            content=u'<b>\n\N{SNOWMAN}\n</b>\n'.encode('utf-8'),
+            contentType='text/html; charset=utf-8',
+            responseCode=200,
+            headers={'content-disposition': ['attachment; filename=notes.html']})
+
+    @defer.inlineCallbacks
+    def test_empty(self):
+        yield self.render_resource(self.rsrc, '/logs/62/raw')
+        self.assertRequest(content='', responseCode=200)
+
+    @defer.inlineCallbacks
+    def test_missing(self):
+        yield self.render_resource(self.rsrc, '/logs/99/raw')
+        self.assertRequest(responseCode=404)
+
+    @defer.inlineCallbacks
+    def test_offset_limit(self):
+        yield self.render_resource(self.rsrc, '/logs/60/raw?offset=1&limit=3')
+        self.assertRequest(content='out 1\nerr 1\nout 2\n', responseCode=200)
+
+    @defer.inlineCallbacks
+    def test_range(self):
+        yield self.render_resource(self.rsrc, '/logs/60/raw',
+                                   extraHeaders={'range': 'lines=2-9'})
+        self.assertRequest(
+            content='err 1\nout 2\nout 3\n',
+            responseCode=206,
+            headers={'content-range': ['lines 2-4/5']})
+
+    @defer.inlineCallbacks
+    def test_range_open(self):
+        yield self.render_resource(self.rsrc, '/logs/60/raw',
+                                   extraHeaders={'range': 'lines=4-'})
+        self.assertRequest(content='out 3\n', responseCode=206,
+                           headers={'content-range': ['lines 4-4/5']})
+
+    @defer.inlineCallbacks
+    def test_range_unsatisfiable(self):
+        yield self.render_resource(self.rsrc, '/logs/60/raw',
+                                   extraHeaders={'range': 'lines=5-'})
+        self.assertRequest(content='', responseCode=416,
+                           headers={'content-range': ['lines */5']})
+
+    @defer.inlineCallbacks
+    def test_range_invalid(self):
+        yield self.render_resource(self.rsrc, '/logs/60/raw',
+                                   extraHeaders={'range': 'bytes=0-100'})
+        self.assertRequest(responseCode=400)
+
+    @defer.inlineCallbacks
+    def test_etag(self):
+        yield self.render_resource(self.rsrc, '/logs/60/raw')
+        [etag] = self.request.headers['etag']
+        self.assertEqual(self.request.headers.get('cache-control'), None)
+
+        yield self.render_resource(self.rsrc, '/logs/60/raw',
+                                   extraHeaders={'if-none-match': etag})
+        self.assertRequest(content='', responseCode=304)
+
+        # the ETag changes as lines are added
+        yield self.master.db.logs.appendLog(60, u'onew line\n')
+        yield self.render_resource(self.rsrc, '/logs/60/raw',
+                                   extraHeaders={'if-none-match': etag})
+        self.assertRequest(responseCode=200)
+        self.assertNotEqual(self.request.headers['etag'], [etag])
+
+    @defer.inlineCallbacks
+    def test_etag_gzip(self):
+        yield self.render_resource(self.rsrc, '/logs/60/raw')
+        etag = self.request.headers['etag']
+        yield self.render_resource(self.rsrc, '/logs/60/raw',
+                                   extraHeaders={'accept-encoding': 'gzip'})
+        self.assertNotEqual(self.request.headers['etag'], etag)
+
+    @defer.inlineCallbacks
+    def test_complete_immutable(self):
+        yield self.master.db.logs.finishLog(60)
+        yield self.render_resource(self.rsrc, '/logs/60/raw')
+        self.assertRequest(
+            responseCode=200,
+            headers={'cache-control': ['max-age=31536000, immutable']})
+
+    @defer.inlineCallbacks
+    def test_gzip(self):
+        yield self.render_resource(self.rsrc, '/logs/60/raw',
+                                   extraHeaders={'accept-encoding': 'deflate, gzip;q=0.5'})
+        self.assertRequest(responseCode=200,
+                           headers={'content-encoding': ['gzip'],
+                                    'vary': ['Accept-Encoding']})
+        self.assertEqual(
+            zlib.decompress(self.request.written, 16 + zlib.MAX_WBITS),
+            'header\nout 1\nerr 1\nout 2\nout 3\n')
+
+    @defer.inlineCallbacks
+    def test_deflate(self):
+        self.rsrc.compression_level = 1
+        yield self.render_resource(self.rsrc, '/logs/60/raw',
+                                   extraHeaders={'accept-encoding': 'deflate'})
+        self.assertRequest(responseCode=200,
+                           headers={'content-encoding': ['deflate']})
+        self.assertEqual(zlib.decompress(self.request.written),
+                         'header\nout 1\nerr 1\nout 2\nout 3\n')
+
+    @defer.inlineCallbacks
+    def test_gzip_refused(self):
+        yield self.render_resource(self.rsrc, '/logs/60/raw',
+                                   extraHeaders={'accept-encoding': 'gzip;q=0'})
+        self.assertRequest(content='header\nout 1\nerr 1\nout 2\nout 3\n',
+                           headers={'content-encoding': None})
+
+    @defer.inlineCallbacks
+    def test_head(self):
+        yield self.render_resource(self.rsrc, '/logs/60/raw', method='HEAD')
+        self.assertRequest(content='', responseCode=200,
+                           contentType='text/plain; charset=utf-8')
+
+    def test_paused(self):
+        request = self.make_request('/logs/60/raw')
+        write = request.write
+
+        def pausingWrite(data):
+            # the client's connection backs up after every write
+            write(data)
+            request.producer.pauseProducing()
+        request.write = pausingWrite
+
+        d = self.render_resource(self.rsrc, request=request)
+        self.assertEqual(request.written, 'header\nout 1\n')
+        request.producer.resumeProducing()
+        self.assertEqual(request.written, 'header\nout 1\nerr 1\nout 2\n')
+        request.producer.resumeProducing()
+        self.assertEqual(request.written,
+                         'header\nout 1\nerr 1\nout 2\nout 3\n')
+        self.assertFalse(request.finished)
+        request.producer.resumeProducing()
+        self.assertTrue(request.finished)
+        return d
+
+    def test_client_disconnected(self):
+        request = self.make_request('/logs/60/raw')
+        write = request.write
+
+        def pausingWrite(data):
+            write(data)
+            request.producer.pauseProducing()
+        request.write = pausingWrite
+
+        self.render_resource(self.rsrc, request=request)
+        request.producer.stopProducing()
+        # nothing more is written
+        self.assertEqual(request.written, 'header\nout 1\n')
+        self.assertEqual(request.producer, None)
+
+    def test_acceptsEncoding(self):
+        def check(header, exp):
+            request = self.make_request('/')
+            if header is not None:
+                request.input_headers['accept-encoding'] = header
+            self.assertEqual(rest.acceptsEncoding(request, 'gzip'), exp)
+        check(None, False)
+        check('deflate', False)
+        check('gzip', True)
+        check('GZIP, deflate', True)
+        check('deflate, gzip; q=0.8', True)
+        check('gzip;q=0', False)
+        check('gzip;q=bogus', False)
@@ -14,6 +14,7 @@
 # Copyright Buildbot Team Members
 
 import datetime
+import mock
 
 from buildbot.test.unit import test_data_changes
 from buildbot.test.util import www
@@ -41,6 +42,27 @@ class EventResource(www.WwwTestMixin, unittest.TestCase):
         self.assertReceivesChangeNewMessage(self.request)
         self.assertEqual(self.request.finished, False)
 
+    def test_listen_shared(self):
+        self.render_resource(self.sse, '/listen/changes/*/*')
+        request1 = self.request
+        self.readUUID(request1)
+        self.render_resource(self.sse, '/listen/changes/*/*')
+        request2 = self.request
+        self.readUUID(request2)
+        # both clients share a consumer, and the encoded event
+        self.assertEqual(len(self.master.mq.qrefs), 1)
+        self.master.mq.callConsumer(("changes", "500", "new"),
+                                    test_data_changes.Change.changeEvent)
+        self.assertEqual(request1.written, request2.written)
+        self.assertTrue(request1.written.startswith("event: event\n"))
+
+    def test_consumer_writeSequence(self):
+        request = mock.Mock()
+        consumer = sse.Consumer(request)
+        consumer.writeSequence(["event: a\n\n", "event: b\n\n"])
+        # the events held in a coalescing window make one chunk
+        request.write.assert_called_once_with("event: a\n\nevent: b\n\n")
+
     def test_listen_add_then_close(self):
         self.render_resource(self.sse, '/listen')
         request = self.request
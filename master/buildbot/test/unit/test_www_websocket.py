@@ -0,0 +1,237 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+import zlib
+
+from buildbot.www import fanout
+from buildbot.www import websocket
+from twisted.internet import defer
+from twisted.trial import unittest
+
+
+def slow_mask(buf, key):
+    return "".join(chr(ord(c) ^ ord(key[i % 4])) for i, c in enumerate(buf))
+
+
+def masked_frame(data, key, header=0x81):
+    # a frame as sent by a client, with a short length
+    return chr(header) + chr(0x80 | len(data)) + key + slow_mask(data, key)
+
+
+class Mask(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(websocket.mask("", "abcd"), "")
+
+    def test_lengths(self):
+        key = "\x00\xff\x12\x80"
+        for length in range(0, 11):
+            buf = "".join(chr((i * 37) % 256) for i in range(length))
+            self.assertEqual(websocket.mask(buf, key), slow_mask(buf, key))
+
+    def test_leading_zeros(self):
+        # the XOR of the first bytes is zero
+        self.assertEqual(websocket.mask("abcdef", "abcd"),
+                         "\x00\x00\x00\x00\x04\x04")
+
+    def test_roundtrip(self):
+        buf = "x" * 10000
+        key = "\x01\x02\x03\x04"
+        self.assertEqual(websocket.mask(websocket.mask(buf, key), key), buf)
+
+
+class Frames(unittest.TestCase):
+
+    def test_make_short(self):
+        self.assertEqual(websocket.make_hybi07_frame("hello"),
+                         "\x81\x05hello")
+
+    def test_make_medium(self):
+        frame = websocket.make_hybi07_frame("x" * 200)
+        self.assertEqual(frame[:4], "\x81\x7e\x00\xc8")
+        self.assertEqual(len(frame), 204)
+
+    def test_make_long(self):
+        frame = websocket.make_hybi07_frame("x" * 70000)
+        self.assertEqual(frame[:10],
+                         "\x81\x7f\x00\x00\x00\x00\x00\x01\x11\x70")
+
+    def test_make_compressed(self):
+        frame = websocket.make_hybi07_frame("z", compressed=True)
+        self.assertEqual(frame, "\xc1\x01z")
+
+    def test_parse_masked(self):
+        frames, rest = websocket.parse_hybi07_frames(
+            masked_frame("hello", "\x01\x02\x03\x04") + "\x81")
+        self.assertEqual(frames, [(websocket.NORMAL, "hello")])
+        self.assertEqual(rest, "\x81")
+
+    def test_parse_compressed(self):
+        data = websocket.deflate_message("hello hello hello")
+        frame = masked_frame(data, "abcd", header=0xc1)
+        frames, _ = websocket.parse_hybi07_frames(
+            frame, lambda d: zlib.decompressobj(-15).decompress(
+                d + websocket.DEFLATE_TRAILER))
+        self.assertEqual(frames, [(websocket.NORMAL, "hello hello hello")])
+
+    def test_parse_compressed_not_negotiated(self):
+        frame = masked_frame("x", "abcd", header=0xc1)
+        self.assertRaises(websocket.WSException,
+                          lambda: websocket.parse_hybi07_frames(frame))
+
+    def test_deflate_message(self):
+        data = websocket.deflate_message("abc" * 100)
+        self.assertTrue(len(data) < 300)
+        self.assertEqual(zlib.decompressobj(-15).decompress(
+            data + websocket.DEFLATE_TRAILER), "abc" * 100)
+        # messages do not depend on earlier ones
+        self.assertEqual(websocket.deflate_message("abc" * 100), data)
+
+
+class DeflateNegotiation(unittest.TestCase):
+
+    def test_no_header(self):
+        self.assertEqual(websocket.parse_deflate_offer(None), None)
+
+    def test_other_extension(self):
+        self.assertEqual(
+            websocket.parse_deflate_offer("x-webkit-deflate-frame"), None)
+
+    def test_plain(self):
+        params = websocket.parse_deflate_offer(
+            "permessage-deflate; client_max_window_bits")
+        self.assertEqual(params, {"server_no_context_takeover": None})
+        self.assertEqual(websocket.format_deflate_response(params),
+                         "permessage-deflate; server_no_context_takeover")
+
+    def test_params(self):
+        params = websocket.parse_deflate_offer(
+            "permessage-deflate; server_max_window_bits=10; "
+            "client_no_context_takeover")
+        self.assertEqual(websocket.format_deflate_response(params),
+                         "permessage-deflate; client_no_context_takeover; "
+                         "server_max_window_bits=10; "
+                         "server_no_context_takeover")
+
+    def test_unknown_param_falls_back(self):
+        params = websocket.parse_deflate_offer(
+            "permessage-deflate; foo, permessage-deflate")
+        self.assertEqual(params, {"server_no_context_takeover": None})
+
+    def test_bad_window_bits(self):
+        self.assertEqual(websocket.parse_deflate_offer(
+            "permessage-deflate; server_max_window_bits=20"), None)
+
+    def test_8_bit_window_declined(self):
+        self.assertEqual(websocket.parse_deflate_offer(
+            "permessage-deflate; server_max_window_bits=8"), None)
+        params = websocket.parse_deflate_offer(
+            "permessage-deflate; server_max_window_bits=8, "
+            "permessage-deflate")
+        self.assertEqual(params, {"server_no_context_takeover": None})
+
+
+class FakeTransport(object):
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+    def writeSequence(self, data):
+        self.written.extend(data)
+
+
+class Protocol(unittest.TestCase):
+
+    def makeProtocol(self, deflate):
+        proto = websocket.WebSocketsProtocol(None, None)
+        proto.transport = FakeTransport()
+        proto.deflate = deflate
+        return proto
+
+    def test_compressed_frames(self):
+        proto = self.makeProtocol({"server_no_context_takeover": None})
+        proto.write("a" * 1000)
+        proto.write("short")
+        big, small = proto.transport.written
+        self.assertEqual(ord(big[0]), 0xc1)
+        self.assertTrue(len(big) < 100)
+        self.assertEqual(small, "\x81\x05short")
+
+    def test_packetKey(self):
+        proto1 = self.makeProtocol({"server_no_context_takeover": None})
+        proto2 = self.makeProtocol({"server_no_context_takeover": None})
+        proto3 = self.makeProtocol(None)
+        self.assertEqual(proto1.packetKey, proto2.packetKey)
+        self.assertNotEqual(proto1.packetKey, proto3.packetKey)
+        proto2.codec = "base64"
+        self.assertNotEqual(proto1.packetKey, proto2.packetKey)
+
+    def test_writePackets(self):
+        data = "b" * 1000
+        proto1 = self.makeProtocol({"server_no_context_takeover": None})
+        proto2 = self.makeProtocol(None)
+        packet = proto1.makePacket(data)
+        proto1.writePacket(packet)
+        proto2.writePackets([proto2.makePacket(data), "raw"])
+        self.assertIdentical(proto1.transport.written[0], packet)
+        self.assertEqual(proto2.transport.written,
+                         [websocket.make_hybi07_frame(data), "raw"])
+
+    def test_inflate(self):
+        proto = self.makeProtocol({"server_no_context_takeover": None})
+        for msg in ["first message", "first message again"]:
+            data = websocket.deflate_message(msg)
+            self.assertEqual(proto.inflate(data), msg)
+
+    @defer.inlineCallbacks
+    def test_fanout_deflate_params(self):
+        # connections share the packets made for a message only if they
+        # negotiated the same deflate parameters
+        params10 = {"server_no_context_takeover": None,
+                    "server_max_window_bits": "10"}
+        params15 = {"server_no_context_takeover": None}
+        protos = [self.makeProtocol(dict(params10)),
+                  self.makeProtocol(dict(params10)),
+                  self.makeProtocol(params15),
+                  self.makeProtocol(None)]
+        consumers = []
+
+        def startConsuming(callback, key):
+            consumers.append(callback)
+            return defer.succeed(mock.Mock(name='qref'))
+        fo = fanout.Fanout(startConsuming, lambda rk, msg: msg)
+        for proto in protos:
+            yield fo.subscribe('k', proto.writePacket, proto.writePackets,
+                               proto)
+        data = "".join(str(i) for i in range(1000))
+        consumers[0](('a',), data)
+
+        [p10a], [p10b], [p15], [plain] = [p.transport.written
+                                          for p in protos]
+        self.assertIdentical(p10a, p10b)
+        self.assertEqual(p10a, websocket.make_hybi07_frame(
+            websocket.deflate_message(data, 10), compressed=True))
+        self.assertEqual(p15, websocket.make_hybi07_frame(
+            websocket.deflate_message(data, 15), compressed=True))
+        self.assertNotEqual(p10a, p15)
+        self.assertEqual(plain, websocket.make_hybi07_frame(data))
+        for packet in p10a, p15:
+            frames, _ = websocket.parse_hybi07_frames(packet,
+                                                      protos[0].inflate)
+            self.assertEqual(frames, [(websocket.NORMAL, data)])
@@ -41,6 +41,7 @@ class FakeRequest(object):
     method = 'GET'
     path = '/req.path'
     responseCode = 200
+    producer = None
 
     def __init__(self, path=None):
         self.headers = {}
@@ -64,6 +65,12 @@ class FakeRequest(object):
     def redirect(self, url):
         self.redirected_to = url
 
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+
+    def unregisterProducer(self):
+        self.producer = None
+
     def render(self, rsrc):
         rendered_resource = rsrc
         self.deferred.callback(rendered_resource)
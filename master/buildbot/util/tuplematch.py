@@ -23,3 +23,108 @@ def matchTuple(routingKey, filter):
         if f is not None and f != k:
             return False
     return True
+
+
+class TupleIndex(object):
+
+    """
+    A collection of values, each with a filter as used by L{matchTuple}, which
+    can find the values whose filters match a tuple at a cost that depends on
+    the number of matching values rather than on the size of the collection.
+
+    The filters are kept in a trie, with a branch for each distinct element
+    at each position and one for C{None}.  Matches are returned in the order
+    in which they were added.
+    """
+
+    def __init__(self):
+        # tuple length -> root node; each node is a list of a dictionary of
+        # child nodes by element, the child node for None, and a list of
+        # (sequence number, value) for filters ending at this node
+        self._roots = {}
+        self._sequence = itertools.count()
+
+    def add(self, filter, value):
+        node = self._roots.get(len(filter))
+        if node is None:
+            node = self._roots[len(filter)] = [{}, None, []]
+        for elt in filter:
+            if elt is None:
+                if node[1] is None:
+                    node[1] = [{}, None, []]
+                node = node[1]
+            else:
+                node = node[0].setdefault(elt, [{}, None, []])
+        node[2].append((next(self._sequence), value))
+
+    def remove(self, filter, value):
+        """
+        Remove a value added with the given filter, returning false if it was
+        not present.
+        """
+        node = self._roots.get(len(filter))
+        path = []
+        for elt in filter:
+            if node is None:
+                return False
+            path.append((node, elt))
+            node = node[1] if elt is None else node[0].get(elt)
+        if node is None:
+            return False
+        for i, (_, v) in enumerate(node[2]):
+            if v is value:
+                del node[2][i]
+                break
+        else:
+            return False
+
+        # prune the nodes that are left empty
+        while path and not (node[0] or node[1] or node[2]):
+            node, elt = path.pop()
+            if elt is None:
+                node[1] = None
+            else:
+                del node[0][elt]
+        if not (node[0] or node[1] or node[2]):
+            del self._roots[len(filter)]
+        return True
+
+    def values(self):
+        """
+        Return a list of all of the values, in the order they were added.
+        """
+        entries = []
+        nodes = self._roots.values()
+        while nodes:
+            node = nodes.pop()
+            entries.extend(node[2])
+            nodes.extend(node[0].values())
+            if node[1] is not None:
+                nodes.append(node[1])
+        entries.sort()
+        return [v for _, v in entries]
+
+    def match(self, key):
+        """
+        Return a list of the values whose filters match the given tuple.
+        """
+        node = self._roots.get(len(key))
+        if node is None:
+            return []
+        nodes = [node]
+        for elt in key:
+            children = []
+            for node in nodes:
+                child = node[0].get(elt)
+                if child is not None:
+                    children.append(child)
+                if node[1] is not None:
+                    children.append(node[1])
+            if not children:
+                return []
+            nodes = children
+        if len(nodes) == 1:
+            return [v for _, v in nodes[0][2]]
+        entries = [e for node in nodes for e in node[2]]
+        entries.sort()
+        return [v for _, v in entries]
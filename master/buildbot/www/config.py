@@ -26,10 +26,19 @@ class IndexResource(resource.Resource):
     # enable reconfigResource calls
     needsReconfig = True
 
-    def __init__(self, master, staticdir):
+    def __init__(self, master, staticdir, apps=None):
         resource.Resource.__init__(self, master)
         loader = jinja2.FileSystemLoader(staticdir)
         self.jinja = jinja2.Environment(loader=loader, undefined=jinja2.StrictUndefined)
+        self.jinja.globals['asset'] = self.asset
+        self.apps = apps if apps is not None else {}
+
+    def asset(self, name, app='base'):
+        # the pages refer to the assets by their fingerprinted names, so that
+        # the browsers can cache them forever
+        if app not in self.apps:
+            return name
+        return self.apps.get(app).assetPath(name)
 
     def reconfigResource(self, new_config):
         self.config = new_config.www
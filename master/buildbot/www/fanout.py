@@ -0,0 +1,235 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from collections import OrderedDict
+from twisted.internet import defer
+from twisted.internet import reactor
+
+# events which only update the state of a resource; within the coalescing
+# window, these are merged into the latest state of the resource
+COALESCED_EVENTS = frozenset(['update', 'updated', 'append'])
+
+# the default length in seconds of the coalescing window
+DEFAULT_COALESCE_INTERVAL = 0.2
+
+
+class Fanout(object):
+
+    """
+    Delivers messages to the clients of the event streams, sharing one MQ
+    consumer among all of the clients subscribed with the same key, and
+    encoding, and packing, each message once for all of them.
+
+    @param startConsuming: called as C{startConsuming(callback, key)} to
+        start consuming for a key; returns a Deferred firing with a QueueRef
+    @param encode: called as C{encode(routingKey, message)} to encode a
+        message; the result is shared by every key the message matches
+    @param frame: if given, called as C{frame(key, encoded)} to make the
+        bytes sent to the clients subscribed with C{key}
+    @param coalesceInterval: if given, called to get the length in seconds
+        of the coalescing window, or 0 to send every message immediately
+
+    Within the coalescing window, messages for the events in
+    C{COALESCED_EVENTS} are held, and a later one for the same resource
+    replaces an earlier one.  A coalesced log C{append} message gets a
+    C{lines} key giving the first and last lines appended in the window, when
+    the number of lines before the window is known.  Any other message sends
+    the held messages first, so that no client sees an older state after a
+    newer one.
+    """
+
+    _reactor = reactor
+
+    def __init__(self, startConsuming, encode, frame=None,
+                 coalesceInterval=lambda: 0):
+        self.startConsuming = startConsuming
+        self.encode = encode
+        self.frame = frame
+        self.coalesceInterval = coalesceInterval
+        # key -> _Group
+        self.groups = {}
+        # the last message encoded, and its encoding; the MQ passes the same
+        # objects to each consumer of a message
+        self._last = (None, None, None)
+
+    def subscribe(self, key, write, writeSequence=None, packer=None):
+        """
+        Subscribe C{write} to the messages for C{key}; it is called with the
+        bytes for each message.  If C{writeSequence} is given, it is called
+        instead with a list of the bytes for the messages held in a coalescing
+        window, which are sent together.  If C{packer} is given, the bytes
+        are first passed to its C{makePacket} method, once for all of the
+        subscriptions whose packers have an equal C{packetKey}.  Returns a
+        Deferred firing with an object with a C{stopConsuming} method, like a
+        QueueRef.
+        """
+        group = self.groups.get(key)
+        if group is not None:
+            return group.add(write, writeSequence, packer)
+        group = _Group(self, key)
+        subscribed = group.add(write, writeSequence, packer)
+        # exceptions from startConsuming reach the caller
+        d = self.startConsuming(group.deliver, key)
+        self.groups[key] = group
+        d.addCallbacks(group.started, group.failed)
+        return subscribed
+
+    def encodeMessage(self, routingKey, message):
+        lastKey, lastMessage, encoded = self._last
+        if routingKey is not lastKey or message is not lastMessage:
+            encoded = self.encode(routingKey, message)
+            self._last = (routingKey, message, encoded)
+        return encoded
+
+
+class _Group(object):
+
+    def __init__(self, fanout, key):
+        self.fanout = fanout
+        self.key = key
+        self.subscriptions = []
+        self.qref = None
+        # Deferreds from subscribe, waiting for the consumer to start
+        self.waiting = []
+        # resource path -> (routingKey, message, first line) of the messages
+        # held in the coalescing window
+        self.pending = OrderedDict()
+        self.flushCall = None
+        # resource path -> number of lines, for the logs seen
+        self.numLines = {}
+
+    def add(self, write, writeSequence=None, packer=None):
+        subscription = Subscription(self, write, writeSequence, packer)
+        self.subscriptions.append(subscription)
+        if self.qref:
+            return defer.succeed(subscription)
+        d = defer.Deferred()
+        self.waiting.append((d, subscription))
+        return d
+
+    def remove(self, subscription):
+        if subscription not in self.subscriptions:
+            return
+        self.subscriptions.remove(subscription)
+        if self.subscriptions:
+            return
+        if self.fanout.groups.get(self.key) is self:
+            del self.fanout.groups[self.key]
+        if self.flushCall:
+            self.flushCall.cancel()
+            self.flushCall = None
+        self.pending.clear()
+        # if the consumer has not started yet, started() stops it
+        if self.qref:
+            self.qref.stopConsuming()
+
+    def started(self, qref):
+        # clients which fall behind only need the latest state of each
+        # resource
+        qref.setDelivery('coalesce')
+        if self.subscriptions:
+            self.qref = qref
+        else:
+            qref.stopConsuming()
+        waiting, self.waiting = self.waiting, []
+        for d, subscription in waiting:
+            d.callback(subscription)
+
+    def failed(self, why):
+        if self.fanout.groups.get(self.key) is self:
+            del self.fanout.groups[self.key]
+        self.subscriptions = []
+        waiting, self.waiting = self.waiting, []
+        for d, _ in waiting:
+            d.errback(why)
+
+    def deliver(self, routingKey, message):
+        resource, event = routingKey[:-1], routingKey[-1]
+        firstLine = self.numLines.pop(resource, None)
+        if (isinstance(message, dict) and 'num_lines' in message
+                and event != 'finished'):
+            self.numLines[resource] = message['num_lines']
+
+        interval = self.fanout.coalesceInterval()
+        if not interval or event not in COALESCED_EVENTS:
+            self.flush()
+            self.send(routingKey, message)
+            return
+
+        if resource in self.pending:
+            # keep the first line of the earliest message in the window
+            firstLine = self.pending[resource][2]
+        self.pending[resource] = (routingKey, message, firstLine)
+        if not self.flushCall:
+            self.flushCall = self.fanout._reactor.callLater(interval,
+                                                            self.flush)
+
+    def flush(self):
+        if self.flushCall:
+            if self.flushCall.active():
+                self.flushCall.cancel()
+            self.flushCall = None
+        pending, self.pending = self.pending, OrderedDict()
+        if not pending:
+            return
+        seq = []
+        for routingKey, message, firstLine in pending.itervalues():
+            if routingKey[-1] == 'append' and firstLine is not None:
+                message = dict(message,
+                               lines=[firstLine, message['num_lines'] - 1])
+            seq.append(self.encode(routingKey, message))
+        packets = {}
+        # a subscriber may stop consuming while it is written to
+        for subscription in self.subscriptions[:]:
+            subscription.writeSequence(subscription.packets(seq, packets))
+
+    def encode(self, routingKey, message):
+        data = self.fanout.encodeMessage(routingKey, message)
+        if self.fanout.frame:
+            data = self.fanout.frame(self.key, data)
+        return data
+
+    def send(self, routingKey, message):
+        seq = [self.encode(routingKey, message)]
+        packets = {}
+        # a subscriber may stop consuming while it is written to
+        for subscription in self.subscriptions[:]:
+            subscription.write(subscription.packets(seq, packets)[0])
+
+
+class Subscription(object):
+
+    def __init__(self, group, write, writeSequence=None, packer=None):
+        self.group = group
+        self.write = write
+        if writeSequence is None:
+            def writeSequence(seq):
+                for data in seq:
+                    write(data)
+        self.writeSequence = writeSequence
+        self.packer = packer
+
+    def packets(self, seq, packets):
+        # the bytes written for seq; packets maps packet keys to the packets
+        # already made from seq for other subscriptions
+        if self.packer is None:
+            return seq
+        key = self.packer.packetKey
+        if key not in packets:
+            packets[key] = [self.packer.makePacket(data) for data in seq]
+        return packets[key]
+
+    def stopConsuming(self):
+        self.group.remove(self)
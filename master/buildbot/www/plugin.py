@@ -13,17 +13,146 @@
 #
 # Copyright Buildbot Team Members
 
+import hashlib
+import os
 import pkg_resources
+import posixpath
+import re
 
+from twisted.python import filepath
 from twisted.web import static
 
+# the length of the content hash put in the names of the assets
+FINGERPRINT_LENGTH = 16
+# a fingerprinted name is the name of the file, with the hash of its content
+# inserted before its extension, as in scripts.0123456789abcdef.js
+FINGERPRINTED_RE = re.compile(r'^(.*)\.([0-9a-f]{%d})(\.[^.]*)?$' % FINGERPRINT_LENGTH)
+# the content of a fingerprinted url never changes
+FINGERPRINTED_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# path -> (mtime, size, fingerprint)
+_fingerprints = {}
+
+
+def fingerprint(path):
+    """Return the hash of the content of the file at path"""
+    st = os.stat(path)
+    cached = _fingerprints.get(path)
+    if cached is not None and cached[:2] == (st.st_mtime, st.st_size):
+        return cached[2]
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), ''):
+            h.update(chunk)
+    digest = h.hexdigest()[:FINGERPRINT_LENGTH]
+    _fingerprints[path] = (st.st_mtime, st.st_size, digest)
+    return digest
+
+
+def acceptsGzip(request):
+    for coding in (request.getHeader('accept-encoding') or '').split(','):
+        params = [p.strip() for p in coding.split(';')]
+        if params[0].lower() not in ('gzip', 'x-gzip'):
+            continue
+        for param in params[1:]:
+            if param.startswith('q='):
+                try:
+                    return float(param[2:]) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+class StaticFile(static.File):
+
+    """
+    Serve the static files of a www plugin.
+
+    A file can also be requested by its fingerprinted name (see
+    L{fingerprintedName}); the response to such a request is then cached
+    forever by the browsers, as a new content gets a new name.
+
+    If a file has a gzipped copy alongside it (the www packages create them
+    when they are built), the copy is sent to the browsers which accept it.
+    """
+
+    # the fingerprint in the requested name, if any
+    fingerprint = None
+
+    def getChild(self, path, request):
+        mo = FINGERPRINTED_RE.match(path)
+        if mo is not None:
+            child = static.File.getChild(self, mo.group(1) + (mo.group(3) or ''), request)
+            if isinstance(child, StaticFile) and child.isfile():
+                child.fingerprint = mo.group(2)
+                return child
+        return static.File.getChild(self, path, request)
+
+    def fingerprintedName(self, name):
+        """
+        Return the name to request the file name (relative to this directory)
+        by, for it to be cached forever; that is name if there is no such
+        file.
+        """
+        try:
+            path = self.preauthChild(name)
+        except filepath.InsecurePath:
+            return name
+        if not path.isfile():
+            return name
+        dirname, basename = posixpath.split(name)
+        root, ext = os.path.splitext(basename)
+        return posixpath.join(dirname, "%s.%s%s" % (root, fingerprint(path.path), ext))
+
+    def gzipped(self):
+        """
+        Return a L{static.File} for the up to date gzipped copy of this file,
+        or None if there is none.
+        """
+        if self.basename().endswith('.gz'):
+            return None
+        gzpath = self.siblingExtension('.gz')
+        if not gzpath.isfile() or gzpath.getmtime() < self.getmtime():
+            return None
+        gz = static.File(gzpath.path)
+        gz.type = static.getTypeAndEncoding(self.basename(), self.contentTypes,
+                                            self.contentEncodings,
+                                            self.defaultType)[0]
+        gz.encoding = 'gzip'
+        return gz
+
+    def render_GET(self, request):
+        self.restat(False)
+        if not self.isfile():
+            return static.File.render_GET(self, request)
+
+        # a page from before the file was changed may still ask for the old
+        # content, which is not available anymore: the current content is
+        # sent, and not cached
+        if self.fingerprint is not None and self.fingerprint == fingerprint(self.path):
+            request.setHeader('cache-control', FINGERPRINTED_CACHE_CONTROL)
+
+        gz = self.gzipped()
+        if gz is not None:
+            request.setHeader('vary', 'accept-encoding')
+            if acceptsGzip(request):
+                return gz.render_GET(request)
+        return static.File.render_GET(self, request)
+    render_HEAD = render_GET
+
 
 class Application(object):
     def __init__(self, modulename, description):
         self.description = description
         self.version = pkg_resources.resource_string(modulename, "/VERSION").strip()
         self.static_dir = pkg_resources.resource_filename(modulename, "/static")
-        self.resource = static.File(self.static_dir)
+        self.resource = StaticFile(self.static_dir)
+
+    def assetPath(self, name):
+        """Return the path of the asset name, relative to the static dir, to
+        refer to it in the pages"""
+        return self.resource.fingerprintedName(name)
 
     def __repr__(self):
         return "www.plugin.Application(version={}, description={}, static_dir={})".format(
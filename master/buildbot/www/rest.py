@@ -15,20 +15,32 @@
 
 from __future__ import with_statement
 
+import base64
 import datetime
 import fnmatch
+import hashlib
 import re
 import types
+import urllib
+import urlparse
+import zlib
 
+from buildbot.data import base
 from buildbot.data import exceptions
 from buildbot.data import resultspec
+from buildbot.data import types as datatypes
 from buildbot.util import datetime2epoch
+from buildbot.util import epoch2datetime
+from buildbot.util import eventual
 from buildbot.util import json
 from buildbot.www import resource
 from contextlib import contextmanager
 from twisted.internet import defer
+from twisted.internet import interfaces
+from twisted.internet import threads
 from twisted.python import log
 from twisted.web.error import Error
+from zope.interface import implements
 
 
 class BadRequest(Exception):
@@ -42,6 +54,87 @@ class BadJsonRpc2(Exception):
         self.jsonrpccode = jsonrpccode
 
 
+def acceptsEncoding(request, encoding):
+    """Return true if the request's Accept-Encoding header allows the given
+    content-coding."""
+    for item in (request.getHeader('accept-encoding') or '').split(','):
+        params = [p.strip() for p in item.split(';')]
+        if params[0].lower() != encoding:
+            continue
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def chooseEncoding(request):
+    """Return the content-coding to use for the response to the request,
+    'gzip' or 'deflate', or None if it accepts neither."""
+    for encoding in ('gzip', 'deflate'):
+        if acceptsEncoding(request, encoding):
+            return encoding
+    return None
+
+
+def makeCompressor(encoding, level):
+    """Return a zlib compression object producing the given
+    content-coding."""
+    wbits = zlib.MAX_WBITS
+    if encoding == 'gzip':
+        wbits += 16
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+
+class PausableWriter(object):
+
+    """
+    A push producer for a request, allowing content that is generated
+    asynchronously to wait while the client's connection is backed up, so
+    that it does not accumulate in the transport's buffers.
+    """
+
+    implements(interfaces.IPushProducer)
+
+    def __init__(self, request):
+        self.request = request
+        self.stopped = False
+        self.paused = None
+        request.registerProducer(self, True)
+        # stop writing if the client goes away
+        request.notifyFinish().addErrback(lambda _: self.stopProducing())
+
+    def write(self, data):
+        self.request.write(data)
+
+    def waitForResume(self):
+        if self.paused is None:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self.paused.append(d)
+        return d
+
+    def pauseProducing(self):
+        if self.paused is None:
+            self.paused = []
+
+    def resumeProducing(self):
+        waiters, self.paused = self.paused or [], None
+        for d in waiters:
+            d.callback(None)
+
+    def stopProducing(self):
+        self.stopped = True
+        self.resumeProducing()
+
+    def unregister(self):
+        self.request.unregisterProducer()
+
+
 class RestRootResource(resource.Resource):
     version_classes = {}
 
@@ -92,6 +185,8 @@ class V2RootResource(resource.Resource):
     # - params as list is not supported
     # - rpc call batching is not supported
     # - jsonrpc2 notifications are not supported (you always get an answer)
+    #
+    # Several GETs can be made at once with a POST to the 'batch' path.
 
     # rather than construct the entire possible hierarchy of Rest resources,
     # this is marked as a leaf node, and any remaining path items are parsed
@@ -196,17 +291,171 @@ class V2RootResource(resource.Resource):
                               sort_keys=True, separators=(',', ':'))
 
             request.setHeader('content-type', JSON_ENCODED)
-            if request.method == "HEAD":
-                request.setHeader("content-length", len(data))
-                request.write('')
-            else:
-                request.write(data)
+            yield self.writeBody(request, data,
+                                 self.selectEncoding(request, len(data)))
+
+    # raw log support
+
+    # number of lines fetched from the database for each write
+    RAW_LOG_LINES_PER_WRITE = 1000
+
+    def decodeLineRange(self, request, rspec):
+        # a 'Range: lines=first-last' header (last is optional) overrides
+        # the offset and limit query parameters; return true if the header was
+        # given
+        header = request.getHeader('range')
+        if not header:
+            return False
+        mo = re.match(r'^lines=(\d+)-(\d*)$', header.strip())
+        if not mo:
+            raise BadRequest("invalid range %r" % (header,))
+        rspec.offset = int(mo.group(1))
+        rspec.limit = None
+        if mo.group(2):
+            last = int(mo.group(2))
+            if last < rspec.offset:
+                raise BadRequest("invalid range %r" % (header,))
+            rspec.limit = last - rspec.offset + 1
+        return True
 
-    # JSONAPI support
+    @defer.inlineCallbacks
+    def renderRawLog(self, request, info, isRange, immutable):
+        firstline, lastline = info['firstline'], info['lastline']
+        # the size is not known, so compress any log if the client allows
+        encoding = self.selectEncoding(request, self.compression_threshold)
+
+        # lines are only ever appended to a log, so the lines requested and the
+        # number of lines in the log identify the content
+        if immutable:
+            request.setHeader('cache-control', self.IMMUTABLE_CACHE_CONTROL)
+        etag = hashlib.sha1(repr((info['logid'], firstline, lastline,
+                                  info['num_lines'], encoding))).hexdigest()
+        self.setETag(request, etag)
+        if self.checkETag(request, etag):
+            return
 
-    def decodeResultSpec(self, request, endpoint):
-        reqArgs = request.args
+        if isRange:
+            if firstline > lastline:
+                request.setResponseCode(416)
+                request.setHeader('content-range',
+                                  'lines */%d' % (info['num_lines'],))
+                return
+            request.setResponseCode(206)
+            request.setHeader('content-range', 'lines %d-%d/%d' %
+                              (firstline, lastline, info['num_lines']))
+
+        if info['type'] == 'h':
+            ctype, ext = 'text/html', 'html'
+        else:
+            ctype, ext = 'text/plain', 'log'
+        request.setHeader('content-type', ctype + '; charset=utf-8')
+        request.setHeader('content-disposition',
+                          'attachment; filename=%s.%s' % (info['filename'], ext))
+
+        compressor = None
+        if encoding:
+            request.setHeader('content-encoding', encoding)
+            compressor = makeCompressor(encoding, self.compression_level)
+
+        if request.method == "HEAD":
+            return
 
+        # the content length is not known, so twisted uses chunked transfer
+        # encoding; only one batch of lines is in memory at any time
+        writer = PausableWriter(request)
+        try:
+            while firstline <= lastline and not writer.stopped:
+                last = min(lastline,
+                           firstline + self.RAW_LOG_LINES_PER_WRITE - 1)
+                content = yield self.master.db.logs.getLogLines(
+                    info['logid'], firstline, last)
+                if info['type'] == 's':
+                    # strip the stream identifier from each line
+                    content = u'\n'.join(l[1:] for l in content.split(u'\n'))
+                data = content.encode('utf-8')
+                if compressor:
+                    data = yield self.compress(compressor, data)
+                if data:
+                    writer.write(data)
+                yield writer.waitForResume()
+                firstline = last + 1
+            if compressor and not writer.stopped:
+                writer.write(compressor.flush())
+        finally:
+            writer.unregister()
+
+    # compression support
+
+    # bodies at least this large are compressed in a thread, so that the
+    # reactor is not blocked
+    THREADED_COMPRESSION_SIZE = 256 * 1024
+
+    def selectEncoding(self, request, size):
+        # return the content-coding for a response body of the given size
+        if self.compression_threshold is None:
+            return None
+        request.setHeader('vary', 'Accept-Encoding')
+        if size < self.compression_threshold:
+            return None
+        return chooseEncoding(request)
+
+    def compress(self, compressor, data, flush=False):
+        def thd():
+            rv = compressor.compress(data)
+            if flush:
+                rv += compressor.flush()
+            return rv
+        if len(data) >= self.THREADED_COMPRESSION_SIZE:
+            return threads.deferToThread(thd)
+        return defer.succeed(thd())
+
+    @defer.inlineCallbacks
+    def writeBody(self, request, data, encoding):
+        # write a complete response body, with the given content-coding
+        if encoding:
+            request.setHeader('content-encoding', encoding)
+            data = yield self.compress(
+                makeCompressor(encoding, self.compression_level), data,
+                flush=True)
+        if request.method == "HEAD":
+            request.setHeader("content-length", len(data))
+            request.write('')
+        else:
+            request.write(data)
+
+    # HTTP caching support
+
+    # Cache-Control header for resources that can never change
+    IMMUTABLE_CACHE_CONTROL = 'max-age=31536000, immutable'
+
+    def checkETag(self, request, etag, encodings=()):
+        # return true if the client's If-None-Match header shows that it
+        # already has the representation with this (strong) ETag, or the same
+        # content with one of the given content-codings, in which case the
+        # response is a bodiless 304 with the matching ETag
+        header = request.getHeader('if-none-match')
+        if not header:
+            return False
+        tags = [t.strip() for t in header.split(',')]
+        for tag in [etag] + [self.codedETag(etag, e) for e in encodings if e]:
+            tag = '"%s"' % (tag,)
+            if '*' in tags or tag in tags or 'W/' + tag in tags:
+                request.setHeader('etag', tag)
+                request.setResponseCode(304)
+                return True
+        return False
+
+    def setETag(self, request, etag, encoding=None):
+        request.setHeader('etag', '"%s"' % (self.codedETag(etag, encoding),))
+
+    @staticmethod
+    def codedETag(etag, encoding):
+        # the ETag must differ for each content-coding
+        return etag + '-' + encoding if encoding else etag
+
+    # JSONAPI support
+
+    def decodeResultSpec(self, reqArgs, endpoint):
         def checkFields(fields, negOk=False):
             for k in fields:
                 if k[0] == '-' and negOk:
@@ -215,10 +464,27 @@ class V2RootResource(resource.Resource):
                     raise BadRequest("no such field %r" % (k,))
 
         entityType = endpoint.rtype.entityType
-        limit = offset = order = fields = None
+        limit = offset = order = fields = cursor = None
         filters = []
+        aggregates = []
+        groupBy = []
         for arg in reqArgs:
-            if arg == 'order':
+            if arg == 'aggregate':
+                for a in reqArgs[arg]:
+                    function, _, field = a.partition(':')
+                    if function not in resultspec.Aggregate.functions or \
+                            (not field and function != 'count'):
+                        raise BadRequest("invalid aggregate %r" % (a,))
+                    if field:
+                        checkFields([field])
+                    aggregates.append(resultspec.Aggregate(function,
+                                                           field or None))
+                continue
+            elif arg == 'group_by':
+                groupBy = reqArgs[arg]
+                checkFields(groupBy)
+                continue
+            elif arg == 'order':
                 order = reqArgs[arg]
                 checkFields(order, True)
                 continue
@@ -238,6 +504,9 @@ class V2RootResource(resource.Resource):
                 except Exception:
                     raise BadRequest('invalid offset')
                 continue
+            elif arg == 'cursor':
+                cursor = self.decodeCursor(reqArgs[arg][0], entityType)
+                continue
             elif arg in entityType.fieldNames:
                 field = entityType.fields[arg]
                 try:
@@ -273,17 +542,67 @@ class V2RootResource(resource.Resource):
                 if filter.field not in fieldsSet:
                     raise BadRequest("cannot filter on un-selected fields")
 
+        # a cursor carries its own order, and replaces the offset
+        after = None
+        if cursor is not None:
+            cursorOrder, after = cursor
+            if order is None:
+                order = cursorOrder
+            elif order != cursorOrder:
+                raise BadRequest("cursor does not match order")
+            if offset is not None:
+                raise BadRequest("cannot use both cursor and offset")
+            if fields and set(o.lstrip('-') for o in order) - set(fields):
+                raise BadRequest("cannot order on un-selected fields")
+
+        # aggregates summarize the whole collection
+        if groupBy and not aggregates:
+            raise BadRequest("group_by requires an aggregate")
+        if aggregates and (fields or order or limit is not None
+                           or offset is not None or cursor is not None):
+            raise BadRequest("aggregates cannot be combined with fields, "
+                             "order or pagination")
+
         # bulid the result spec
         rspec = resultspec.ResultSpec(fields=fields, limit=limit,
-                                      offset=offset, order=order, filters=filters)
+                                      offset=offset, order=order, filters=filters,
+                                      after=after, aggregates=aggregates,
+                                      groupBy=groupBy)
 
         # for singular endpoints, only allow fields
         if not endpoint.isCollection:
-            if rspec.filters:
+            if rspec.filters or rspec.aggregates:
                 raise BadRequest("this is not a collection")
 
         return rspec
 
+    def encodeCursor(self, order, item):
+        # the cursor is opaque to clients; it records the order and the values
+        # of the order fields of the last item on the page
+        after = [item[o.lstrip('-')] for o in order]
+        return base64.urlsafe_b64encode(
+            json.dumps([order, after], default=self._toJson,
+                       separators=(',', ':')))
+
+    def decodeCursor(self, cursor, entityType):
+        try:
+            order, after = json.loads(base64.urlsafe_b64decode(str(cursor)))
+            if len(order) != len(after):
+                raise ValueError
+        except Exception:
+            raise BadRequest('invalid cursor')
+        for i, o in enumerate(order):
+            if not isinstance(o, basestring) or \
+                    o.lstrip('-') not in entityType.fieldNames:
+                raise BadRequest('invalid cursor')
+            fieldType = entityType.fields[o.lstrip('-')]
+            if isinstance(fieldType, datatypes.NoneOk):
+                fieldType = fieldType.nestedType
+            # datetimes are represented as epoch times in JSON
+            if isinstance(fieldType, datatypes.DateTime) and after[i] is not None:
+                after[i] = epoch2datetime(after[i])
+        return [str(o) for o in order], after
+
     @defer.inlineCallbacks
     def renderRest(self, request):
         def writeError(msg, errcode=404, jsonrpccode=None):
@@ -296,57 +615,95 @@ class V2RootResource(resource.Resource):
         with self.handleErrors(writeError):
             ep, kwargs = self.getEndpoint(request)
 
-            rspec = self.decodeResultSpec(request, ep)
-            data = yield ep.get(rspec, kwargs)
+            rspec = self.decodeResultSpec(request.args, ep)
+            # the order and pagination are consumed by endpoints which apply
+            # them in SQL, but the cursor for the next page needs them
+            order, limit = rspec.order, rspec.limit
+            etag = None
+            if ep.isRaw:
+                isRange = self.decodeLineRange(request, rspec)
+                data = yield ep.get(rspec, kwargs)
+            else:
+                path = tuple(request.postpath)
+                resultCache = self.master.data.resultCache
+                compact = self.isCompact(request)
+
+                # if the result cache tracks the changes to this path, the
+                # ETag is known without fetching anything
+                stamp = resultCache.changeStamp(ep, kwargs, path)
+                if stamp is not None:
+                    etag = hashlib.sha1(repr((path, rspec.cacheKey(), compact,
+                                              stamp))).hexdigest()
+                    encoding = self.selectEncoding(request,
+                                                   self.compression_threshold)
+                    if self.checkETag(request, etag, [encoding]):
+                        return
+
+                data = resultCache.peek(ep, kwargs, path, rspec)
+                # on a cache miss, a collection requested without pagination
+                # is fetched a batch at a time, if the endpoint supports it
+                stream = None
+                if data is None:
+                    specKey = rspec.cacheKey()
+                    stream = ep.getStream(rspec, kwargs)
+                if stream is not None:
+                    first = yield stream.nextBatch()
+                    if len(first) >= ep.streamBatchSize:
+                        self.setContentType(request)
+                        self.setExpires(request)
+                        yield self.renderRestStream(
+                            request, ep.rtype.plural,
+                            self.batchStream([first], stream), None,
+                            compact, self.checkStamp(etag, stamp, ep, kwargs,
+                                                     path))
+                        return
+                    # the collection fits in one batch, so it is rendered,
+                    # and cached, as usual
+                    data = base.ListResult(first, total=len(first))
+                    resultCache.put(ep, kwargs, path, specKey, data, stamp)
+                elif data is None:
+                    # this also post-processes any remaining parts of the
+                    # resultspec
+                    data = yield resultCache.get(ep, kwargs, path, rspec)
+                etag = self.checkStamp(etag, stamp, ep, kwargs, path)
             if data is None:
                 writeError("not found", errcode=404)
                 return
-            # post-process any remaining parts of the resultspec
-            data = rspec.apply(data)
-
-            # annotate the result with some metadata
-            meta = {}
-            if ep.isCollection:
-                offset, total = data.offset, data.total
-                if offset is None:
-                    offset = 0
-
-                # add total, if known
-                if total is not None:
-                    meta['total'] = total
-
-                # get the real list instance out of the ListResult
-                data = data.data
+            # aggregates are not checked for immutability, as they do not
+            # contain the items
+            immutable = False
+            if not rspec.aggregates:
+                immutable = yield ep.isImmutable(data, kwargs)
+            if ep.isRaw:
+                yield self.renderRawLog(request, data, isRange, immutable)
+                return
+
+            data, meta = self.annotateResult(ep, data, order, limit)
+
+            typeName = self.resultTypeName(ep, rspec)
+            self.setContentType(request)
+
+            # set up caching
+            if immutable:
+                request.setHeader("cache-control", self.IMMUTABLE_CACHE_CONTROL)
             else:
-                data = [data]
+                self.setExpires(request)
+
+            # encode large collections a batch at a time, rather than as one
+            # huge string
+            if len(data) > self.STREAM_BATCH_SIZE:
+                batches = [data[i:i + self.STREAM_BATCH_SIZE] for i in
+                           xrange(0, len(data), self.STREAM_BATCH_SIZE)]
+                yield self.renderRestStream(
+                    request, typeName, self.batchStream(batches), meta,
+                    compact, etag)
+                return
 
-            typeName = ep.rtype.plural
             data = {
                 typeName: data,
                 'meta': meta
             }
 
-            # set up the content type and formatting options; if the request
-            # accepts text/html or text/plain, the JSON will be rendered in a
-            # readable, multiline format.
-
-            if 'application/json' in (request.getHeader('accept') or ''):
-                compact = True
-                request.setHeader("content-type",
-                                  'application/json; charset=utf-8')
-            else:
-                compact = False
-                request.setHeader("content-type",
-                                  'text/plain; charset=utf-8')
-
-            # set up caching
-            if self.cache_seconds:
-                now = datetime.datetime.utcnow()
-                expires = now + datetime.timedelta(seconds=self.cache_seconds)
-                request.setHeader("Expires",
-                                  expires.strftime("%a, %d %b %Y %H:%M:%S GMT"))
-                request.setHeader("Pragma", "no-cache")
-
             # filter out blanks if necessary and render the data
             if compact:
                 data = json.dumps(data, default=self._toJson,
@@ -355,10 +712,236 @@ class V2RootResource(resource.Resource):
                 data = json.dumps(data, default=self._toJson,
                                   sort_keys=True, indent=2)
 
-            if request.method == "HEAD":
-                request.setHeader("content-length", len(data))
+            encoding = self.selectEncoding(request, len(data))
+            if etag is None:
+                # without a change stamp, the content identifies itself
+                etag = hashlib.sha1(data).hexdigest()
+                if self.checkETag(request, self.codedETag(etag, encoding)):
+                    return
+            self.setETag(request, etag, encoding)
+
+            yield self.writeBody(request, data, encoding)
+
+    def checkStamp(self, etag, stamp, ep, kwargs, path):
+        # return the ETag made from the change stamp taken before a fetch, or
+        # None if the result fetched may be newer than that stamp
+        if stamp is None or \
+                self.master.data.resultCache.changeStamp(ep, kwargs,
+                                                         path) != stamp:
+            return None
+        return etag
+
+    def resultTypeName(self, ep, rspec):
+        # the key of the result in the response
+        if rspec.aggregates:
+            return 'aggregates'
+        return ep.rtype.plural
+
+    def annotateResult(self, ep, data, order, limit):
+        # return the list of items in a result, and the metadata for the
+        # response; order and limit are those requested, before the result
+        # spec was applied
+        meta = {}
+        if not ep.isCollection:
+            return [data], meta
+
+        # add total, if known
+        if data.total is not None:
+            meta['total'] = data.total
+
+        # if this is a full page in a known order, add a cursor for fetching
+        # the next one
+        if order and limit and len(data) == limit:
+            meta['next_cursor'] = self.encodeCursor(order, data[-1])
+
+        # get the real list instance out of the ListResult
+        return data.data, meta
+
+    def isCompact(self, request):
+        # if the request accepts text/html or text/plain, the JSON will be
+        # rendered in a readable, multiline format.  Return true for compact
+        # JSON.
+        return 'application/json' in (request.getHeader('accept') or '')
+
+    def setContentType(self, request):
+        # set up the content type for the formatting options, returning true
+        # for compact JSON
+        if self.isCompact(request):
+            request.setHeader("content-type",
+                              'application/json; charset=utf-8')
+            return True
+        else:
+            request.setHeader("content-type",
+                              'text/plain; charset=utf-8')
+            return False
+
+    def setExpires(self, request):
+        if self.cache_seconds:
+            now = datetime.datetime.utcnow()
+            expires = now + datetime.timedelta(seconds=self.cache_seconds)
+            request.setHeader("Expires",
+                              expires.strftime("%a, %d %b %Y %H:%M:%S GMT"))
+            request.setHeader("Pragma", "no-cache")
+
+    # streaming support
+
+    # collections are encoded and written this many items at a time
+    STREAM_BATCH_SIZE = 500
+
+    def batchStream(self, batches, stream=None):
+        # a StreamedResult producing the given batches, then any from stream
+        batches = list(batches)
+
+        def nextBatch():
+            if batches:
+                return defer.succeed(batches.pop(0))
+            elif stream:
+                return stream.nextBatch()
+            return defer.succeed([])
+        return base.StreamedResult(nextBatch)
+
+    @defer.inlineCallbacks
+    def renderRestStream(self, request, typeName, stream, meta, compact,
+                         etag=None):
+        # write the envelope, then each batch of items as it is encoded,
+        # letting the reactor run in between.  Meta comes last, so that if it
+        # is not given it can include the total number of items.  The ETag,
+        # if known, is given without the content-coding.
+        if compact:
+            kwargs = dict(separators=(',', ':'))
+            sep = ','
+        else:
+            kwargs = dict(indent=2)
+            sep = ',\n'
+
+        def encode(obj):
+            return json.dumps(obj, default=self._toJson, sort_keys=True,
+                              **kwargs)
+
+        # the size is not known, so compress any stream if the client allows
+        encoding = self.selectEncoding(request, self.compression_threshold)
+        compressor = None
+        if encoding:
+            request.setHeader('content-encoding', encoding)
+            compressor = makeCompressor(encoding, self.compression_level)
+        if etag is not None:
+            self.setETag(request, etag, encoding)
+
+        if request.method == "HEAD":
+            return
+
+        writer = PausableWriter(request)
+
+        @defer.inlineCallbacks
+        def write(data, flush=False):
+            if compressor:
+                data = yield self.compress(compressor, data, flush=flush)
+            if data:
+                writer.write(data)
+
+        try:
+            count = 0
+            data = '{%s:[' % (encode(typeName),)
+            while not writer.stopped:
+                batch = yield stream.nextBatch()
+                if not batch:
+                    break
+                if count:
+                    data += sep
+                data += sep.join(encode(item) for item in batch)
+                count += len(batch)
+                yield write(data)
+                data = ''
+                yield writer.waitForResume()
+                yield eventual.fireEventually()
+            if writer.stopped:
+                return
+            if meta is None:
+                meta = {'total': count}
+            yield write(data + '],%s:%s}' % (encode('meta'), encode(meta)),
+                        flush=True)
+        finally:
+            writer.unregister()
+
+    # batch support
+
+    # the maximum number of requests in a single batch
+    MAX_BATCH_REQUESTS = 100
+
+    def decodeBatch(self, request):
+        # the body is a JSON list of REST URLs, relative to this resource,
+        # with their query strings
+        try:
+            urls = json.loads(request.content.read())
+        except Exception, e:
+            raise BadRequest("JSON parse error: %s" % (str(e),))
+        if not isinstance(urls, list) or \
+                not all(isinstance(u, basestring) for u in urls):
+            raise BadRequest("batch must be a list of strings")
+        if len(urls) > self.MAX_BATCH_REQUESTS:
+            raise BadRequest("batch is limited to %d requests"
+                             % (self.MAX_BATCH_REQUESTS,))
+        requests = []
+        for url in urls:
+            path, _, query = url.encode('utf-8').partition('?')
+            # as in a request's URL, path segments are percent-encoded
+            path = tuple(urllib.unquote(p)
+                         for p in path.lstrip('/').split('/'))
+            requests.append((path, urlparse.parse_qs(query,
+                                                     keep_blank_values=True)))
+        return requests
+
+    @defer.inlineCallbacks
+    def getBatchResponse(self, path, reqArgs):
+        # get the response to one request in a batch, as a dictionary with
+        # the HTTP status code and the body that a REST request would get
+        response = {}
+
+        def writeError(msg, errcode=404, jsonrpccode=None):
+            if self.debug:
+                log.msg("REST batch error: %s" % (msg,))
+            response['status'] = errcode
+            response['body'] = dict(error=msg)
+
+        with self.handleErrors(writeError):
+            ep, kwargs = self.master.data.getEndpoint(path)
+            if ep.isRaw:
+                raise BadRequest("raw resources cannot be batched")
+            rspec = self.decodeResultSpec(reqArgs, ep)
+            order, limit = rspec.order, rspec.limit
+            data = yield self.master.data.resultCache.get(ep, kwargs, path,
+                                                          rspec)
+            if data is None:
+                writeError("not found", errcode=404)
             else:
-                request.write(data)
+                data, meta = self.annotateResult(ep, data, order, limit)
+                response['status'] = 200
+                response['body'] = {self.resultTypeName(ep, rspec): data,
+                                    'meta': meta}
+        defer.returnValue(response)
+
+    @defer.inlineCallbacks
+    def renderBatch(self, request):
+        def writeError(msg, errcode=400, jsonrpccode=None):
+            if self.debug:
+                log.msg("REST batch error: %s" % (msg,))
+            request.setResponseCode(errcode)
+            request.setHeader('content-type', 'text/plain; charset=utf-8')
+            request.write(json.dumps(dict(error=msg)))
+
+        with self.handleErrors(writeError):
+            requests = self.decodeBatch(request)
+            # the requests are resolved concurrently; errors are reported
+            # in each request's response
+            responses = yield defer.gatherResults(
+                [self.getBatchResponse(path, reqArgs)
+                 for path, reqArgs in requests])
+
+            data = json.dumps({'responses': responses}, default=self._toJson,
+                              sort_keys=True, separators=(',', ':'))
+            request.setHeader('content-type', JSON_ENCODED)
+            yield self.writeBody(request, data,
+                                 self.selectEncoding(request, len(data)))
 
     def reconfigResource(self, new_config):
         # pre-translate the origin entries in the config
@@ -368,6 +951,9 @@ class V2RootResource(resource.Resource):
         # and copy some other flags
         self.debug = new_config.www.get('debug')
         self.cache_seconds = new_config.www.get('json_cache_seconds', 0)
+        self.compression_threshold = new_config.www.get(
+            'compression_threshold', 1024)
+        self.compression_level = new_config.www.get('compression_level', 6)
 
     def render(self, request):
         def writeError(msg, errcode=400):
@@ -414,8 +1000,11 @@ class V2RootResource(resource.Resource):
                 if isPreflight:
                     defer.returnValue("")
 
-        # based on the method, this is either JSONRPC or REST
-        if request.method == 'POST':
+        # based on the method, this is either JSONRPC or REST, or a batch of
+        # REST requests
+        if request.method == 'POST' and request.postpath == ['batch']:
+            res = yield self.renderBatch(request)
+        elif request.method == 'POST':
             res = yield self.renderJsonRpc(request)
         elif request.method in ('GET', 'HEAD'):
             res = yield self.renderRest(request)
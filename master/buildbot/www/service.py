@@ -121,7 +121,8 @@ class WWWService(config.ReconfigurableServiceMixin, service.AsyncMultiService):
             root.putChild(key, self.apps.get(key).resource)
 
         # /
-        root.putChild('', wwwconfig.IndexResource(self.master, self.apps.get('base').static_dir))
+        root.putChild('', wwwconfig.IndexResource(
+            self.master, self.apps.get('base').static_dir, self.apps))
 
         # /auth
         root.putChild('auth', auth.AuthRootResource(self.master))
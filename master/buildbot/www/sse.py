@@ -19,21 +19,30 @@ import uuid
 from buildbot.data.exceptions import InvalidPathError
 from buildbot.util import datetime2epoch
 from buildbot.util import json
+from buildbot.www import fanout
 from twisted.python import log
 from twisted.web import resource
 from twisted.web import server
 
 
+def encodeEvent(key, message):
+    # the complete event, shared by every client the message goes to
+    msg = dict(key=key, message=message)
+    return ("event: event\ndata: " + json.dumps(msg, default=_toJson)
+            + "\n\n")
+
+
+def _toJson(obj):
+    if isinstance(obj, datetime.datetime):
+        return datetime2epoch(obj)
+
+
 class Consumer(object):
 
     def __init__(self, request):
         self.request = request
         self.qrefs = {}
 
-    def _toJson(self, obj):
-        if isinstance(obj, datetime.datetime):
-            return datetime2epoch(obj)
-
     def stopConsuming(self, key=None):
         if key is not None:
             self.qrefs[key].stopConsuming()
@@ -42,12 +51,12 @@ class Consumer(object):
                 qref.stopConsuming()
             self.qrefs = {}
 
-    def onMessage(self, event, data):
-        request = self.request
-        msg = dict(key=event, message=data)
-        request.write("event: " + "event" + "\n")
-        request.write("data: " + json.dumps(msg, default=self._toJson) + "\n")
-        request.write("\n")
+    def write(self, event):
+        self.request.write(event)
+
+    def writeSequence(self, events):
+        # one chunk of the response for all of the events
+        self.request.write(''.join(events))
 
     def registerQref(self, path, qref):
         self.qrefs[path] = qref
@@ -59,6 +68,13 @@ class EventResource(resource.Resource):
     def __init__(self, master):
         self.master = master
         self.consumers = {}
+        self.fanout = fanout.Fanout(
+            lambda cb, path: self.master.mq.startConsuming(cb, path),
+            encodeEvent, coalesceInterval=self.coalesceInterval)
+
+    def coalesceInterval(self):
+        return self.master.config.www.get('event_coalesce_interval',
+                                          fanout.DEFAULT_COALESCE_INTERVAL)
 
     def decodePath(self, path):
         for i, p in enumerate(path):
@@ -106,9 +122,8 @@ class EventResource(resource.Resource):
                     options[k] = options[k][1]
 
             try:
-                d = self.master.mq.startConsuming(
-                    consumer.onMessage,
-                    tuple(path))
+                d = self.fanout.subscribe(tuple(path), consumer.write,
+                                          consumer.writeSequence)
 
                 @d.addCallback
                 def register(qref):
@@ -42,8 +42,12 @@ The WebSockets protocol (RFC 6455), provided as a resource which wraps a
 factory.
 """
 
+import zlib
+
 from base64 import b64decode
 from base64 import b64encode
+from binascii import hexlify
+from binascii import unhexlify
 from hashlib import sha1
 from struct import pack
 from struct import unpack
@@ -95,6 +99,13 @@ decoders = {
     "base64": b64decode,
 }
 
+# permessage-deflate (RFC 7692): the bit set in the header of compressed
+# frames, the trailer removed from each compressed message, and the smallest
+# message worth compressing
+RSV1 = 0x40
+DEFLATE_TRAILER = "\x00\x00\xff\xff"
+DEFLATE_THRESHOLD = 128
+
 # Authentication for WS.
 
 
@@ -121,38 +132,110 @@ def mask(buf, key):
     The key must be exactly four bytes long.
     """
 
-    # This is super-secure, I promise~
-    key = [ord(i) for i in key]
-    buf = list(buf)
-    for i, char in enumerate(buf):
-        buf[i] = chr(ord(char) ^ key[i % 4])
-    return "".join(buf)
+    # XOR the whole buffer at once, as one long integer, rather than a
+    # character at a time
+    length = len(buf)
+    if not length:
+        return ""
+    key = (key * (length // 4 + 1))[:length]
+    masked = int(hexlify(buf), 16) ^ int(hexlify(key), 16)
+    return unhexlify("%0*x" % (length * 2, masked))
 
 
-def make_hybi07_frame(buf, opcode=NORMAL):
+def make_hybi07_frame(buf, opcode=NORMAL, compressed=False):
     """
     Make a HyBi-07 frame.
 
     This function always creates unmasked frames, and attempts to use the
-    smallest possible lengths.
+    smallest possible lengths.  If C{compressed} is true, C{buf} must have
+    been compressed with L{deflate_message}.
     """
 
-    if len(buf) > 0xffff:
-        length = "\x7f%s" % pack(">Q", len(buf))
-    elif len(buf) > 0x7d:
-        length = "\x7e%s" % pack(">H", len(buf))
+    header = 0x80 | opcode_for_type[opcode]
+    if compressed:
+        header |= RSV1
+    length = len(buf)
+    if length > 0xffff:
+        head = pack(">BBQ", header, 0x7f, length)
+    elif length > 0x7d:
+        head = pack(">BBH", header, 0x7e, length)
     else:
-        length = chr(len(buf))
+        head = pack(">BB", header, length)
+    return head + buf
+
 
-    # Always make a normal packet.
-    header = chr(0x80 | opcode_for_type[opcode])
-    frame = "%s%s%s" % (header, length, buf)
-    return frame
+def deflate_message(buf, wbits=15):
+    """
+    Compress a message for permessage-deflate, without context takeover, so
+    that the result does not depend on earlier messages.
+    """
 
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+                                  -wbits)
+    data = compressor.compress(buf) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    # 7.2.1: remove the empty block's trailer
+    return data[:-4]
 
-def parse_hybi07_frames(buf):
+
+def parse_deflate_offer(header):
+    """
+    Choose the first acceptable permessage-deflate offer from a
+    Sec-WebSocket-Extensions header, returning the parameters to respond
+    with, or None.
+    """
+
+    if not header:
+        return None
+    for offer in header.split(","):
+        params = [p.strip() for p in offer.split(";")]
+        if params[0] != "permessage-deflate":
+            continue
+        # messages are always compressed without context takeover, so that
+        # a message sent to many clients is compressed once
+        response = {"server_no_context_takeover": None}
+        for param in params[1:]:
+            name, _, value = param.partition("=")
+            name, value = name.strip(), value.strip().strip('"') or None
+            if name == "server_no_context_takeover":
+                continue
+            elif name == "client_no_context_takeover":
+                response[name] = None
+            elif name == "server_max_window_bits":
+                # zlib does not support raw deflate with 8-bit windows, and
+                # the server may not use a larger window than the client asks
+                # for, so such an offer is declined
+                if not value or not value.isdigit() or \
+                        not 9 <= int(value) <= 15:
+                    break
+                response[name] = value
+            elif name == "client_max_window_bits":
+                # the client may use any window size up to 15 bits
+                if value and (not value.isdigit() or
+                              not 8 <= int(value) <= 15):
+                    break
+            else:
+                break
+        else:
+            return response
+    return None
+
+
+def format_deflate_response(params):
+    parts = ["permessage-deflate"]
+    for name in sorted(params):
+        if params[name] is None:
+            parts.append(name)
+        else:
+            parts.append("%s=%s" % (name, params[name]))
+    return "; ".join(parts)
+
+
+def parse_hybi07_frames(buf, inflate=None):
     """
     Parse HyBi-07 frames in a highly compliant manner.
+
+    If C{inflate} is given, frames with the RSV1 bit set are compressed with
+    permessage-deflate, and C{inflate} is called to decompress them.
     """
 
     start = 0
@@ -166,7 +249,8 @@ def parse_hybi07_frames(buf):
         # Grab the header. This single byte holds some flags nobody cares
         # about, and an opcode which nobody cares about.
         header = ord(buf[start])
-        if header & 0x70:
+        compressed = inflate and header & RSV1
+        if header & 0x70 & ~(RSV1 if inflate else 0):
             # At least one of the reserved flags is set. Pork chop sandwiches!
             raise WSException("Reserved flag in HyBi-07 frame (%d)" % header)
             frames.append(("", CLOSE))
@@ -227,6 +311,9 @@ def parse_hybi07_frames(buf):
         if masked:
             data = mask(data, key)
 
+        if compressed:
+            data = inflate(data)
+
         if opcode == CLOSE:
             if len(data) >= 2:
                 # Gotta unpack the opcode and return usable data here.
@@ -250,6 +337,9 @@ class WebSocketsProtocol(ProtocolWrapper):
 
     buf = ""
     codec = None
+    # the negotiated permessage-deflate parameters, or None
+    deflate = None
+    inflater = None
 
     def __init__(self, *args, **kwargs):
         ProtocolWrapper.__init__(self, *args, **kwargs)
@@ -265,8 +355,9 @@ class WebSocketsProtocol(ProtocolWrapper):
         """
 
         try:
-            frames, self.buf = parse_hybi07_frames(self.buf)
-        except WSException:
+            frames, self.buf = parse_hybi07_frames(
+                self.buf, self.inflate if self.deflate is not None else None)
+        except (WSException, zlib.error):
             # Couldn't parse all the frames, something went wrong, let's bail.
             log.err()
             self.loseConnection()
@@ -300,14 +391,44 @@ class WebSocketsProtocol(ProtocolWrapper):
         Send all pending frames.
         """
 
-        for frame in self.pending_frames:
-            # Encode the frame before sending it.
-            if self.codec:
-                frame = encoders[self.codec](frame)
-            packet = make_hybi07_frame(frame)
-            self.transport.write(packet)
+        self.transport.writeSequence(
+            [self.makePacket(frame) for frame in self.pending_frames])
         self.pending_frames = []
 
+    @property
+    def packetKey(self):
+        """
+        The negotiated parameters which L{makePacket} depends on; connections
+        with equal keys make the same packets from the same data.
+        """
+        deflate = self.deflate
+        if deflate is not None:
+            deflate = tuple(sorted(deflate.items()))
+        return (self.codec, deflate)
+
+    def makePacket(self, data):
+        """
+        Make the bytes sent for a frame holding C{data}.
+        """
+        # Encode the frame before sending it.
+        if self.codec:
+            data = encoders[self.codec](data)
+        return self.makeFrame(data)
+
+    def makeFrame(self, data):
+        if self.deflate is None or len(data) < DEFLATE_THRESHOLD:
+            return make_hybi07_frame(data)
+        wbits = int(self.deflate.get("server_max_window_bits") or 15)
+        return make_hybi07_frame(deflate_message(data, wbits),
+                                 compressed=True)
+
+    def inflate(self, data):
+        # 7.2.2: restore the trailer removed by the sender
+        if self.inflater is None or \
+                "client_no_context_takeover" in self.deflate:
+            self.inflater = zlib.decompressobj(-15)
+        return self.inflater.decompress(data + DEFLATE_TRAILER)
+
     def dataReceived(self, data):
         self.buf += data
 
@@ -341,6 +462,22 @@ class WebSocketsProtocol(ProtocolWrapper):
         self.pending_frames.extend(data)
         self.sendFrames()
 
+    def writePacket(self, packet):
+        """
+        Write a packet made by L{makePacket} to the transport.
+        """
+
+        self.writePackets([packet])
+
+    def writePackets(self, packets):
+        """
+        Write a sequence of packets made by L{makePacket} to the transport.
+        """
+
+        if self.pending_frames:
+            self.sendFrames()
+        self.transport.writeSequence(packets)
+
     def loseConnection(self):
         """
         Close the connection.
@@ -459,6 +596,10 @@ class WebSocketsResource(object):
                 log.msg("Codec %s is not implemented" % codec)
                 failed = True
 
+        # Compress messages if the client offers permessage-deflate.
+        deflate = parse_deflate_offer(
+            request.getHeader("Sec-WebSocket-Extensions"))
+
         if failed:
             request.setResponseCode(400)
             return ""
@@ -476,6 +617,9 @@ class WebSocketsResource(object):
         # 4.2.2.5.5 Optional codec declaration
         if codec:
             request.setHeader("Sec-WebSocket-Protocol", codec)
+        if deflate is not None:
+            request.setHeader("Sec-WebSocket-Extensions",
+                              format_deflate_response(deflate))
 
         # Create the protocol. This could fail, in which case we deliver an
         # error status. Status 502 was decreed by glyph; blame him.
@@ -485,6 +629,7 @@ class WebSocketsResource(object):
             return ""
         if codec:
             protocol.codec = codec
+        protocol.deflate = deflate
 
         # Provoke request into flushing headers and finishing the handshake.
         request.write("")
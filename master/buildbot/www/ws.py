@@ -13,7 +13,11 @@
 #
 # Copyright  Team Members
 
+import datetime
+
+from buildbot.util import datetime2epoch
 from buildbot.util import json
+from buildbot.www import fanout
 from buildbot.www import websocket
 from twisted.internet import protocol
 from twisted.python import log
@@ -39,17 +43,19 @@ class WsProtocol(protocol.Protocol):
             if path in self.qrefs:
                 return
 
-            def callback(key, message):
-                content = json.dumps(dict(path=path, key=key, message=message))
-                self.transport.write(content)
-            d = self.master.data.startConsuming(callback, options, path)
+            # clients with the same path and options share a consumer, and
+            # the websocket packets made for each message
+            key = (path, json.dumps(options, sort_keys=True))
+            d = self.factory.fanout.subscribe(key, self.transport.writePacket,
+                                              self.transport.writePackets,
+                                              self.transport)
 
             @d.addCallback
             def register(qref):
                 if path in self.qrefs:
                     qref.stopConsuming()
                 self.qrefs[path] = qref
-            d.addErrback("while starting consumption")
+            d.addErrback(log.err, "while starting consumption")
 
     def connectionLost(self, reason):
         log.msg("connection lost", system=self)
@@ -58,10 +64,37 @@ class WsProtocol(protocol.Protocol):
         self.qrefs = None  # to be sure we don't add any more
 
 
+def encodeMessage(key, message):
+    # the message without its opening brace, so that frameMessage can add
+    # the path
+    return json.dumps(dict(key=key, message=message), default=_toJson)[1:]
+
+
+def frameMessage(key, encoded):
+    path, _ = key
+    return '{"path":%s,%s' % (json.dumps(path), encoded)
+
+
+def _toJson(obj):
+    if isinstance(obj, datetime.datetime):
+        return datetime2epoch(obj)
+
+
 class WsProtocolFactory(protocol.Factory):
 
     def __init__(self, master):
         self.master = master
+        self.fanout = fanout.Fanout(self.startConsuming, encodeMessage,
+                                    frameMessage, self.coalesceInterval)
+
+    def coalesceInterval(self):
+        return self.master.config.www.get('event_coalesce_interval',
+                                          fanout.DEFAULT_COALESCE_INTERVAL)
+
+    def startConsuming(self, callback, key):
+        path, options = key
+        return self.master.data.startConsuming(callback, json.loads(options),
+                                               path)
 
     def buildProtocol(self, addr):
         p = WsProtocol(self.master)
@@ -13,6 +13,7 @@
 #
 # Copyright Buildbot Team Members
 
+import gzip
 import subprocess
 
 from distutils.command.build import build
@@ -92,6 +93,31 @@ def getVersion(init_file):
 
 js_built = False
 
+# the static files the web server sends gzipped, when the browser accepts it
+COMPRESSED_EXTENSIONS = ('.js', '.css', '.json', '.map', '.svg', '.eot', '.ttf')
+
+
+def compress_static(static_dir):
+    # write a gzipped copy alongside each compressible file, so that the web
+    # server does not need to compress them for each request
+    for dirpath, dirnames, filenames in os.walk(static_dir):
+        for fn in filenames:
+            if os.path.splitext(fn)[1] not in COMPRESSED_EXTENSIONS:
+                continue
+            path = os.path.join(dirpath, fn)
+            gzpath = path + ".gz"
+            if os.path.exists(gzpath) and os.path.getmtime(gzpath) >= os.path.getmtime(path):
+                continue
+            with open(path, "rb") as f:
+                content = f.read()
+            # a fixed mtime makes the builds reproducible
+            with open(gzpath, "wb") as f:
+                gz = gzip.GzipFile(fn, "wb", 9, f, mtime=0)
+                gz.write(content)
+                gz.close()
+            if os.path.getsize(gzpath) >= len(content):
+                os.remove(gzpath)
+
 
 def build_js(cmd):
     global js_built
@@ -111,6 +137,7 @@ def build_js(cmd):
             recursive-include %(package)s/static *
             """ % dict(package=package)))
 
+    compress_static(os.path.join(package, 'static'))
     cmd.copy_tree(os.path.join(package, 'static'), os.path.join("build", "lib", package, "static"))
 
     with open(os.path.join("build", "lib", package, "VERSION"), "w") as f: